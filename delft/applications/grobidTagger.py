@@ -137,7 +137,8 @@ def configure(model, architecture, output_path=None, max_sequence_length=-1, bat
 # train a GROBID model with all available data
 def train(model, embeddings_name=None, architecture=None, transformer=None, input_path=None, 
         output_path=None, features_indices=None, max_sequence_length=-1, batch_size=-1, max_epoch=-1, 
-        use_ELMo=False, incremental=False, input_model_path=None, patience=-1, learning_rate=None):
+        use_ELMo=False, incremental=False, input_model_path=None, patience=-1, learning_rate=None,
+        embeddings_snapshot=False):
 
     print('Loading data...')
     if input_path == None:
@@ -194,16 +195,17 @@ def train(model, embeddings_name=None, architecture=None, transformer=None, inpu
 
     # saving the model
     if output_path:
-        model.save(output_path)
+        model.save(output_path, embeddings_snapshot=embeddings_snapshot)
     else:
-        model.save()
+        model.save(embeddings_snapshot=embeddings_snapshot)
 
 
 # split data, train a GROBID model and evaluate it
 def train_eval(model, embeddings_name=None, architecture='BidLSTM_CRF', transformer=None,
                input_path=None, output_path=None, fold_count=1,
                features_indices=None, max_sequence_length=-1, batch_size=-1, max_epoch=-1, 
-               use_ELMo=False, incremental=False, input_model_path=None, patience=-1, learning_rate=None):
+               use_ELMo=False, incremental=False, input_model_path=None, patience=-1, learning_rate=None,
+               embeddings_snapshot=False):
     print('Loading data...')
     if input_path is None:
         x_all, y_all, f_all = load_data_and_labels_crf_file('data/sequenceLabelling/grobid/'+model+'/'+model+'-060518.train')
@@ -270,13 +272,14 @@ def train_eval(model, embeddings_name=None, architecture='BidLSTM_CRF', transfor
 
     # saving the model (must be called after eval for multiple fold training)
     if output_path:
-        model.save(output_path)
+        model.save(output_path, embeddings_snapshot=embeddings_snapshot)
     else:
-        model.save()
+        model.save(embeddings_snapshot=embeddings_snapshot)
 
 
-# split data, train a GROBID model and evaluate it
-def eval_(model, input_path=None, architecture='BidLSTM_CRF', use_ELMo=False):
+# evaluate a trained GROBID model, possibly with its static embeddings stored with different dtypes 
+# to assess the accuracy cost of the quantized storage
+def eval_(model, input_path=None, architecture='BidLSTM_CRF', use_ELMo=False, embedding_dtypes=None):
     print('Loading data...')
     if input_path is None:
         # it should never be the case
@@ -292,18 +295,32 @@ def eval_(model, input_path=None, architecture='BidLSTM_CRF', use_ELMo=False):
     if use_ELMo:
         model_name += '-with_ELMo'
 
-    start_time = time.time()
+    if embedding_dtypes is None or len(embedding_dtypes) == 0:
+        # storage dtype of the resource registry
+        embedding_dtypes = [None]
 
-    # load the model
-    model = Sequence(model_name)
-    model.load()
+    scores = []
+    for embedding_dtype in embedding_dtypes:
+        start_time = time.time()
 
-    # evaluation
-    print("\nEvaluation:")
-    model.eval(x_all, y_all, features=f_all)
+        # load the model
+        model = Sequence(model_name)
+        if embedding_dtype is not None:
+            print("\nEmbeddings storage dtype:", embedding_dtype)
+            model.registry["embedding-dtype"] = embedding_dtype
+        model.load()
 
-    runtime = round(time.time() - start_time, 3)
-    print("Evaluation runtime: %s seconds " % (runtime))
+        # evaluation
+        print("\nEvaluation:")
+        scores.append(model.eval(x_all, y_all, features=f_all))
+
+        runtime = round(time.time() - start_time, 3)
+        print("Evaluation runtime: %s seconds " % (runtime))
+
+    if len(embedding_dtypes) > 1 and None not in scores:
+        print("\n{:<25}{:>12}{:>10}".format("embeddings storage dtype", "f1 (micro)", "delta"))
+        for embedding_dtype, f1 in zip(embedding_dtypes, scores):
+            print("{:<25}{:>12.2f}{:>+10.2f}".format(embedding_dtype, f1 * 100, (f1 - scores[0]) * 100))
 
 
 # annotate a list of texts, this is relevant only of models taking only text as input 
@@ -332,6 +349,21 @@ def annotate_text(texts, model, output_format, architecture='BidLSTM_CRF', featu
 
     return annotations
 
+# annotate a text file with one text per line, the annotations are written in file_out (standard output if None), 
+# see Sequence.tag_file()
+def annotate_file(file_in, model, output_format, file_out=None, architecture='BidLSTM_CRF', use_ELMo=False, 
+                  batch_size=-1):
+    model_name = 'grobid-'+model
+    model_name += '-'+architecture
+    if use_ELMo:
+        model_name += '-with_ELMo'
+
+    model = Sequence(model_name)
+    model.load()
+
+    model.tag_file(file_in=file_in, output_format=output_format, file_out=file_out, 
+                   batch_size=batch_size if batch_size > 0 else None)
+
 class Tasks:
     TRAIN = 'train'
     TRAIN_EVAL = 'train_eval'
@@ -396,6 +428,18 @@ if __name__ == "__main__":
     parser.add_argument("--patience", type=int, default=-1, help="patience, number of extra epochs to perform after "
                                                                  "the best epoch before stopping a training.")
     parser.add_argument("--learning-rate", type=float, default=None, help="Initial learning rate")
+    parser.add_argument("--tag-file", default=None, help="For the tag action, path to a text file with one text per line " +
+                                        "to annotate, instead of the built-in example texts")
+    parser.add_argument("--file-out", default=None, help="For the tag action with --tag-file, path of the output file " +
+                                        "of the annotations (standard output by default)")
+    parser.add_argument("--output-format", default="json", choices=["json", "jsonl"], help="For the tag action with " +
+                                        "--tag-file, a single JSON document (json) or one JSON object per line (jsonl)")
+    parser.add_argument("--embeddings-snapshot", action="store_true", help="For the train and train_eval actions, " + 
+                                        "save with the model a snapshot of the static embeddings covering its training " +
+                                        "vocabulary, to load the model without the complete embeddings")
+    parser.add_argument("--embedding-dtype", default=None, help="For the eval action, comma-separated storage dtypes of the " +
+                                        "static embeddings to evaluate the model with, e.g. float32,float16,int8, to compare " + 
+                                        "the accuracy of quantized embeddings (default is the dtype of the resource registry)")
 
     
 
@@ -436,7 +480,8 @@ if __name__ == "__main__":
             incremental=incremental,
             input_model_path=input_model_path,
             patience=patience,
-            learning_rate=learning_rate)
+            learning_rate=learning_rate,
+            embeddings_snapshot=args.embeddings_snapshot)
 
     if action == Tasks.EVAL:
         if args.fold_count is not None and args.fold_count > 1:
@@ -444,7 +489,8 @@ if __name__ == "__main__":
                   "it in combination with " + str(Tasks.TRAIN_EVAL))
         if input_path is None:
             raise ValueError("A Grobid evaluation data file must be specified to evaluate a grobid model with the parameter --input")
-        eval_(model, input_path=input_path, architecture=architecture, use_ELMo=use_ELMo)
+        embedding_dtypes = args.embedding_dtype.split(",") if args.embedding_dtype is not None else None
+        eval_(model, input_path=input_path, architecture=architecture, use_ELMo=use_ELMo, embedding_dtypes=embedding_dtypes)
 
     if action == Tasks.TRAIN_EVAL:
         if args.fold_count < 1:
@@ -461,9 +507,16 @@ if __name__ == "__main__":
                 use_ELMo=use_ELMo, 
                 incremental=incremental,
                 input_model_path=input_model_path,
-                learning_rate=learning_rate)
+                learning_rate=learning_rate,
+                embeddings_snapshot=args.embeddings_snapshot)
+
+    if action == Tasks.TAG and args.tag_file is not None:
+        if architecture.find("FEATURE") != -1:
+            raise ValueError("The model " + architecture + " cannot be used without supplying features as input")
+        annotate_file(args.tag_file, model, args.output_format, file_out=args.file_out, architecture=architecture, 
+                      use_ELMo=use_ELMo, batch_size=batch_size)
 
-    if action == Tasks.TAG:
+    elif action == Tasks.TAG:
         someTexts = []
 
         if model == 'date':
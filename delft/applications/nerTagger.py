@@ -67,7 +67,8 @@ def configure(architecture, dataset_type, lang, embeddings_name, use_ELMo, max_s
 
 # train a model with all available for a given dataset 
 def train(dataset_type='conll2003', lang='en', embeddings_name=None, architecture='BidLSTM_CRF',
-          transformer=None, data_path=None, use_ELMo=False, max_sequence_length=-1, batch_size=-1, patience=-1, learning_rate=None):
+          transformer=None, data_path=None, use_ELMo=False, max_sequence_length=-1, batch_size=-1, patience=-1, learning_rate=None,
+          embeddings_snapshot=False):
 
     batch_size, max_sequence_length, patience, recurrent_dropout, early_stop, max_epoch, embeddings_name, word_lstm_units, multiprocessing = \
         configure(architecture, dataset_type, lang, embeddings_name, use_ELMo, max_sequence_length, batch_size, patience)
@@ -179,7 +180,7 @@ def train(dataset_type='conll2003', lang='en', embeddings_name=None, architectur
     print("training runtime: %s seconds " % (runtime))
 
     # saving the model
-    model.save()
+    model.save(embeddings_snapshot=embeddings_snapshot)
 
 
 # train and usual eval on dataset, e.g. eval with CoNLL 2003 eng.testb for CoNLL 2003 
@@ -195,7 +196,8 @@ def train_eval(embeddings_name=None,
                 patience=-1,
                 batch_size=-1,
                 max_sequence_length=-1,
-                learning_rate=None):
+                learning_rate=None,
+                embeddings_snapshot=False):
 
     batch_size, max_sequence_length, patience, recurrent_dropout, early_stop, max_epoch, embeddings_name, word_lstm_units, multiprocessing = \
         configure(architecture, dataset_type, lang, embeddings_name, use_ELMo,
@@ -463,7 +465,7 @@ def train_eval(embeddings_name=None,
     model.eval(x_eval, y_eval)
 
     # # saving the model (must be called after eval for multiple fold training)
-    model.save()
+    model.save(embeddings_snapshot=embeddings_snapshot)
 
 
 # usual eval on CoNLL 2003 eng.testb 
@@ -588,6 +590,8 @@ if __name__ == "__main__":
     parser.add_argument("--data-path", default=None, help="path to the corpus of documents for training (only use currently with Ontonotes corpus in orginal XML format)") 
     parser.add_argument("--file-in", default=None, help="path to a text file to annotate") 
     parser.add_argument("--file-out", default=None, help="path for outputting the resulting JSON NER annotations")
+    parser.add_argument("--output-format", default="json", choices=["json", "jsonl"], help="format of the annotations " + \
+        "of the tag action, a single JSON document (json) or one JSON object per line of the input file (jsonl)")
     parser.add_argument("--use-ELMo", action="store_true", help="Use ELMo contextual embeddings") 
     parser.add_argument(
         "--embedding", 
@@ -613,6 +617,9 @@ if __name__ == "__main__":
     parser.add_argument("--patience", type=int, default=-1, help="patience, number of extra epochs to perform after "
                                                                  "the best epoch before stopping a training.")
     parser.add_argument("--learning-rate", type=float, default=None, help="Initial learning rate")
+    parser.add_argument("--embeddings-snapshot", action="store_true", help="for the train and train_eval actions, " + 
+                        "save with the model a snapshot of the static embeddings covering its training vocabulary, " +
+                        "to load the model without the complete embeddings")
 
     args = parser.parse_args()
 
@@ -653,7 +660,8 @@ if __name__ == "__main__":
             max_sequence_length=max_sequence_length,
             batch_size=batch_size,
             patience=patience,
-            learning_rate=learning_rate
+            learning_rate=learning_rate,
+            embeddings_snapshot=args.embeddings_snapshot
         )
 
     if action == 'train_eval':
@@ -672,7 +680,8 @@ if __name__ == "__main__":
             max_sequence_length=max_sequence_length,
             batch_size=batch_size,
             patience=patience,
-            learning_rate=learning_rate
+            learning_rate=learning_rate,
+            embeddings_snapshot=args.embeddings_snapshot
             )
 
     if action == 'eval':
@@ -688,7 +697,7 @@ if __name__ == "__main__":
             print("Language not supported:", lang)
         else: 
             print(file_in)
-            result = annotate("json", 
+            result = annotate(args.output_format, 
                             dataset_type, 
                             lang, 
                             architecture=architecture, 
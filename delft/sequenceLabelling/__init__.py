@@ -1 +1,9 @@
-from delft.sequenceLabelling.wrapper import Sequence
\ No newline at end of file
+# Sequence is imported on first access, so that the light modules of the package (e.g. reader, evaluation)
+# can be imported without TensorFlow and transformers
+
+
+def __getattr__(name):
+    if name == "Sequence":
+        from delft.sequenceLabelling.wrapper import Sequence
+        return Sequence
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
@@ -91,7 +91,13 @@ class TrainingConfig(object):
                  early_stop=True,
                  patience=5,
                  max_checkpoints_to_keep=0,
-                 multiprocessing=True):
+                 multiprocessing=True,
+                 length_bucketing=False,
+                 max_tokens_per_batch=None,
+                 featurization_cache_dir=None,
+                 use_tf_data=False,
+                 tf_data_cache=None,
+                 shared_memory_batches=False):
 
         self.batch_size = batch_size # this is the batch size for training
         self.optimizer = optimizer
@@ -103,3 +109,17 @@ class TrainingConfig(object):
         self.patience = patience
         self.max_checkpoints_to_keep = max_checkpoints_to_keep
         self.multiprocessing = multiprocessing
+        # group training sequences of similar lengths in the same batches, optionally sized by a budget of
+        # padded tokens instead of batch_size
+        self.length_bucketing = length_bucketing
+        self.max_tokens_per_batch = max_tokens_per_batch
+        # directory of the featurized training and validation data, computed once instead of at each epoch,
+        # None to preprocess the data at each epoch
+        self.featurization_cache_dir = featurization_cache_dir
+        # produce the training batches with a tf.data pipeline instead of the Keras workers, optionally caching
+        # the batches of the first epoch, "memory" or a directory for a cache file
+        self.use_tf_data = use_tf_data
+        self.tf_data_cache = tf_data_cache
+        # optional, with multiprocessing, the worker processes give the batches to the trainer through shared 
+        # memory instead of pickling them, otherwise the Keras worker processes are used
+        self.shared_memory_batches = shared_memory_batches
@@ -1,11 +1,19 @@
+import os
+
 import numpy as np
 from delft.utilities.Utilities import truncate_batch_values, len_until_first_pad
-from delft.utilities.numpy import shuffle_triple_with_view
 
 import tensorflow.keras as keras
-from delft.sequenceLabelling.preprocess import to_vector_single, to_casing_single, to_vector_simple_with_elmo, \
-    Preprocessor, BERTPreprocessor
-from delft.utilities.Tokenizer import tokenizeAndFilterSimple
+from delft.sequenceLabelling.preprocess import to_vector_batch, to_casing_single, to_vector_simple_with_elmo, \
+    Preprocessor, BERTPreprocessor, dense_to_one_hot
+from delft.sequenceLabelling.featurization import featurize_corpus
+from delft.utilities.Tokenizer import tokenizeBatchSimple
+
+# sub-directory of the featurization cache directory storing the sub-tokenization of the texts for transformers
+SUBTOKEN_CACHE_DIR = "subtokens"
+
+# with length bucketing, number of batches of samples sorted together by length
+DEFAULT_BUCKET_BATCHES = 50
 
 
 class BaseGenerator(keras.utils.Sequence):
@@ -28,7 +36,9 @@ class BaseGenerator(keras.utils.Sequence):
                 shuffle: bool =True,
                 features=None,
                 output_input_offsets: bool=False,
-                use_chain_crf: bool =False):
+                use_chain_crf: bool =False,
+                length_bucketing: bool =False,
+                max_tokens_per_batch: int =None):
         # self.x and self.y are shuffled view of self.original_x and self.original_y
         self.original_x = self.x = x
         self.original_y = self.y = y
@@ -47,17 +57,30 @@ class BaseGenerator(keras.utils.Sequence):
         self.output_input_offsets = output_input_offsets
         self.use_chain_crf = use_chain_crf
 
+        # with length bucketing, samples of similar lengths are grouped in the same batches to limit the
+        # padding, batches having either batch_size samples or at most max_tokens_per_batch padded tokens
+        self.length_bucketing = length_bucketing or max_tokens_per_batch is not None
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.lengths = None
+        # indices in the original data of the samples of self.x, self.y and self.features, when reordered
+        self.order = None
+        # (start, end) of each batch in self.x, self.y and self.features
+        self.batch_bounds = []
+        # with a token budget, (start, end) of each batch in the samples sorted by length, cut once
+        self.token_budget_batch_bounds = None
+        if self.original_x is not None:
+            if self.length_bucketing:
+                self.lengths = self._sequence_lengths()
+                self._bucket()
+            else:
+                self.batch_bounds = self._fixed_size_batch_bounds(len(self.original_x))
+
     def __len__(self):
         '''
         Give the number of batches per epoch
         '''
         # The number of batches is set so that each training sample is seen at most once per epoch
-        if self.original_x is None:
-            return 0
-        elif (len(self.original_x) % self.batch_size) == 0:
-            return int(np.floor(len(self.original_x) / self.batch_size))
-        else:
-            return int(np.floor(len(self.original_x) / self.batch_size) + 1)
+        return len(self.batch_bounds)
 
     @property
     def __getitem__(self, index):
@@ -74,9 +97,96 @@ class BaseGenerator(keras.utils.Sequence):
         if self.original_y is None:
             return
 
+        if self.length_bucketing:
+            if self.shuffle:
+                self._bucket()
         # shuffle dataset at each epoch
+        elif self.shuffle:
+            self.order = np.random.permutation(len(self.original_x))
+            self.x = _take(self.original_x, self.order)
+            self.y = _take(self.original_y, self.order)
+            self.features = _take(self.original_features, self.order)
+
+    def _batch_samples(self, index):
+        '''
+        Return the indices in the original data of the samples of a batch
+        '''
+        start, end = self.batch_bounds[index]
+        if self.order is None:
+            return np.arange(start, end)
+        return self.order[start:end]
+
+    def _fixed_size_batch_bounds(self, nb_samples):
+        return [(start, min(start + self.batch_size, nb_samples)) for start in range(0, nb_samples, self.batch_size)]
+
+    def _sequence_lengths(self):
+        if self.tokenize:
+            lengths = np.asarray([len(tokens) for tokens in tokenizeBatchSimple(self.original_x)], dtype=np.int64)
+        else:
+            lengths = np.asarray([len(tokens) for tokens in self.original_x], dtype=np.int64)
+        if self.max_sequence_length:
+            lengths = np.minimum(lengths, self.max_sequence_length)
+        return lengths
+
+    def _bucket(self):
+        '''
+        Order the samples by length and group them in batches of similar lengths. When shuffling, the samples
+        are shuffled, then sorted by length within buckets of DEFAULT_BUCKET_BATCHES batches, so that the batches
+        differ from one epoch to the next, and the order of the batches is shuffled. Otherwise, the samples are
+        simply sorted by length.
+
+        With a token budget, the batches are cut once from the samples sorted by length, so that the number of
+        batches is the same at each epoch (Keras fixes the steps of an epoch from the first len()). When
+        shuffling, only the samples of the same length and the order of the batches are shuffled.
+        '''
+        nb_samples = len(self.lengths)
+        if self.max_tokens_per_batch is not None:
+            if self.shuffle:
+                # sort by length, ties in random order
+                order = np.lexsort((np.random.random(nb_samples), self.lengths))
+            else:
+                order = np.argsort(self.lengths, kind='stable')
+            if self.token_budget_batch_bounds is None:
+                self.token_budget_batch_bounds = self._token_budget_batch_bounds(self.lengths[order])
+            batch_bounds = self.token_budget_batch_bounds
+        else:
+            if self.shuffle:
+                order = np.random.permutation(nb_samples)
+                bucket_size = self.batch_size * DEFAULT_BUCKET_BATCHES
+            else:
+                order = np.arange(nb_samples)
+                bucket_size = max(nb_samples, 1)
+            for start in range(0, nb_samples, bucket_size):
+                bucket = order[start:start + bucket_size]
+                order[start:start + bucket_size] = bucket[np.argsort(self.lengths[bucket], kind='stable')]
+            batch_bounds = self._fixed_size_batch_bounds(nb_samples)
         if self.shuffle:
-            self.x, self.y, self.features = shuffle_triple_with_view(self.original_x, self.original_y, self.original_features)
+            batch_bounds = [batch_bounds[i] for i in np.random.permutation(len(batch_bounds))]
+
+        self.x = _take(self.original_x, order)
+        self.y = _take(self.original_y, order)
+        self.features = _take(self.original_features, order)
+        self.order = order
+        self.batch_bounds = batch_bounds
+
+    def _token_budget_batch_bounds(self, lengths):
+        '''
+        Cut the ordered samples in batches whose number of padded tokens (number of samples x maximum length)
+        does not exceed max_tokens_per_batch, a sample longer than the budget being alone in its batch
+        '''
+        batch_bounds = []
+        start = 0
+        max_length = 0
+        for i, length in enumerate(lengths):
+            length = max(int(length), 1)
+            if i > start and max(max_length, length) * (i - start + 1) > self.max_tokens_per_batch:
+                batch_bounds.append((start, i))
+                start = i
+                max_length = 0
+            max_length = max(max_length, length)
+        if start < len(lengths):
+            batch_bounds.append((start, len(lengths)))
+        return batch_bounds
 
     @property
     def __data_generation(self, index):
@@ -102,7 +212,10 @@ class DataGenerator(BaseGenerator):
                 shuffle=True,
                 features=None,
                 output_input_offsets=False,
-                use_chain_crf=False):
+                use_chain_crf=False,
+                length_bucketing=False,
+                max_tokens_per_batch=None,
+                featurization_cache_dir=None):
 
         super().__init__(x, y, 
                         batch_size=batch_size, 
@@ -115,14 +228,29 @@ class DataGenerator(BaseGenerator):
                         shuffle=shuffle, 
                         features=features,
                         output_input_offsets=output_input_offsets,
-                        use_chain_crf=use_chain_crf)
+                        use_chain_crf=use_chain_crf,
+                        length_bucketing=length_bucketing,
+                        max_tokens_per_batch=max_tokens_per_batch)
+
+        # with a featurization cache directory, the epoch-invariant input of the batches is computed once
+        # for the whole data (or loaded from the cache), batches are then only gathered and padded
+        self.featurized = None
+        if featurization_cache_dir is not None and self.original_x is not None:
+            self.featurized = featurize_corpus(self.original_x, self.original_y, self.original_features,
+                                               self.preprocessor,
+                                               max_sequence_length=self.max_sequence_length,
+                                               tokenize=self.tokenize,
+                                               cache_dir=featurization_cache_dir)
         self.on_epoch_end()
 
     def __getitem__(self, index):
         '''
         Generate one batch of data, batch_l always last input, so that it can be used easily by the training scorer
         '''
-        batch_x, batch_c, batch_f, batch_a, batch_l, batch_y = self.__data_generation(index)
+        if self.featurized is not None:
+            batch_x, batch_c, batch_f, batch_a, batch_l, batch_y = self.__featurized_data_generation(index)
+        else:
+            batch_x, batch_c, batch_f, batch_a, batch_l, batch_y = self.__data_generation(index)
         if self.preprocessor.return_casing:
             return [batch_x, batch_c, batch_a, batch_l], batch_y
         elif self.preprocessor.return_features:
@@ -134,17 +262,15 @@ class DataGenerator(BaseGenerator):
         '''
         Generates data containing batch_size samples
         '''
-        max_iter = min(self.batch_size, len(self.original_x)-self.batch_size * index)
+        start, end = self.batch_bounds[index]
+        max_iter = end - start
 
         # restrict data to index window
-        sub_x = self.x[(index * self.batch_size):(index * self.batch_size) + max_iter]
+        sub_x = self.x[start:end]
 
         # tokenize texts in self.x if not already done
         if self.tokenize:
-            x_tokenized = [
-                tokenizeAndFilterSimple(text)
-                for text in sub_x
-            ]
+            x_tokenized = tokenizeBatchSimple(sub_x)
         else:
             x_tokenized = sub_x
 
@@ -165,15 +291,13 @@ class DataGenerator(BaseGenerator):
         if self.embeddings and self.embeddings.use_ELMo:
             batch_x = to_vector_simple_with_elmo(x_tokenized, self.embeddings, max_length_x, extend=extend)
         else:
-            batch_x = np.zeros((max_iter, max_length_x, self.embeddings.embed_size), dtype='float32')
-            for i in range(0, max_iter):
-                batch_x[i] = to_vector_single(x_tokenized[i], self.embeddings, max_length_x)
+            batch_x = to_vector_batch(x_tokenized, self.embeddings, max_length_x)
 
         # store tag embeddings
         batch_y = None
         if self.y is not None:
             # note: tags are always already "tokenized" by input token
-            batch_y = self.y[(index*self.batch_size):(index*self.batch_size)+max_iter]
+            batch_y = self.y[start:end]
             max_length_y = max((len(y_row) for y_row in batch_y))
 
             if self.max_sequence_length and max_length_y > self.max_sequence_length:
@@ -182,7 +306,7 @@ class DataGenerator(BaseGenerator):
 
         batch_f = np.zeros((batch_x.shape[0:2]), dtype=np.int32)
         if self.preprocessor.return_features:
-            sub_f = self.features[(index * self.batch_size):(index * self.batch_size) + max_iter]
+            sub_f = self.features[start:end]
             if self.max_sequence_length and max_length_f > self.max_sequence_length:
                 max_length_f = self.max_sequence_length
                 # truncation of sequence at max_sequence_length
@@ -208,6 +332,50 @@ class DataGenerator(BaseGenerator):
 
         return batch_x, batch_c, batch_f, batch_a, batch_l, batch_y
 
+    def __featurized_data_generation(self, index):
+        '''
+        Generates data containing batch_size samples from the featurized data, same as __data_generation()
+        '''
+        lengths, token_rows = self.featurized.gather(self._batch_samples(index))
+        x_tokenized = self.featurized.tokens(lengths, token_rows)
+
+        max_length_x = int(lengths.max())
+
+        # prevent sequence of length 1 alone in a batch (this causes an error in the Chain CRF layer)
+        extend = False
+        if max_length_x == 1:
+            max_length_x += 1
+            extend = True
+
+        # generate data
+        if self.embeddings and self.embeddings.use_ELMo:
+            batch_x = to_vector_simple_with_elmo(x_tokenized, self.embeddings, max_length_x, extend=extend)
+        else:
+            batch_x = to_vector_batch(x_tokenized, self.embeddings, max_length_x)
+
+        if self.preprocessor.return_features:
+            batch_f = self.featurized.features_batch(lengths, token_rows, max_length_x)
+        else:
+            batch_f = np.zeros((batch_x.shape[0:2]), dtype=np.int32)
+
+        if self.preprocessor.return_casing:
+            batch_a = self.featurized.casing_batch(lengths, token_rows, max_length_x)
+        else:
+            batch_a = np.zeros((len(lengths), max_length_x), dtype=np.int32)
+
+        batch_y = None
+        if self.y is not None:
+            batch_y = self.featurized.labels_batch(lengths, token_rows, max_length_x)
+            if self.use_chain_crf:
+                batch_y = dense_to_one_hot(batch_y, len(self.preprocessor.vocab_tag), nlevels=2)
+
+        # with extend, each token is followed by an empty token in the char input
+        batch_c = self.featurized.char_ids_batch(lengths, token_rows, max_length_x, self.preprocessor.max_char_length,
+                                                 step=2 if extend else 1)
+        batch_l = lengths.astype(np.int32).reshape((len(lengths), 1))
+
+        return batch_x, batch_c, batch_f, batch_a, batch_l, batch_y
+
 
 class DataGeneratorTransformers(BaseGenerator):
     """
@@ -227,8 +395,10 @@ class DataGeneratorTransformers(BaseGenerator):
                 shuffle=True,
                 features=None,
                 output_input_offsets=False,
-                use_chain_crf=False):
-
+                use_chain_crf=False,
+                length_bucketing=False,
+                max_tokens_per_batch=None,
+                featurization_cache_dir=None):
         super().__init__(x, y, 
                         batch_size=batch_size, 
                         preprocessor=preprocessor, 
@@ -240,13 +410,28 @@ class DataGeneratorTransformers(BaseGenerator):
                         shuffle=shuffle, 
                         features=features,
                         output_input_offsets=output_input_offsets,
-                        use_chain_crf=use_chain_crf)
+                        use_chain_crf=use_chain_crf,
+                        length_bucketing=length_bucketing,
+                        max_tokens_per_batch=max_tokens_per_batch)
 
         if self.bert_preprocessor.empty_features_vector is None:
             self.bert_preprocessor.empty_features_vector = self.preprocessor.empty_features_vector()
 
+        # the featurization of the corpus is not applied to transformer inputs, but the sub-tokenization of the
+        # texts is cached (see BERTPreprocessor.get_subtoken_cache()) and stored in the featurization cache
+        # directory at the end of each epoch
+        self.subtoken_cache = None
+        if featurization_cache_dir is not None:
+            self.subtoken_cache = self.bert_preprocessor.get_subtoken_cache()
+            self.subtoken_cache.persist(os.path.join(featurization_cache_dir, SUBTOKEN_CACHE_DIR))
+
         self.on_epoch_end()
 
+    def on_epoch_end(self):
+        super().on_epoch_end()
+        if self.subtoken_cache is not None:
+            self.subtoken_cache.save()
+
     def __getitem__(self, index):
         '''
         Generate one batch of data. These data are the input of the models but can also be used by the training scorer
@@ -280,17 +465,15 @@ class DataGeneratorTransformers(BaseGenerator):
         '''
         Generates data containing batch_size samples
         '''
-        max_iter = min(self.batch_size, len(self.original_x)-self.batch_size * index)
+        start, end = self.batch_bounds[index]
+        max_iter = end - start
 
         # restrict data to index window
-        sub_x = self.x[(index * self.batch_size):(index * self.batch_size) + max_iter]
+        sub_x = self.x[start:end]
 
         # tokenize texts in self.x if not already done
         if self.tokenize:
-            x_tokenized = [
-                tokenizeAndFilterSimple(text)
-                for text in sub_x
-            ]
+            x_tokenized = tokenizeBatchSimple(sub_x)
         else:
             x_tokenized = sub_x
 
@@ -307,7 +490,7 @@ class DataGeneratorTransformers(BaseGenerator):
         # tag embeddings
         if self.y is not None:
             # note: tags are always already "tokenized" by input token
-            batch_y = self.y[(index*self.batch_size):(index*self.batch_size)+max_iter]
+            batch_y = self.y[start:end]
             max_length_y = max((len(y_row) for y_row in batch_y))
 
             if self.max_sequence_length and max_length_y > self.max_sequence_length:
@@ -316,7 +499,7 @@ class DataGeneratorTransformers(BaseGenerator):
 
         # features
         if self.preprocessor.return_features:
-            sub_f = self.features[(index * self.batch_size):(index * self.batch_size) + max_iter]
+            sub_f = self.features[start:end]
             if self.max_sequence_length and max_length_f > self.max_sequence_length:
                 max_length_f = self.max_sequence_length
                 # truncation of sequence at max_sequence_length
@@ -358,3 +541,11 @@ class DataGeneratorTransformers(BaseGenerator):
 
         return batch_x, batch_x_types, batch_x_masks, batch_c, batch_f, batch_l, batch_input_offsets, batch_y
 
+
+
+def _take(values, indices):
+    if values is None:
+        return None
+    if isinstance(values, np.ndarray):
+        return values[indices]
+    return [values[i] for i in indices]
@@ -0,0 +1,153 @@
+"""
+Epoch-invariant featurization of sequence labelling corpora
+
+The tokens of a corpus are stored as ids in the vocabulary of the corpus, the char ids and the casing are
+stored once per distinct token, the feature indexes and the label ids once per token. Batches are then
+made by gathering and padding these arrays, giving the same input as the preprocessing of the raw batch
+by the DataGenerator.
+"""
+import numpy as np
+
+from delft.sequenceLabelling.preprocess import PAD, _casing
+from delft.utilities.Tokenizer import tokenizeBatchSimple
+from delft.utilities.featurization_cache import content_hash, compact_int_dtype, range_indices, \
+    encode_token_sequences, decode_vocabulary, load_featurization, save_featurization
+
+
+class FeaturizedCorpus(object):
+
+    def __init__(self, arrays):
+        self.offsets = arrays["offsets"]
+        self.token_ids = arrays["token_ids"]
+        self.vocabulary = decode_vocabulary(arrays)
+        # char ids of each token of the vocabulary, truncated at max_char_length
+        self.char_offsets = arrays["char_offsets"]
+        self.char_ids = arrays["char_ids"]
+        # casing index of each token of the vocabulary
+        self.casing = arrays.get("casing")
+        # (nb_tokens, nb_features) feature indexes and label ids of each token of the corpus
+        self.features = arrays.get("features")
+        self.labels = arrays.get("labels")
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def gather(self, samples):
+        """
+        Return the lengths of the given samples and the indices of their tokens in the corpus
+        """
+        samples = np.asarray(samples, dtype=np.int64)
+        starts = self.offsets[samples]
+        lengths = self.offsets[samples + 1] - starts
+        return lengths, range_indices(starts, lengths)
+
+    def tokens(self, lengths, token_rows):
+        words = [self.vocabulary[token_id] for token_id in self.token_ids[token_rows].tolist()]
+        tokens = []
+        start = 0
+        for length in lengths.tolist():
+            tokens.append(words[start:start + length])
+            start += length
+        return tokens
+
+    def char_ids_batch(self, lengths, token_rows, width, max_char_length, step=1):
+        """
+        (batch, width, max_char_length) int32 char ids of the tokens, the token j of a sample being at
+        position j * step
+        """
+        words = self.token_ids[token_rows].astype(np.int64)
+        char_starts = self.char_offsets[words]
+        char_counts = self.char_offsets[words + 1] - char_starts
+        token_positions = _token_positions(lengths, width, step)
+        positions = np.repeat(token_positions * max_char_length, char_counts) + \
+            range_indices(np.zeros_like(char_counts), char_counts)
+        batch = np.zeros((len(lengths) * width * max_char_length,), dtype=np.int32)
+        batch[positions] = self.char_ids[range_indices(char_starts, char_counts)]
+        return batch.reshape((len(lengths), width, max_char_length))
+
+    def casing_batch(self, lengths, token_rows, width):
+        return pad_token_values(self.casing[self.token_ids[token_rows]], lengths, width)
+
+    def features_batch(self, lengths, token_rows, width):
+        return pad_token_values(self.features[token_rows], lengths, width)
+
+    def labels_batch(self, lengths, token_rows, width):
+        return pad_token_values(self.labels[token_rows], lengths, width)
+
+
+def _token_positions(lengths, width, step=1):
+    return np.repeat(np.arange(len(lengths), dtype=np.int64) * width, lengths) + \
+        range_indices(np.zeros_like(lengths), lengths) * step
+
+
+def pad_token_values(values, lengths, width):
+    """
+    Pad the values of the tokens of a batch, given in order, to a (batch, width, ...) int32 array
+    """
+    padded = np.zeros((len(lengths) * width,) + values.shape[1:], dtype=np.int32)
+    padded[_token_positions(lengths, width)] = values
+    return padded.reshape((len(lengths), width) + values.shape[1:])
+
+
+def featurize_corpus(x, y, features, preprocessor, max_sequence_length=None, tokenize=False, cache_dir=None):
+    """
+    Featurize a corpus of token sequences (or of texts if tokenize is True), with optional labels and
+    features, sequences being truncated at max_sequence_length. The result is loaded from the cache
+    directory if the same corpus was already featurized with the same preprocessor, otherwise it is
+    stored there.
+    """
+    feature_preprocessor = preprocessor.feature_preprocessor if preprocessor.return_features else None
+    key = content_hash(
+        "sequence-labelling", x, y, features if feature_preprocessor is not None else None,
+        preprocessor.vocab_char, preprocessor.vocab_tag, preprocessor.max_char_length,
+        preprocessor.return_casing,
+        None if feature_preprocessor is None else feature_preprocessor.features_indices,
+        None if feature_preprocessor is None else feature_preprocessor.features_map_to_index,
+        max_sequence_length, tokenize)
+
+    arrays = load_featurization(cache_dir, key)
+    if arrays is None:
+        arrays = _featurize(x, y, features, preprocessor, feature_preprocessor, max_sequence_length, tokenize)
+        save_featurization(cache_dir, key, arrays)
+    return FeaturizedCorpus(arrays)
+
+
+def _featurize(x, y, features, preprocessor, feature_preprocessor, max_sequence_length, tokenize):
+    def truncate(sequence):
+        return sequence[:max_sequence_length] if max_sequence_length else sequence
+
+    sequences = [truncate(tokens) for tokens in (tokenizeBatchSimple(x) if tokenize else x)]
+    arrays, vocabulary = encode_token_sequences(sequences)
+    lengths = np.diff(arrays["offsets"])
+
+    char_ids = [preprocessor.get_char_ids(word[:preprocessor.max_char_length]) for word in vocabulary]
+    char_offsets = np.zeros((len(vocabulary) + 1,), dtype=np.int64)
+    np.cumsum([len(word_char_ids) for word_char_ids in char_ids], out=char_offsets[1:])
+    arrays["char_offsets"] = char_offsets
+    arrays["char_ids"] = np.fromiter((char_id for word_char_ids in char_ids for char_id in word_char_ids),
+        dtype=compact_int_dtype(len(preprocessor.vocab_char)), count=int(char_offsets[-1]))
+
+    if preprocessor.return_casing:
+        arrays["casing"] = np.asarray([_casing(word) for word in vocabulary], dtype=np.uint8)
+
+    if y is not None:
+        pad_index = preprocessor.vocab_tag[PAD]
+        labels = [preprocessor.vocab_tag.get(tag, pad_index) for tags in y for tag in truncate(tags)]
+        _check_lengths("labels", [len(truncate(tags)) for tags in y], lengths)
+        arrays["labels"] = np.asarray(labels, dtype=compact_int_dtype(len(preprocessor.vocab_tag)))
+
+    if feature_preprocessor is not None:
+        features = [truncate(document) for document in features]
+        _check_lengths("features", [len(document) for document in features], lengths)
+        rows = feature_preprocessor.transform_tokens([value_list for document in features for value_list in document])
+        arrays["features"] = rows.astype(compact_int_dtype(max(int(rows.max(initial=0)), 0)))
+
+    return arrays
+
+
+def _check_lengths(name, lengths, token_lengths):
+    if not np.array_equal(np.asarray(lengths, dtype=np.int64), token_lengths):
+        raise ValueError("The " + name + " of the corpus must have one element per token to be featurized")
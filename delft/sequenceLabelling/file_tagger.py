@@ -0,0 +1,205 @@
+"""
+Pipelined tagging of large text files
+
+A text file with one text per line is tagged by four stages connected by bounded queues, so that reading the
+file, featurizing the batches (tokenization, embeddings lookup), predicting and writing the annotations overlap:
+
+    reader (thread) -> chunks of lines -> featurizer (thread) -> batches of model inputs -> model (calling
+    thread) -> predicted batches -> writer (thread)
+
+The lines are tagged by chunks of chunk_size lines, the texts of a chunk being sorted by length into batches by
+the data generator. The annotations of a chunk are written in the order of the lines once all its batches are
+predicted. The bounded queues limit the memory used whatever the size of the file.
+
+The output formats are:
+- json: a single JSON document, identical to Tagger.tag(texts, 'json') with the runtime, written as the texts
+  are tagged
+- jsonl: JSON Lines, one compact JSON object {"text": ..., "entities": [...]} per line of the input file
+"""
+import datetime
+import json
+import queue
+import sys
+import threading
+import time
+from itertools import islice
+
+OUTPUT_FORMATS = ('json', 'jsonl')
+
+# maximum number of items waiting between two stages
+DEFAULT_QUEUE_SIZE = 4
+
+# seconds between two checks of the failure of another stage while waiting on a queue
+_POLL_INTERVAL = 0.5
+
+# indentation of the texts in the json output format
+_TEXT_INDENT = '\n' + ' ' * 8
+
+_END = object()
+
+
+def tag_file(tagger, file_in, output_format, file_out=None, chunk_size=None, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Tag a text file containing one text per line with a Tagger, the annotations are written in file_out if not
+    None, in the standard output otherwise, in one of the OUTPUT_FORMATS. chunk_size is the number of lines
+    tagged together, by default 8 batches.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError("Unsupported output format for tagging a file: " + str(output_format) +
+                         ", must be one of " + str(OUTPUT_FORMATS))
+    if chunk_size is None:
+        chunk_size = 8 * tagger.model_config.batch_size
+
+    start_time = time.time()
+    pipeline = _Pipeline(queue_size)
+    chunks = pipeline.queue()
+    batches = pipeline.queue()
+    predictions = pipeline.queue()
+
+    with open(file_in, 'r', encoding='utf-8') as f_in:
+        out = open(file_out, 'w', encoding='utf-8') if file_out is not None else sys.stdout
+        try:
+            writer = _Writer(tagger, output_format, out)
+            pipeline.start(_read_stage, pipeline, f_in, chunk_size, chunks)
+            pipeline.start(_featurize_stage, pipeline, tagger, chunks, batches)
+            pipeline.start(writer.run, pipeline, predictions)
+            try:
+                _predict_stage(pipeline, tagger, batches, predictions)
+            except BaseException:
+                pipeline.fail(sys.exc_info())
+            pipeline.join()
+            writer.close(round(time.time() - start_time, 3))
+        finally:
+            if file_out is not None:
+                out.close()
+            else:
+                out.flush()
+
+
+class _Pipeline(object):
+    """
+    Threads of the stages of a pipeline, stopped all together when one of them fails, the first error being
+    raised again by join()
+    """
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.threads = []
+        self.stopped = threading.Event()
+        self.error = None
+
+    def queue(self):
+        return queue.Queue(maxsize=self.queue_size)
+
+    def start(self, target, *args):
+        def run():
+            try:
+                target(*args)
+            except BaseException:
+                self.fail(sys.exc_info())
+        thread = threading.Thread(target=run, daemon=True)
+        self.threads.append(thread)
+        thread.start()
+
+    def fail(self, exc_info):
+        if self.error is None:
+            self.error = exc_info
+        self.stopped.set()
+
+    def put(self, items, item):
+        while not self.stopped.is_set():
+            try:
+                items.put(item, timeout=_POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def get(self, items):
+        while not self.stopped.is_set():
+            try:
+                return items.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                pass
+        return _END
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error[1].with_traceback(self.error[2])
+
+
+def _read_stage(pipeline, f_in, chunk_size, chunks):
+    while not pipeline.stopped.is_set():
+        lines = [line.strip() for line in islice(f_in, chunk_size)]
+        if len(lines) == 0:
+            break
+        pipeline.put(chunks, lines)
+    pipeline.put(chunks, _END)
+
+
+def _featurize_stage(pipeline, tagger, chunks, batches):
+    while True:
+        lines = pipeline.get(chunks)
+        if lines is _END:
+            break
+        run = tagger.prepare(lines)
+        for step, model_inputs, input_offsets in tagger.featurize(run):
+            pipeline.put(batches, (run, step, model_inputs, input_offsets))
+    pipeline.put(batches, _END)
+
+
+def _predict_stage(pipeline, tagger, batches, predictions):
+    while True:
+        batch = pipeline.get(batches)
+        if batch is _END:
+            break
+        run, step, model_inputs, input_offsets = batch
+        pipeline.put(predictions, (run, step, tagger.predict(model_inputs), input_offsets))
+    pipeline.put(predictions, _END)
+
+
+class _Writer(object):
+    """
+    Decode the predicted batches and write the annotations of each completely predicted chunk of lines
+    """
+
+    def __init__(self, tagger, output_format, out):
+        self.tagger = tagger
+        self.output_format = output_format
+        self.out = out
+        self.nb_written = 0
+        if output_format == 'json':
+            header = {
+                "software": "DeLFT",
+                "date": datetime.datetime.now().isoformat(),
+                "model": tagger.model_config.model_name
+            }
+            self.out.write(json.dumps(header, sort_keys=False, indent=4, ensure_ascii=False)[:-2] + ',\n')
+            self.out.write('    "texts": [')
+
+    def run(self, pipeline, predictions):
+        while True:
+            prediction = pipeline.get(predictions)
+            if prediction is _END:
+                break
+            run, step, y_pred_batch, input_offsets = prediction
+            self.tagger.decode(run, step, y_pred_batch, input_offsets, 'json')
+            if run.is_complete():
+                self.write(run.results())
+
+    def write(self, records):
+        if self.output_format == 'jsonl':
+            lines = [json.dumps(record, ensure_ascii=False, separators=(',', ':')) for record in records]
+            self.out.write(''.join(line + '\n' for line in lines))
+        else:
+            for record in records:
+                self.out.write(',' + _TEXT_INDENT if self.nb_written > 0 else _TEXT_INDENT)
+                self.out.write(json.dumps(record, sort_keys=False, indent=4, ensure_ascii=False)
+                               .replace('\n', _TEXT_INDENT))
+                self.nb_written += 1
+        self.out.flush()
+
+    def close(self, runtime):
+        if self.output_format == 'json':
+            self.out.write(('\n    ]' if self.nb_written > 0 else ']') + ',\n    "runtime": ' + str(runtime) + '\n}\n')
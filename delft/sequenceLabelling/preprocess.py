@@ -1,5 +1,7 @@
 import itertools
 import json
+import operator
+from collections import Counter
 import logging
 import re
 from typing import List, Iterable, Set
@@ -7,6 +9,7 @@ from typing import List, Iterable, Set
 import numpy as np
 
 from delft.sequenceLabelling.config import ModelConfig
+from delft.utilities.subtoken_cache import get_subtoken_cache
 
 LOGGER = logging.getLogger(__name__)
 
@@ -15,14 +18,72 @@ from sklearn.base import BaseEstimator, TransformerMixin
 UNK = '<UNK>'
 PAD = '<PAD>'
 
+# maximum number of distinct tokens whose char ids are memoized by a Preprocessor
+MAX_CHAR_IDS_CACHE_SIZE = 100000
+
 case_index = {'<PAD>': 0, 'numeric': 1, 'allLower': 2, 'allUpper': 3, 'initialUpper': 4, 'other': 5,
               'mainly_numeric': 6, 'contains_digit': 7}
 
+class FeatureCardinality(object):
+    """
+    Distinct values of each feature column of a corpus, collected in a single pass over a stream of documents
+    (lists of tokens, each token given by its list of feature values). The columns are the ones of the first
+    token, restricted to indices if given. The cardinalities of shards of a corpus, possibly collected in
+    parallel, are combined with merge().
+    """
+
+    def __init__(self, indices=None):
+        self.indices = indices
+        self.nb_columns = None
+        # set of the values of each column, None for the columns not selected
+        self.column_values = []
+
+    def update(self, documents):
+        for document in documents:
+            if len(document) == 0:
+                continue
+            if self.nb_columns is None:
+                self._init_columns(len(document[0]))
+            # the document is transposed and each column added at once to the values of its column
+            for values, document_values in zip(self.column_values, zip(*document)):
+                if values is not None:
+                    values.update(document_values)
+        return self
+
+    def merge(self, other):
+        if other.nb_columns is None:
+            return self
+        if self.nb_columns is None:
+            self._init_columns(other.nb_columns)
+        for values, other_values in zip(self.column_values, other.column_values):
+            if values is not None and other_values is not None:
+                values.update(other_values)
+        return self
+
+    def columns_length(self):
+        """
+        Return the cardinality in the format of calculate_cardinality()
+        """
+        columns_length = []
+        for index_column, values in enumerate(self.column_values):
+            if values is None:
+                continue
+            values = sorted(value for value in values if value != " ")
+            # We reserve the 0 for the unseen features so the indexes will go from 1 to cardinality + 1
+            columns_length.append((index_column, {value: val_num + 1 for val_num, value in enumerate(values)}))
+        return columns_length
+
+    def _init_columns(self, nb_columns):
+        self.nb_columns = nb_columns
+        self.column_values = [set() if not self.indices or index_column in self.indices else None
+                              for index_column in range(nb_columns)]
+
+
 def calculate_cardinality(feature_vector, indices=None):
     """
     Calculate cardinality of each features
 
-    :param feature_vector: three dimensional vector with features
+    :param feature_vector: three dimensional vector with features, or an iterable of documents
     :param indices: list of indices of the features to be extracted
     :return: a map where each key is the index of the feature and the value is a map feature_value,
     value_index.
@@ -34,36 +95,7 @@ def calculate_cardinality(feature_vector, indices=None):
 
      NOTE: the features are indexed from 1 to n + 1. The 0 value is reserved as padding
     """
-    columns_length = []
-    index = 0
-    if not len(feature_vector) > 0:
-        return []
-
-    for index_column in range(index, len(feature_vector[0][0])):
-        if indices and index_column not in indices:
-            index += 1
-            continue
-
-        values = set()
-        for index_document in range(0, len(feature_vector)):
-            for index_row in range(0, len(feature_vector[index_document])):
-                value = feature_vector[index_document][index_row][index_column]
-                if value != " ":
-                    values.add(value)
-
-        values = sorted(values)
-        values_cardinality = len(values)
-
-        values_list = list(values)
-        values_to_int = {}
-        for val_num in range(0, values_cardinality):
-            # We reserve the 0 for the unseen features so the indexes will go from 1 to cardinality + 1
-            values_to_int[values_list[val_num]] = val_num + 1
-
-        columns_length.append((index, values_to_int))
-        index += 1
-
-    return columns_length
+    return FeatureCardinality(indices=indices).update(feature_vector).columns_length()
 
 
 def cardinality_to_index_map(columns_length, features_max_vector_size):
@@ -84,8 +116,10 @@ def cardinality_to_index_map(columns_length, features_max_vector_size):
 
 
 def reduce_features_to_indexes(feature_vector, features_max_vector_size, indices=None):
-    cardinality = calculate_cardinality(feature_vector, indices=indices)
-    index_list, map_to_integers = cardinality_to_index_map(cardinality, features_max_vector_size)
+    cardinality = feature_vector
+    if not isinstance(cardinality, FeatureCardinality):
+        cardinality = FeatureCardinality(indices=indices).update(feature_vector)
+    index_list, map_to_integers = cardinality_to_index_map(cardinality.columns_length(), features_max_vector_size)
 
     return index_list, map_to_integers
 
@@ -103,29 +137,10 @@ def reduce_features_vector(feature_vector, features_max_vector_size):
     :return:
     """
 
-    # Compute frequencies for each column
-    columns_length = []
-    index = 0
+    # Compute frequencies for each column, the rows being a single document
     if not len(feature_vector) > 0:
         return []
-
-    for index_column in range(index, len(feature_vector[0])):
-        values = set()
-        for index_row in range(0, len(feature_vector)):
-            value = feature_vector[index_row][index_column]
-            if value != " ":
-                values.add(value)
-
-        values_cardinality = len(values)
-
-        values_list = list(values)
-        values_to_int = {}
-        for val_num in range(0, values_cardinality):
-            values_to_int[values_list[val_num]] = val_num
-
-        columns_length.append((index, values_to_int))
-        index += 1
-        # print("Column: " + str(index_column) + " Len:  " + str(len(values)))
+    columns_length = FeatureCardinality().update([feature_vector]).columns_length()
 
     # Filter out the columns that are not fitting
     columns_index = []
@@ -173,7 +188,15 @@ class FeaturesPreprocessor(BaseEstimator, TransformerMixin):
         # This value could be provided (model has been loaded) or not (first-time-training)
         self.features_map_to_index = features_map_to_index
 
+        # features_map_to_index compiled as lookup tables, once after a fit or a load
+        self._lookup_tables = None
+        self._lookup_tables_key = None
+
     def fit(self, X):
+        """
+        Fit the feature indexes on documents, given as a list or any iterable (read once), or on the
+        FeatureCardinality of a corpus (for instance merged from shards counted in parallel)
+        """
         if not self.features_indices:
             indexes, mapping = reduce_features_to_indexes(X, self.features_vocabulary_size)
         else:
@@ -190,23 +213,62 @@ class FeaturesPreprocessor(BaseEstimator, TransformerMixin):
 
         :param extend: when set to true it's adding an additional empty feature list in the sequence.
         """
-        features_vector = [[[self.features_map_to_index[index][
-                                 value] if index in self.features_map_to_index and value in self.features_map_to_index[
-            index] else 0
-                             for index, value in enumerate(value_list) if index in self.features_indices] for
-                            value_list in document] for document in X]
-
-        features_count = len(self.features_indices)
-
+        lengths = np.fromiter((len(document) for document in X), dtype=np.int64, count=len(X))
+        width = int(lengths.max(initial=0))
         if extend:
-            for out in features_vector:
-                out.append([0] * features_count)
+            width += 1
+        features_count = len(self.features_indices)
+        output = np.zeros((len(X), width, features_count), dtype=np.int32)
 
-        features_vector_padded, _ = pad_sequences(features_vector, [0] * features_count)
-        output = np.asarray(features_vector_padded)
+        token_indexes = self.transform_tokens([value_list for document in X for value_list in document])
+        if len(token_indexes) > 0:
+            first_tokens = np.cumsum(lengths) - lengths
+            positions = np.repeat(np.arange(len(X), dtype=np.int64) * width - first_tokens, lengths) + \
+                np.arange(len(token_indexes))
+            output.reshape((-1, features_count))[positions] = token_indexes
 
         return output
 
+    def transform_tokens(self, value_lists):
+        """
+        Return the indexes of the features of a flat list of tokens, given by their list of feature values,
+        as an int32 array of shape (nb_tokens, nb_features)
+        """
+        columns, getter, tables = self._get_lookup_tables()
+        token_indexes = np.zeros((len(value_lists), len(columns)), dtype=np.int32)
+        if len(value_lists) == 0 or len(columns) == 0:
+            return token_indexes
+
+        try:
+            selected = list(map(getter, value_lists))
+            # with a single column, the getter gives the value instead of a tuple
+            column_values = [selected] if len(columns) == 1 else zip(*selected)
+        except IndexError:
+            # tokens with missing feature columns, a missing value is unseen
+            column_values = zip(*[[value_list[column] if column < len(value_list) else None for column in columns]
+                                  for value_list in value_lists])
+        for i, values in enumerate(column_values):
+            # dict lookups of a whole column run in C, without a Python loop
+            token_indexes[:, i] = np.fromiter(map(tables[i].get, values, itertools.repeat(0)), dtype=np.int32,
+                                              count=len(value_lists))
+        return token_indexes
+
+    def _get_lookup_tables(self):
+        """
+        Return the feature columns in the order of the output, a getter of the values of these columns for
+        a token, and the value to index mapping of each column
+        """
+        lookup_tables_key = (id(self.features_map_to_index), len(self.features_map_to_index),
+                             tuple(self.features_indices))
+        if self._lookup_tables_key != lookup_tables_key:
+            # the features of a token are given in the order of their column
+            columns = sorted(self.features_indices)
+            getter = operator.itemgetter(*columns) if len(columns) > 0 else None
+            tables = [dict(self.features_map_to_index.get(column, {})) for column in columns]
+            self._lookup_tables = (columns, getter, tables)
+            self._lookup_tables_key = lookup_tables_key
+        return self._lookup_tables
+
     def empty_features_vector(self) -> Iterable[int]:
         features_count = len(self.features_indices)
         return [0] * features_count
@@ -229,6 +291,11 @@ class BERTPreprocessor(object):
         # this flag is used to indicate if the tokenizer is a BPE or sentence piece tokenizer
         self.is_BPE_SP = self.infer_BPE_SP_from_tokenizer_name(tokenizer_name)
 
+        # boolean tables over the vocabulary of a fast tokenizer, computed once, see get_vocabulary_tables()
+        self._vocabulary_tables = None
+        # process-wide cache of the sub-tokenization of the texts by the tokenizer, see get_subtoken_cache()
+        self._subtoken_cache = None
+
     def infer_BPE_SP_from_tokenizer_name(self, tokenizer_name):
         """
         Return true if the tokenizer is a BPE using encoded leading character space with byte-based tokens as in the
@@ -252,6 +319,9 @@ class BERTPreprocessor(object):
         and features given new tokens introduced by the wordpiece sub-tokenizer.
         texts is a list of texts already pre-tokenized
         """
+        if getattr(self.tokenizer, "is_fast", False):
+            return self.tokenize_and_align_batch(texts, chars, text_features, text_labels, maxlen)
+
         target_ids = []
         target_type_ids = []
         target_attention_mask = []
@@ -297,6 +367,122 @@ class BERTPreprocessor(object):
 
         return target_ids, target_type_ids, target_attention_mask, target_chars, target_features, target_labels, input_tokens
 
+    def tokenize_and_align_batch(self, texts, chars, text_features, text_labels, max_seq_length=512):
+        """
+        Same as tokenize_and_align_features_and_labels() with convert_single_text(), for a fast tokenizer:
+        the texts not in the sub-token cache are sub-tokenized with a single call to the tokenizer, and the
+        input channels are aligned with the word index of each sub-token
+        """
+        encoded_texts = self.get_subtoken_cache().lookup("aligned-sub-tokens", texts, max_seq_length,
+                                                         lambda missing: self.encode_texts(missing, max_seq_length))
+        pad_token_id = self.tokenizer.pad_token_id
+
+        target_ids = []
+        target_type_ids = []
+        target_attention_mask = []
+        input_tokens = []
+        target_chars = []
+        target_features = [] if text_features is not None else None
+        target_labels = [] if text_labels is not None else None
+
+        for i, encoded in enumerate(encoded_texts):
+            input_ids, token_type_ids, attention_mask, starts, ends, words = encoded
+            nb_sub_tokens = len(input_ids)
+
+            padded_ids = np.full((max_seq_length,), pad_token_id, dtype=np.int64)
+            padded_ids[:nb_sub_tokens] = input_ids
+            # as in convert_single_text(), the token types are padded with the pad token id
+            padded_type_ids = np.full((max_seq_length,), pad_token_id, dtype=np.int64)
+            padded_type_ids[:nb_sub_tokens] = token_type_ids
+            padded_attention_mask = np.zeros((max_seq_length,), dtype=np.int64)
+            padded_attention_mask[:nb_sub_tokens] = attention_mask
+
+            # positions of the first sub-token of each word and of all the sub-tokens of words
+            in_word = np.flatnonzero(words >= 0)
+            first = in_word[words[in_word] != np.concatenate(([-1], words[:-1]))[in_word]]
+
+            target_ids.append(padded_ids.tolist())
+            target_type_ids.append(padded_type_ids.tolist())
+            target_attention_mask.append(padded_attention_mask.tolist())
+            input_tokens.append(list(zip(starts.tolist(), ends.tolist())))
+            target_chars.append(_align_word_values(chars[i] if chars is not None else None, self.empty_char_vector,
+                                                   first, words[first], max_seq_length))
+
+            if target_features is not None:
+                # sub-tokens repeat the feature vector of the first sub-token of their word
+                target_features.append(_align_word_values(text_features[i], self.empty_features_vector, in_word,
+                                                          words[in_word], max_seq_length))
+
+            if target_labels is not None:
+                label_ids = np.full((max_seq_length,), "<PAD>", dtype=object)
+                label_ids[first] = np.asarray(text_labels[i], dtype=object)[words[first]]
+                target_labels.append(label_ids.tolist())
+
+        return target_ids, target_type_ids, target_attention_mask, target_chars, target_features, target_labels, input_tokens
+
+    def encode_texts(self, texts, max_seq_length):
+        """
+        Sub-tokenize pre-tokenized texts with a single call to the fast tokenizer, and return for each text a
+        (6, nb_sub_tokens) array of the input ids, token type ids, attention mask, start and end offsets and
+        word index (-1 for special tokens) of its sub-tokens, without the spurious BPE/sentence piece
+        sub-tokens skipped by convert_single_text()
+        """
+        empty, special, single_char, leading_space = self.get_vocabulary_tables()
+        encoded = self.tokenizer([list(text) for text in texts], add_special_tokens=True, is_split_into_words=True,
+            max_length=max_seq_length, truncation=True, return_offsets_mapping=True)
+        has_token_type_ids = "token_type_ids" in encoded
+
+        results = []
+        for i in range(len(texts)):
+            input_ids = np.asarray(encoded.input_ids[i], dtype=np.int64)
+            offsets = np.asarray(encoded.offset_mapping[i], dtype=np.int64).reshape((-1, 2))
+            word_ids = np.asarray([-1 if word_id is None else word_id for word_id in encoded.word_ids(i)],
+                                  dtype=np.int64)
+            if has_token_type_ids:
+                token_type_ids = np.asarray(encoded.token_type_ids[i], dtype=np.int64)
+            else:
+                token_type_ids = np.zeros_like(input_ids)
+            attention_mask = np.asarray(encoded.attention_mask[i], dtype=np.int64)
+
+            # sub-tokens skipped by convert_single_text(): empty decoded tokens, and for BPE/sentence piece
+            # tokenizers, tokens starting a word without leading space encoding symbol (or single char tokens)
+            # which are not following an empty token
+            skipped = empty[input_ids]
+            if self.is_BPE_SP:
+                after_empty = np.concatenate(([False], skipped[:-1]))
+                skipped = skipped | (~special[input_ids] & (offsets[:, 0] == 0) & ~after_empty &
+                                     (single_char[input_ids] | ~leading_space[input_ids]))
+            kept = np.flatnonzero(~skipped)
+
+            results.append(np.stack([input_ids[kept], token_type_ids[kept], attention_mask[kept],
+                                     offsets[kept, 0], offsets[kept, 1], word_ids[kept]]))
+        return results
+
+    def get_subtoken_cache(self):
+        if self._subtoken_cache is None:
+            self._subtoken_cache = get_subtoken_cache(self.tokenizer)
+        return self._subtoken_cache
+
+    def get_vocabulary_tables(self):
+        """
+        Return boolean arrays over the vocabulary of the fast tokenizer, indicating for each token id if it is
+        decoded as an empty string, if it is a special token, if it is a single char token and if it starts
+        with a leading space encoding symbol
+        """
+        if self._vocabulary_tables is None:
+            token_ids = list(range(len(self.tokenizer)))
+            tokens = [token if token is not None else "" for token in self.tokenizer.convert_ids_to_tokens(token_ids)]
+            decoded = self.tokenizer.backend_tokenizer.decode_batch([[token_id] for token_id in token_ids],
+                                                                    skip_special_tokens=False)
+            special_tokens = set(self.tokenizer.all_special_tokens)
+            self._vocabulary_tables = (
+                np.asarray([len(text) == 0 for text in decoded], dtype=bool),
+                np.asarray([token in special_tokens for token in tokens], dtype=bool),
+                np.asarray([len(token) == 1 for token in tokens], dtype=bool),
+                np.asarray([token.startswith(("Ġ", "▁", " ")) for token in tokens], dtype=bool)
+            )
+        return self._vocabulary_tables
+
     def convert_single_text(self, text_tokens, chars_tokens, features_tokens, label_tokens, max_seq_length):
         """
         Converts a single sequence input into a single transformer input format using generic tokenizer
@@ -581,6 +767,20 @@ class BERTPreprocessor(object):
         return input_ids, input_mask, segment_ids, chars_blocks, feature_blocks, label_ids, input_tokens_marked
 
 
+def _align_word_values(word_values, empty_value, positions, words, max_seq_length):
+    """
+    Return the list of max_seq_length values (e.g. char ids or features) of the sub-tokens, where the
+    sub-tokens at positions take the values of the given words, and the other ones the empty value
+    """
+    if word_values is None:
+        return [empty_value] * max_seq_length
+    word_values = np.asarray(word_values)
+    aligned = np.empty((max_seq_length,) + word_values.shape[1:], dtype=word_values.dtype)
+    aligned[:] = empty_value
+    aligned[positions] = word_values[words]
+    return aligned
+
+
 class Preprocessor(BaseEstimator, TransformerMixin):
 
     def __init__(self,
@@ -608,6 +808,9 @@ class Preprocessor(BaseEstimator, TransformerMixin):
         self.max_char_length = max_char_length
         self.feature_preprocessor = feature_preprocessor
         self.indice_tag = None
+        # memoized char ids of tokens, valid for the vocab_char and max_char_length they were built with
+        self._char_ids_cache = {}
+        self._char_ids_cache_key = None
 
     def fit(self, X, y):
         chars = {PAD: 0, UNK: 1}
@@ -694,19 +897,7 @@ class Preprocessor(BaseEstimator, TransformerMixin):
 
         if label_indices parameter is true, we encode tags with index integer, otherwise output hot one encoded tags
         """
-        chars = []
-        lengths = []
-        for sent in X:
-            char_ids = []
-            lengths.append(len(sent))
-            for w in sent:
-                #if self.return_chars:
-                char_ids.append(self.get_char_ids(w))
-                if extend:
-                    char_ids.append([])
-
-            #if self.return_chars:
-            chars.append(char_ids)
+        lengths = np.fromiter((len(sent) for sent in X), dtype=np.int32, count=len(X))
 
         if y is not None:
             pad_index = self.vocab_tag[PAD]
@@ -715,13 +906,20 @@ class Preprocessor(BaseEstimator, TransformerMixin):
                 y[0].append(pad_index)
 
         if self.padding:
-            sents, y = self.pad_sequence(chars, y, label_indices=label_indices)
+            sents, y = self.pad_sequence(X, y, label_indices=label_indices, extend=extend)
         else:
+            chars = []
+            for sent in X:
+                char_ids = []
+                for w in sent:
+                    char_ids.append(self.get_char_ids(w))
+                    if extend:
+                        char_ids.append([])
+                chars.append(char_ids)
             sents = [chars]
 
         # lengths
         #if self.return_lengths:
-        lengths = np.asarray(lengths, dtype=np.int32)
         lengths = lengths.reshape((lengths.shape[0], 1))
         sents.append(lengths)
 
@@ -747,27 +945,53 @@ class Preprocessor(BaseEstimator, TransformerMixin):
     def get_char_ids(self, word):
         return [self.vocab_char.get(c, self.vocab_char[UNK]) for c in word]
 
-    def pad_sequence(self, char_ids, labels=None, label_indices=False):
+    def pad_sequence(self, X, labels=None, label_indices=False, extend=False):
         '''
         pad char and label sequences
 
-        Relatively to labels, if label_indices is True, we encode labels with integer,
-        otherwise with hot one encoding
+        The char ids of the tokens of X are written in a (batch, max_len, max_char_length) int32 array,
+        followed each by an empty token if extend is True. Relatively to labels, if label_indices is True,
+        we encode labels with integer, otherwise with hot one encoding
         '''
         labels_final = None
         if labels:
-            labels_padded, _ = pad_sequences(labels, 0)
-            labels_final = np.asarray(labels_padded)
+            labels_final = pad_index_sequences(labels)
             if not label_indices:
                 labels_final = dense_to_one_hot(labels_final, len(self.vocab_tag), nlevels=2)
 
         #if self.return_chars:
-        char_ids, word_lengths = pad_sequences(char_ids, pad_tok=0, nlevels=2, max_char_length=self.max_char_length)
-        char_ids = np.asarray(char_ids)
+        step = 2 if extend else 1
+        max_length = max((len(sent) for sent in X), default=0) * step
+        char_ids = np.zeros((len(X), max_length, self.max_char_length), dtype=np.int32)
+        token_positions = []
+        token_char_ids = []
+        for i, sent in enumerate(X):
+            position = i * max_length
+            for w in sent:
+                token_positions.append(position)
+                token_char_ids.append(self._get_memoized_char_ids(w))
+                position += step
+        if len(token_char_ids) > 0:
+            _scatter_rows(char_ids.reshape(-1, self.max_char_length), token_positions, token_char_ids)
         return [char_ids], labels_final
         #else:
         #    return labels_final
 
+    def _get_memoized_char_ids(self, word):
+        '''
+        Return the char ids of a token truncated at max_char_length, as an int32 array, memoized per
+        distinct token
+        '''
+        cache_key = (id(self.vocab_char), len(self.vocab_char), self.max_char_length)
+        if self._char_ids_cache_key != cache_key or len(self._char_ids_cache) >= MAX_CHAR_IDS_CACHE_SIZE:
+            self._char_ids_cache = {}
+            self._char_ids_cache_key = cache_key
+        char_ids = self._char_ids_cache.get(word)
+        if char_ids is None:
+            char_ids = np.asarray(self.get_char_ids(word[:self.max_char_length]), dtype=np.int32)
+            self._char_ids_cache[word] = char_ids
+        return char_ids
+
     def empty_features_vector(self) -> Iterable[int]:
         if self.feature_preprocessor is not None:
             return self.feature_preprocessor.empty_features_vector()
@@ -781,8 +1005,12 @@ class Preprocessor(BaseEstimator, TransformerMixin):
         variables = vars(self)
         output_dict = {}
         for var in variables.keys():
+            if var.startswith('_'):
+                # memoized values
+                continue
             if var == 'feature_preprocessor' and variables['feature_preprocessor'] is not None:
-                output_dict[var] = variables[var].__dict__
+                output_dict[var] = {key: value for key, value in variables[var].__dict__.items()
+                                    if not key.startswith('_')}
             else:
                 output_dict[var] = variables[var]
 
@@ -861,6 +1089,34 @@ def pad_sequences(sequences, pad_tok=0, nlevels=1, max_char_length=30):
     return sequence_padded, sequence_length
 
 
+def pad_index_sequences(sequences, pad_tok=0):
+    """
+    Pad sequences of integers to the length of the longest one, as pad_sequences(), directly into an int32
+    array of shape (nb_sequences, max_length)
+    """
+    max_length = max((len(seq) for seq in sequences), default=0)
+    padded = np.full((len(sequences), max_length), pad_tok, dtype=np.int32)
+    _scatter_rows(padded, range(len(sequences)), sequences)
+    return padded
+
+
+def _scatter_rows(target, rows, values):
+    """
+    Write each sequence of values at the beginning of the given row of the 2D array target, with a single
+    NumPy assignment
+    """
+    sizes = np.fromiter((len(row_values) for row_values in values), dtype=np.int64, count=len(values))
+    total_size = int(sizes.sum())
+    if total_size == 0:
+        return
+    if isinstance(values[0], np.ndarray):
+        flat_values = np.concatenate(values)
+    else:
+        flat_values = np.fromiter(itertools.chain.from_iterable(values), dtype=target.dtype, count=total_size)
+    starts = np.asarray(rows, dtype=np.int64) * target.shape[1] - (np.cumsum(sizes) - sizes)
+    target.reshape(-1)[np.repeat(starts, sizes) + np.arange(total_size)] = flat_values
+
+
 def dense_to_one_hot(labels_dense, num_classes, nlevels=1):
     """
     Convert class labels from scalars to one-hot vectors
@@ -877,16 +1133,8 @@ def dense_to_one_hot(labels_dense, num_classes, nlevels=1):
         labels_one_hot.flat[index_offset + labels_dense.ravel()] = 1
         return labels_one_hot
     elif nlevels == 2:
-        # assume that labels_dense has same column length
-        num_labels = labels_dense.shape[0]
-        num_length = labels_dense.shape[1]
-        labels_one_hot = np.zeros((num_labels, num_length, num_classes), dtype=np.int32)
-        layer_idx = np.arange(num_labels).reshape(num_labels, 1)
-        # this index selects each component separately
-        component_idx = np.tile(np.arange(num_length), (num_labels, 1))
-        # then we use `a` to select indices according to category label
-        labels_one_hot[layer_idx, component_idx, labels_dense] = 1
-        return labels_one_hot
+        # assume that labels_dense has same column length, each label selects a row of the identity matrix
+        return np.eye(num_classes, dtype=np.int32)[labels_dense]
     else:
         raise ValueError('nlevels can take 1 or 2, not take {}.'.format(nlevels))
 
@@ -941,6 +1189,45 @@ def to_vector_single(tokens, embeddings, maxlen, lowercase=False, num_norm=True)
 
     return x
 
+def to_vector_batch(batch_tokens, embeddings, maxlen, lowercase=False, num_norm=True):
+    """
+    Given a batch of lists of tokens convert it to a (batch, maxlen, dim) float32 tensor of 
+    word embedding vectors with the provided embeddings, as to_vector_single() for each 
+    list of tokens, but looking up each distinct token of the batch only once
+    """
+    normalized_tokens = {}
+    batch_windows = []
+    for tokens in batch_tokens:
+        window = []
+        for word in tokens[-maxlen:]:
+            normalized = normalized_tokens.get(word)
+            if normalized is None:
+                normalized = word
+                if lowercase:
+                    normalized = _lower(normalized)
+                if num_norm:
+                    normalized = _normalize_num(normalized)
+                normalized_tokens[word] = normalized
+            window.append(normalized)
+        batch_windows.append(window)
+
+    return embeddings.get_word_vectors(batch_windows, maxlen)
+
+def words_by_frequency(X, lowercase=False, num_norm=True):
+    """
+    Return the distinct tokens of a list of token sequences, normalized as for the embeddings lookup 
+    in to_vector_single(), by decreasing frequency
+    """
+    counter = Counter(itertools.chain(*X))
+    frequencies = Counter()
+    for word, count in counter.items():
+        if lowercase:
+            word = _lower(word)
+        if num_norm:
+            word = _normalize_num(word)
+        frequencies[word] += count
+    return [word for word, _ in frequencies.most_common()]
+
 def to_vector_elmo(tokens, embeddings, maxlen, lowercase=False, num_norm=False, extend=False):
     """
     Given a list of tokens convert it to a sequence of word embedding 
@@ -4,7 +4,7 @@ import numpy as np
 
 from delft.sequenceLabelling.data_generator import DataGeneratorTransformers
 from delft.sequenceLabelling.preprocess import Preprocessor
-from delft.utilities.Tokenizer import tokenizeAndFilter
+from delft.utilities.Tokenizer import TokenizedDocument, tokenizeBatch
 
 
 class Tagger(object):
@@ -14,15 +14,26 @@ class Tagger(object):
                 model_config, 
                 embeddings=None, 
                 preprocessor: Preprocessor=None,
-                transformer_preprocessor=None):
+                transformer_preprocessor=None,
+                batch_size=None):
 
         self.model = model
         self.preprocessor = preprocessor
         self.transformer_preprocessor = transformer_preprocessor
         self.model_config = model_config
         self.embeddings = embeddings
+        # batch size of the prediction, the one of the model config if None
+        self.batch_size = batch_size
+        # label strings and chunk properties by label id, see LabelTables
+        self._label_tables = None
 
     def tag(self, texts, output_format, features=None):
+        """
+        Tag a list of texts, given as strings, lists of tokens, or TokenizedDocument objects (tokens with their 
+        offsets in the text and possibly their features, e.g. as obtained by a caller having already tokenized 
+        the texts). The texts and features are not modified, and the model, its config and the preprocessors 
+        are only read, so that several threads can tag at the same time with the same loaded model.
+        """
 
         if output_format == 'json':
             res = {
@@ -31,19 +42,40 @@ class Tagger(object):
                 "model": self.model_config.model_name,
                 "texts": []
             }
-        else:
-           list_of_tags = []
 
+        run = self.prepare(texts, features=features)
+        for step, model_inputs, input_offsets in self.featurize(run):
+            self.decode(run, step, self.predict(model_inputs), input_offsets, output_format)
+
+        results = run.results()
+        if output_format == 'json':
+            res["texts"] = results
+            return res
+        else:
+            return results
+
+    def prepare(self, texts, features=None):
+        """
+        Tokenize the texts to be tagged and create their data generator, the texts are then tagged by 
+        featurizing, predicting and decoding each batch of the returned TaggingRun. The steps of tag() 
+        are exposed so that they can be pipelined (see delft.sequenceLabelling.file_tagger)
+        """
         to_tokeniz = False
         if (len(texts)>0 and isinstance(texts[0], str)):
             to_tokeniz = True
-        
+
+        if features is None and len(texts) > 0 and isinstance(texts[0], TokenizedDocument) \
+                and texts[0].features is not None:
+            features = [document.features for document in texts]
+
         # dirty fix warning! in the particular case of using tf-addons CRF layer and having a 
         # single sequence in the input batch, a tensor shape error can happen in the CRF 
         # viterbi_decoding loop. So to prevent this, we add a dummy second sequence in the batch
         # that we will remove after prediction
+        nb_texts = len(texts)
         dummy_case = False
         if self.model_config.use_crf and not self.model_config.use_chain_crf and len(texts) == 1:
+            texts = list(texts)
             if features is None:
                 if to_tokeniz:
                     texts.append(texts[0])
@@ -52,30 +84,45 @@ class Tagger(object):
             else:
                 texts.append(texts[0])
                 # add a dummy feature vector for the token dummy...
+                features = list(features)
                 features.append(features[0])
             dummy_case = True
         # end of dirty fix
 
+        # the texts are tokenized once, the generator is given the tokens and the entities are built with the
+        # offsets of the tokens
+        if to_tokeniz:
+            documents = tokenizeBatch(texts)
+        else:
+            # lists of tokens, or documents already tokenized by the caller
+            documents = [text if isinstance(text, TokenizedDocument) else TokenizedDocument(None, text, []) 
+                         for text in texts]
+
         generator = self.model.get_generator()
-        predict_generator = generator(texts, None, 
-            batch_size=self.model_config.batch_size, 
+        predict_generator = generator([document.tokens for document in documents], None, 
+            batch_size=self.batch_size if self.batch_size is not None else self.model_config.batch_size, 
             preprocessor=self.preprocessor, 
             bert_preprocessor=self.transformer_preprocessor,
             char_embed_size=self.model_config.char_embedding_size,
             max_sequence_length=self.model_config.max_sequence_length,
-            embeddings=self.embeddings, tokenize=to_tokeniz, shuffle=False, 
+            embeddings=self.embeddings, tokenize=False, shuffle=False, 
             features=features, output_input_offsets=True, 
-            use_chain_crf=self.model_config.use_chain_crf)
-
-        steps_done = 0
-        steps = len(predict_generator)
-        for generator_output in predict_generator:
-            if dummy_case and steps_done == 1:
-                break
-
-            if steps_done == steps:
-                break
-
+            use_chain_crf=self.model_config.use_chain_crf,
+            # with the dummy sequence, the text stays first, a shorter dummy would be sorted before it
+            length_bucketing=not dummy_case)
+
+        # with the dummy sequence, only the first batch is tagged
+        steps = 1 if dummy_case else len(predict_generator)
+        return TaggingRun(documents, predict_generator, nb_texts, steps)
+
+    def featurize(self, run):
+        """
+        Yield the step, the model inputs and the sub-token offsets (None without transformer) of each batch 
+        of a TaggingRun
+        """
+        predict_generator = run.generator
+        for step in range(run.steps):
+            data = predict_generator[step][0]
             if isinstance(predict_generator, DataGeneratorTransformers):
                 # the model uses transformer embeddings, so we need the input tokens to realign correctly the 
                 # labels and the inpit label texts 
@@ -83,108 +130,205 @@ class Tagger(object):
                 # we need to remove one vector of the data corresponding to the marked tokens, this vector is not 
                 # expected by the model, but we need it to restore correctly the labels (which are produced
                 # according to the sub-segmentation of wordpiece, not the expected segmentation)
-                data = generator_output[0]
-
-                input_offsets = data[-1]
-                data = data[:-1]
-
-                y_pred_batch = self.model.predict_on_batch(data)
-                #y_pred_batch = np.argmax(y_pred_batch, -1)
-
-                # results have been produced by a model using a transformer layer, so a few things to do
-                # the labels are sparse, so integers and not one hot encoded
-                # we need to restore back the labels for wordpiece to the labels for normal tokens
-                # for this we can use the marked tokens provided by the generator 
-                new_y_pred_batch = []
-                for y_pred_text, offsets_text in zip(y_pred_batch, input_offsets):
-                    new_y_pred_text = []
-                    # this is the result per sequence, realign labels:
-                    for q in range(len(offsets_text)):
-                        if offsets_text[q][0] == 0 and offsets_text[q][1] == 0:
-                            # special token
-                            continue
-                        if offsets_text[q][0] != 0: 
-                            # added sub-token
-                            continue
-                        new_y_pred_text.append(y_pred_text[q]) 
-                    new_y_pred_batch.append(new_y_pred_text)
-                preds = new_y_pred_batch
+                yield step, data[:-1], data[-1]
             else:
                 # no weirdness changes on the input 
-                preds = self.model.predict_on_batch(generator_output[0])
-
-            for i in range(0, len(preds)):
-                pred = [preds[i]]
-                text = texts[i+(steps_done*self.model_config.batch_size)]
+                yield step, data, None
+
+    def predict(self, model_inputs):
+        return self.model.predict_on_batch(model_inputs)
+
+    def decode(self, run, step, y_pred_batch, input_offsets, output_format):
+        """
+        Store in the TaggingRun the tags (or the entities for the json format) of the texts of a predicted batch
+        """
+        if input_offsets is not None:
+            # results have been produced by a model using a transformer layer, so we need to restore back
+            # the labels for wordpiece to the labels for normal tokens: only the first sub-token of each
+            # token is kept, using the offsets of the sub-tokens provided by the generator
+            first_sub_tokens = _first_sub_token_mask(input_offsets, np.shape(y_pred_batch)[1])
+        else:
+            first_sub_tokens = None
 
-                if to_tokeniz:
-                   tokens, offsets = tokenizeAndFilter(text)
-                else:
-                    # it is a list of string, so a string already tokenized
-                    # note that in this case, offset are not present and json output is impossible
-                    tokens = text
-                    offsets = []
-
-                if not self.model_config.use_crf or self.model_config.use_chain_crf:
-                    tags = self._get_tags(pred)
-                    prob = self._get_prob(pred)
-                else:
-                    tags = self._get_tags_sparse(pred)
-                    prob = self._get_prob_sparse(pred)
-
-                if output_format == 'json':
-                    piece = {}
-                    piece["text"] = text
-                    piece["entities"] = self._build_json_response(text, tokens, tags, prob, offsets)["entities"]
-                    res["texts"].append(piece)
-                else:
-                    the_tags = list(zip(tokens, tags))
-                    list_of_tags.append(the_tags)
-            steps_done += 1
+        if not self.model_config.use_crf or self.model_config.use_chain_crf:
+            batch_label_ids = np.argmax(y_pred_batch, -1)
+            batch_prob = np.max(y_pred_batch, -1)
+        else:
+            # the labels are sparse, so integers and not one hot encoded
+            batch_label_ids = np.asarray(y_pred_batch)
+            batch_prob = np.ones(batch_label_ids.shape, dtype=np.float64)
+        text_label_ids = _split_rows(batch_label_ids, first_sub_tokens)
+        text_prob = _split_rows(batch_prob, first_sub_tokens)
+
+        # the texts are sorted by length in the generator to limit the padding, the results are stored at
+        # the index of their text to restore the original order
+        start, end = run.generator.batch_bounds[step]
+        if run.generator.order is None:
+            text_indices = list(range(start, start + len(text_label_ids)))
+        else:
+            text_indices = run.generator.order[start:start + len(text_label_ids)].tolist()
+        batch_documents = [run.documents[text_index] for text_index in text_indices]
 
         if output_format == 'json':
-            return res
+            # note: for a list of tokens without text, offsets are not present and json output is impossible
+            batch_texts = [document.text if document.text is not None else document.tokens 
+                           for document in batch_documents]
+            batch_entities = self._build_json_entities(batch_texts, text_label_ids, text_prob, 
+                                                       [document.offsets for document in batch_documents])
+            for text_index, text, entities in zip(text_indices, batch_texts, batch_entities):
+                run.text_results[text_index] = {"text": text, "entities": entities}
         else:
-            return list_of_tags
-
-    def _get_tags(self, pred):
-        pred = np.argmax(pred, -1)
-        tags = self.preprocessor.inverse_transform(pred[0])
-        return tags
-
-    def _get_tags_sparse(self, pred):
-        tags = self.preprocessor.inverse_transform(pred[0])
-        return tags
-
-    def _get_prob(self, pred):
-        prob = np.max(pred, -1)[0]
-        return prob
-
-    def _get_prob_sparse(self, pred):
-        return [1.0] * len(pred[0])
-
-    def _build_json_response(self, original_text, tokens, tags, prob, offsets):
-        res = {
-            "entities": []
-        }
-        chunks = get_entities_with_offsets(tags, offsets)
-        for chunk_type, chunk_start, chunk_end, pos_start, pos_end in chunks:
-            if prob is not None:
-                score = float(np.average(prob[chunk_start:chunk_end]))
-            else:
-                score = 1.0
-
-            entity_text = original_text[pos_start: pos_end+1]
-            entity = {
-                "text": entity_text,
-                "class": chunk_type,
+            label_tables = self._get_label_tables()
+            for text_index, document, label_ids in zip(text_indices, batch_documents, text_label_ids):
+                tokens = document.tokens
+                run.text_results[text_index] = list(zip(tokens, label_tables.tags[label_ids[:len(tokens)]].tolist()))
+        run.nb_decoded += 1
+
+    def _get_label_tables(self):
+        if self._label_tables is None or self._label_tables.vocab_tag is not self.preprocessor.vocab_tag:
+            self._label_tables = LabelTables(self.preprocessor.vocab_tag)
+        return self._label_tables
+
+    def _build_json_entities(self, original_texts, text_label_ids, text_prob, text_offsets):
+        """
+        Return the list of entities of each text of a batch, given the label ids and probabilities of its
+        tokens and the offsets of its tokens. The score of an entity is the average probability of its tokens.
+        """
+        label_tables = self._get_label_tables()
+        lengths = [min(len(label_ids), len(offsets)) for label_ids, offsets in zip(text_label_ids, text_offsets)]
+        text_starts, chunk_starts, chunk_ends, chunk_types = get_batch_chunks(text_label_ids, lengths, label_tables)
+        prob = np.concatenate([prob[:length] for prob, length in zip(text_prob, lengths)])
+        scores = _chunk_averages(prob, chunk_starts, chunk_ends)
+        chunk_texts = np.searchsorted(text_starts, chunk_starts, side='right') - 1
+
+        entities = [[] for _ in original_texts]
+        for text_id, chunk_start, chunk_end, type_id, score in zip(chunk_texts.tolist(), chunk_starts.tolist(),
+                                                                   chunk_ends.tolist(), chunk_types.tolist(),
+                                                                   scores.tolist()):
+            offsets = text_offsets[text_id]
+            text_start = text_starts[text_id]
+            pos_start = offsets[chunk_start - text_start][0]
+            pos_end = offsets[chunk_end - text_start - 1][1] - 1
+            entities[text_id].append({
+                "text": original_texts[text_id][pos_start: pos_end+1],
+                "class": label_tables.type_names[type_id],
                 "score": score,
                 "beginOffset": pos_start,
                 "endOffset": pos_end
-            }
-            res["entities"].append(entity)
+            })
+        return entities
+
 
-        return res
+class TaggingRun(object):
+    """
+    Texts being tagged by a Tagger: their documents, their data generator, and the results of the texts of
+    the decoded batches, by text index
+    """
+
+    def __init__(self, documents, generator, nb_texts, steps):
+        self.documents = documents
+        self.generator = generator
+        # number of texts to tag, without the dummy text possibly added for the CRF layer
+        self.nb_texts = nb_texts
+        self.steps = steps
+        self.nb_decoded = 0
+        self.text_results = [None] * len(documents)
+
+    def is_complete(self):
+        return self.nb_decoded == self.steps
+
+    def results(self):
+        results = self.text_results[:self.nb_texts]
+        missing = [text_index for text_index, result in enumerate(results) if result is None]
+        if len(missing) > 0:
+            raise RuntimeError("Texts not tagged at indices " + str(missing[:10]))
+        return results
+
+
+def _first_sub_token_mask(input_offsets, max_length):
+    """
+    (batch, max_length) boolean mask of the sub-tokens starting a token, i.e. with a start offset of 0 and not
+    special tokens (offsets (0, 0)), given the offsets of the sub-tokens of each text of the batch
+    """
+    mask = np.zeros((len(input_offsets), max_length), dtype=bool)
+    for i, offsets_text in enumerate(input_offsets):
+        offsets_text = np.asarray(offsets_text, dtype=np.int64).reshape((-1, 2))[:max_length]
+        mask[i, :len(offsets_text)] = (offsets_text[:, 0] == 0) & (offsets_text[:, 1] != 0)
+    return mask
+
+
+def _split_rows(batch_values, mask):
+    """
+    Return the rows of a (batch, length) array, restricted to the masked positions if a mask is given
+    """
+    if mask is None:
+        return list(batch_values)
+    counts = mask.sum(axis=1)
+    return np.split(batch_values[mask], np.cumsum(counts)[:-1])
+
+
+class LabelTables(object):
+    """
+    Label strings and chunk properties (beginning or inside of a chunk, chunk type) of each label id, as
+    NumPy arrays indexed by label id
+    """
+
+    def __init__(self, vocab_tag):
+        self.vocab_tag = vocab_tag
+        indice_tag = {i: t for t, i in vocab_tag.items()}
+        size = max(indice_tag.keys(), default=-1) + 1
+        self.tags = np.empty((size,), dtype=object)
+        for i, tag in indice_tag.items():
+            self.tags[i] = tag
+        self.is_begin = np.zeros((size,), dtype=bool)
+        self.is_inside = np.zeros((size,), dtype=bool)
+        self.types = np.zeros((size,), dtype=np.int64)
+        self.type_names = []
+        type_ids = {}
+        for i, tag in indice_tag.items():
+            self.is_begin[i] = tag.startswith('B')
+            self.is_inside[i] = tag.startswith('I')
+            type_name = tag.split('-')[-1]
+            if type_name not in type_ids:
+                type_ids[type_name] = len(self.type_names)
+                self.type_names.append(type_name)
+            self.types[i] = type_ids[type_name]
+
+
+def get_batch_chunks(batch_label_ids, lengths, label_tables):
+    """
+    Gets the entities of a batch of label id sequences at once, as get_entities_with_offsets() does for a
+    sequence of labels, each sequence being truncated at its length. The sequences are concatenated.
+
+    Returns:
+        the start position of each sequence in the concatenation (with the total length at the end), and for
+        each chunk, its start and end positions in the concatenation and its type id
+    """
+    text_starts = np.zeros((len(lengths) + 1,), dtype=np.int64)
+    np.cumsum(lengths, out=text_starts[1:])
+    total = int(text_starts[-1])
+    label_ids = np.concatenate([np.asarray(label_ids[:length], dtype=np.int64)
+                                for label_ids, length in zip(batch_label_ids, lengths)])
+
+    chunk_starts = np.flatnonzero(label_tables.is_begin[label_ids])
+    types = label_tables.types[label_ids]
+    # a chunk continues with the inside labels of the same type, until the end of its sequence
+    continued = np.zeros((total,), dtype=bool)
+    continued[1:] = label_tables.is_inside[label_ids[1:]] & (types[1:] == types[:-1])
+    continued[text_starts[text_starts < total]] = False
+    breaks = np.append(np.flatnonzero(~continued), total)
+    chunk_ends = breaks[np.searchsorted(breaks, chunk_starts, side='right')]
+    return text_starts, chunk_starts, chunk_ends, types[chunk_starts]
+
+
+def _chunk_averages(values, starts, ends):
+    """
+    Average of the values of each chunk [start, end), identical to np.average() of the values of the chunk
+    """
+    averages = np.empty((len(starts),), dtype=values.dtype)
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        averages[i] = np.mean(values[start:end])
+    return averages
 
 
 def get_entities_with_offsets(seq, offsets):
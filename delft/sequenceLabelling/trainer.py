@@ -3,7 +3,6 @@ import os
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.callbacks import Callback, EarlyStopping, ModelCheckpoint
-from transformers import create_optimizer
 
 from delft.sequenceLabelling.config import ModelConfig
 from delft.sequenceLabelling.data_generator import DataGeneratorTransformers
@@ -11,12 +10,16 @@ from delft.sequenceLabelling.evaluation import f1_score, accuracy_score, precisi
 from delft.sequenceLabelling.evaluation import get_report, compute_metrics
 from delft.sequenceLabelling.models import get_model
 from delft.sequenceLabelling.preprocess import Preprocessor
-from delft.utilities.Transformer import TRANSFORMER_CONFIG_FILE_NAME, DEFAULT_TRANSFORMER_TOKENIZER_DIR
+from delft.utilities.Transformer import TRANSFORMER_CONFIG_FILE_NAME, DEFAULT_TRANSFORMER_TOKENIZER_DIR, import_transformers
 from delft.utilities.misc import print_parameters
+from delft.utilities.input_pipeline import TrainingDataset
+from delft.utilities.shared_memory_batches import SharedMemoryBatches, shared_memory_supported
 
 DEFAULT_WEIGHT_FILE_NAME = 'model_weights.hdf5'
 CONFIG_FILE_NAME = 'config.json'
 PROCESSOR_FILE_NAME = 'preprocessor.json'
+EMBEDDINGS_SNAPSHOT_DIR_NAME = 'embeddings'
+TRAINING_VOCABULARY_FILE_NAME = 'training-vocabulary.json'
 
 class Trainer(object):
 
@@ -66,7 +69,7 @@ class Trainer(object):
         
         if self.model_config.transformer_name is not None:
             # we use a transformer layer in the architecture
-            optimizer, lr_schedule = create_optimizer(
+            optimizer, lr_schedule = import_transformers().create_optimizer(
                 init_lr=self.training_config.learning_rate,
                 num_train_steps=nb_train_steps,
                 weight_decay_rate=0.01,
@@ -128,7 +131,10 @@ class Trainer(object):
                 char_embed_size=self.model_config.char_embedding_size, 
                 max_sequence_length=self.model_config.max_sequence_length,
                 embeddings=self.embeddings, 
-                shuffle=True, features=f_train, use_chain_crf=self.model_config.use_chain_crf)
+                shuffle=True, features=f_train, use_chain_crf=self.model_config.use_chain_crf,
+                length_bucketing=self.training_config.length_bucketing,
+                max_tokens_per_batch=self.training_config.max_tokens_per_batch,
+                featurization_cache_dir=self.training_config.featurization_cache_dir)
 
             validation_generator = generator(x_valid, y_valid,  
                 batch_size=self.training_config.batch_size, preprocessor=self.preprocessor, 
@@ -136,7 +142,8 @@ class Trainer(object):
                 char_embed_size=self.model_config.char_embedding_size, 
                 max_sequence_length=self.model_config.max_sequence_length,
                 embeddings=self.embeddings, shuffle=False, features=f_valid, 
-                output_input_offsets=True, use_chain_crf=self.model_config.use_chain_crf)
+                output_input_offsets=True, use_chain_crf=self.model_config.use_chain_crf,
+                featurization_cache_dir=self.training_config.featurization_cache_dir)
 
             _callbacks = get_callbacks(log_dir=self.checkpoint_path,
                                       early_stopping=True,
@@ -155,7 +162,10 @@ class Trainer(object):
                 char_embed_size=self.model_config.char_embedding_size, 
                 max_sequence_length=self.model_config.max_sequence_length,
                 embeddings=self.embeddings, shuffle=True, 
-                features=feature_all, use_chain_crf=self.model_config.use_chain_crf)
+                features=feature_all, use_chain_crf=self.model_config.use_chain_crf,
+                length_bucketing=self.training_config.length_bucketing,
+                max_tokens_per_batch=self.training_config.max_tokens_per_batch,
+                featurization_cache_dir=self.training_config.featurization_cache_dir)
 
             _callbacks = get_callbacks(log_dir=self.checkpoint_path,
                                       early_stopping=False,
@@ -172,7 +182,30 @@ class Trainer(object):
             nb_workers = 0 
             multiprocessing = False
 
-        local_model.fit(training_generator,
+        if self.training_config.use_tf_data:
+            # batches are produced by a tf.data pipeline, overlapping with the training, transformer
+            # tokenizers are not shared between parallel calls
+            num_parallel_calls = tf.data.AUTOTUNE if nb_workers > 0 else 1
+            training_dataset = TrainingDataset(training_generator, cache=self.training_config.tf_data_cache,
+                                               num_parallel_calls=num_parallel_calls)
+            try:
+                local_model.fit(training_dataset.dataset,
+                                epochs=max_epoch,
+                                callbacks=training_dataset.callbacks + _callbacks)
+            finally:
+                training_dataset.close()
+        elif multiprocessing and self.training_config.shared_memory_batches and shared_memory_supported():
+            # batches are sent by the worker processes through shared memory, in a shuffled order
+            training_batches = SharedMemoryBatches(training_generator, nb_workers=nb_workers, shuffle=True)
+            try:
+                local_model.fit(training_batches,
+                                epochs=max_epoch,
+                                shuffle=False,
+                                callbacks=_callbacks)
+            finally:
+                training_batches.close()
+        else:
+            local_model.fit(training_generator,
                                 epochs=max_epoch,
                                 use_multiprocessing=multiprocessing,
                                 workers=nb_workers,
@@ -9,6 +9,7 @@ os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 from itertools import islice
 import time
+import weakref
 import json
 import re
 import math
@@ -37,22 +38,23 @@ deprecation._PRINT_DEPRECATION_WARNINGS = False
 from delft.sequenceLabelling.trainer import DEFAULT_WEIGHT_FILE_NAME
 from delft.sequenceLabelling.trainer import CONFIG_FILE_NAME
 from delft.sequenceLabelling.trainer import PROCESSOR_FILE_NAME
+from delft.sequenceLabelling.trainer import EMBEDDINGS_SNAPSHOT_DIR_NAME
+from delft.sequenceLabelling.trainer import TRAINING_VOCABULARY_FILE_NAME
 
 from delft.sequenceLabelling.config import ModelConfig, TrainingConfig
 from delft.sequenceLabelling.models import get_model
-from delft.sequenceLabelling.preprocess import prepare_preprocessor, Preprocessor
+from delft.sequenceLabelling.preprocess import prepare_preprocessor, Preprocessor, words_by_frequency
 from delft.sequenceLabelling.tagger import Tagger
+from delft.sequenceLabelling.file_tagger import tag_file
 from delft.sequenceLabelling.trainer import Trainer
 from delft.sequenceLabelling.trainer import Scorer
 from delft.sequenceLabelling.evaluation import get_report
 
-from delft.utilities.Embeddings import Embeddings, load_resource_registry
+from delft.utilities.Embeddings import Embeddings, load_resource_registry, DEFAULT_SNAPSHOT_TOP_WORDS
+from delft.utilities.shared_embeddings import acquire_embeddings, release_embeddings
 from delft.utilities.numpy import concatenate_or_none
 
-from delft.sequenceLabelling.evaluation import classification_report
-
-import transformers
-transformers.logging.set_verbosity(transformers.logging.ERROR)
+from delft.sequenceLabelling.evaluation import classification_report, f1_score
 
 class Sequence(object):
 
@@ -84,7 +86,13 @@ class Sequence(object):
                  fold_number=1,
                  multiprocessing=True,
                  features_indices=None,
-                 transformer_name: str = None):
+                 transformer_name: str = None,
+                 length_bucketing=False,
+                 max_tokens_per_batch=None,
+                 featurization_cache_dir=None,
+                 use_tf_data=False,
+                 tf_data_cache=None,
+                 shared_memory_batches=False):
 
         if model_name is None:
             # add a dummy name based on the architecture
@@ -103,11 +111,13 @@ class Sequence(object):
         word_emb_size = 0
         self.embeddings = None
         self.model_local_path = None
+        # distinct tokens of the training data by decreasing frequency, as looked up in the embeddings
+        self.training_vocabulary = None
 
         self.registry = load_resource_registry("delft/resources-registry.json")
 
         if self.embeddings_name is not None:
-            self.embeddings = Embeddings(self.embeddings_name, resource_registry=self.registry, use_ELMo=use_ELMo)
+            self._set_embeddings(acquire_embeddings(self.embeddings_name, resource_registry=self.registry, use_ELMo=use_ELMo))
             word_emb_size = self.embeddings.embed_size
         else:
             self.embeddings = None
@@ -139,7 +149,20 @@ class Sequence(object):
         self.training_config = TrainingConfig(learning_rate, batch_size, optimizer,
                                               lr_decay, clip_gradients, max_epoch,
                                               early_stop, patience,
-                                              max_checkpoints_to_keep, multiprocessing)
+                                              max_checkpoints_to_keep, multiprocessing,
+                                              length_bucketing, max_tokens_per_batch,
+                                              featurization_cache_dir, use_tf_data, tf_data_cache,
+                                              shared_memory_batches)
+
+    def _set_embeddings(self, embeddings):
+        # the embeddings are shared with the other models of the process (see shared_embeddings), the
+        # previous embeddings are released, and these ones when the model is garbage collected
+        if getattr(self, '_embeddings_finalizer', None) is not None:
+            self._embeddings_finalizer()
+        self.embeddings = embeddings
+        self._embeddings_finalizer = None
+        if embeddings is not None:
+            self._embeddings_finalizer = weakref.finalize(self, release_embeddings, embeddings)
 
     def train(self, x_train, y_train, f_train=None, x_valid=None, y_valid=None, f_valid=None, incremental=False, callbacks=None):
         # TBD if valid is None, segment train to get one if early_stop is True
@@ -156,6 +179,8 @@ class Sequence(object):
             y_all = y_train
 
         features_all = concatenate_or_none((f_train, f_valid), axis=0)
+        self.training_vocabulary = words_by_frequency(x_all)
+        self.warm_embeddings_cache(self.training_vocabulary)
 
         if incremental:
             if self.model == None and self.models == None:
@@ -198,6 +223,8 @@ class Sequence(object):
         x_all = np.concatenate((x_train, x_valid), axis=0) if x_valid is not None else x_train
         y_all = np.concatenate((y_train, y_valid), axis=0) if y_valid is not None else y_train
         features_all = concatenate_or_none((f_train, f_valid), axis=0)
+        self.training_vocabulary = words_by_frequency(x_all)
+        self.warm_embeddings_cache(self.training_vocabulary)
 
         if incremental:
             if self.model == None and self.models == None:
@@ -224,11 +251,23 @@ class Sequence(object):
         if self.embeddings and self.embeddings.use_ELMo:
             self.embeddings.clean_ELMo_cache()
 
+    def warm_embeddings_cache(self, words):
+        """
+        Pre-load the word vector cache of the embeddings, if enabled, with a list of words by decreasing frequency
+        """
+        if self.embeddings is not None and self.embeddings.cache is not None:
+            nb_words = self.embeddings.warm_cache(words)
+            print("word vector cache warmed with", nb_words, "words")
+
     def eval(self, x_test, y_test, features=None):
+        """
+        Evaluate the model, return the micro-average f1 score for a single model (None for n-fold models, 
+        the scores being only reported)
+        """
         if self.model_config.fold_number > 1:
             self.eval_nfold(x_test, y_test, features=features)
         else:
-            self.eval_single(x_test, y_test, features=features)
+            return self.eval_single(x_test, y_test, features=features)
 
     def eval_single(self, x_test, y_test, features=None):
         if self.model is None:
@@ -253,6 +292,7 @@ class Sequence(object):
                 use_chain_crf=self.model_config.use_chain_crf)
             scorer.model = self.model
             scorer.on_epoch_end(epoch=-1)
+            return scorer.f1
         else:
             # the architecture model uses a transformer layer
             # note that we could also use the above test_generator, but as an alternative here we check the 
@@ -297,6 +337,7 @@ class Sequence(object):
 
             report, report_as_map = classification_report(y_test, y_pred, digits=4)
             print(report)
+            return f1_score(y_test, y_pred)
 
     def eval_nfold(self, x_test, y_test, features=None):
         if self.models is not None:
@@ -437,12 +478,15 @@ class Sequence(object):
 
     def tag(self, texts, output_format, features=None, batch_size=None):
         # annotate a list of sentences, return the list of annotations in the 
-        # specified output_format
+        # specified output_format - the sentences are strings, lists of tokens or 
+        # TokenizedDocument objects (tokens with their offsets, see delft.utilities.Tokenizer)
+        # tag() is reentrant: the texts, the features and the model config are not modified
+        # (batch_size only applies to this call), so several threads can tag at the same time 
+        # with the same loaded model
 
         if batch_size is not None:
-            self.model_config.batch_size = batch_size
             print("---")
-            print("batch_size (prediction):", self.model_config.batch_size)
+            print("batch_size (prediction):", batch_size)
             print("---")
 
         if self.model:
@@ -450,7 +494,8 @@ class Sequence(object):
                             self.model_config,
                             self.embeddings,
                             preprocessor=self.p,
-                            transformer_preprocessor=self.model.transformer_preprocessor)
+                            transformer_preprocessor=self.model.transformer_preprocessor,
+                            batch_size=batch_size)
             start_time = time.time()
             annotations = tagger.tag(texts, output_format, features=features)
             runtime = round(time.time() - start_time, 3)
@@ -465,101 +510,37 @@ class Sequence(object):
     def tag_file(self, file_in, output_format, file_out, batch_size=None):
         # Annotate a text file containing one sentence per line, the annotations are
         # written in the output file if not None, in the standard output otherwise.
-        # Processing is streamed by batches so that we can process huge files without
-        # memory issues
+        # Processing is streamed by chunks of lines and pipelined (reading, featurization, 
+        # prediction and writing overlap) so that we can process huge files without
+        # memory issues, see delft.sequenceLabelling.file_tagger - output_format is json 
+        # or jsonl (one JSON object per line). As tag(), tag_file() is reentrant.
 
         if batch_size != None:
-            self.model_config.batch_size = batch_size
             print("---")
-            print("batch_size (prediction):", self.model_config.batch_size)
+            print("batch_size (prediction):", batch_size)
             print("---")
+        else:
+            batch_size = self.model_config.batch_size
 
         if self.model:
             tagger = Tagger(self.model,
                             self.model_config,
                             self.embeddings,
                             preprocessor=self.p,
-                            transformer_preprocessor=self.model.transformer_preprocessor)
-            start_time = time.time()
-            if file_out != None:
-                out = open(file_out,'w')
-            first = True
-            with open(file_in, 'r') as f:
-                texts = None
-                while texts == None or len(texts) == self.model_config.batch_size * self.nb_workers:
-
-                  texts = next_n_lines(f, self.model_config.batch_size * self.nb_workers)
-                  annotations = tagger.tag(texts, output_format)
-                  # if the following is true, we just output the JSON returned by the tagger without any modification
-                  directDump = False
-                  if first:
-                      first = False
-                      if len(texts) < self.model_config.batch_size * self.nb_workers:
-                          runtime = round(time.time() - start_time, 3)
-                          annotations['runtime'] = runtime
-                          jsonString = json.dumps(annotations, sort_keys=False, indent=4, ensure_ascii=False)
-                          if file_out == None:
-                              print(jsonString)
-                          else:
-                              out.write(jsonString)
-                          directDump = True
-                      else:
-                          # we need to modify a bit the JSON outputted by the tagger to glue the different batches
-                          # output the general information attributes
-                          jsonString = '{\n    "software": ' + json.dumps(annotations["software"], ensure_ascii=False) + ",\n"
-                          jsonString += '    "date": ' + json.dumps(annotations["date"], ensure_ascii=False) + ",\n"
-                          jsonString += '    "model": ' + json.dumps(annotations["model"], ensure_ascii=False) + ",\n"
-                          jsonString += '    "texts": ['
-                          if file_out == None:
-                              print(jsonString, end='', flush=True)
-                          else:
-                              out.write(jsonString)
-                          first = True
-                          for jsonStr in annotations["texts"]:
-                              jsonString = json.dumps(jsonStr, sort_keys=False, indent=4, ensure_ascii=False)
-                              #jsonString = jsonString.replace('\n', '\n\t\t')
-                              jsonString = re.sub('\n', '\n        ', jsonString)
-                              if file_out == None:
-                                  if not first:
-                                      print(',\n        '+jsonString, end='', flush=True)
-                                  else:
-                                      first = False
-                                      print('\n        '+jsonString, end='', flush=True)
-                              else:
-                                  if not first:
-                                      out.write(',\n        ')
-                                      out.write(jsonString)
-                                  else:
-                                      first = False
-                                      out.write('\n        ')
-                                      out.write(jsonString)
-                  else:
-                      for jsonStr in annotations["texts"]:
-                          jsonString = json.dumps(jsonStr, sort_keys=False, indent=4, ensure_ascii=False)
-                          jsonString = re.sub('\n', '\n        ', jsonString)
-                          if file_out == None:
-                              print(',\n        '+jsonString, end='', flush=True)
-                          else:
-                              out.write(',\n        ')
-                              out.write(jsonString)
-
-            runtime = round(time.time() - start_time, 3)
-            if not directDump:
-                jsonString = "\n    ],\n"
-                jsonString += '    "runtime": ' + str(runtime)
-                jsonString += "\n}\n"
-                if file_out == None:
-                    print(jsonString)
-                else:
-                    out.write(jsonString)
-
-            if file_out != None:
-                out.close()
-            #print("runtime: %s seconds " % (runtime))
+                            transformer_preprocessor=self.model.transformer_preprocessor,
+                            batch_size=batch_size)
+            tag_file(tagger, file_in, output_format, file_out=file_out, 
+                     chunk_size=batch_size * self.nb_workers)
         else:
             raise (OSError('Could not find a model.'))
 
-    def save(self, dir_path='data/models/sequenceLabelling/', weight_file=DEFAULT_WEIGHT_FILE_NAME):
+    def save(self, dir_path='data/models/sequenceLabelling/', weight_file=DEFAULT_WEIGHT_FILE_NAME, 
+             embeddings_snapshot=False, snapshot_top_n=DEFAULT_SNAPSHOT_TOP_WORDS):
+        """
+        Save the model, with its training vocabulary when it uses static embeddings, so that an embeddings 
+        snapshot can be written later with save_embeddings_snapshot(). With embeddings_snapshot, the snapshot 
+        is written now.
+        """
         # create subfolder for the model if not already exists
         directory = os.path.join(dir_path, self.model_config.model_name)
         if not os.path.exists(directory):
@@ -571,6 +552,11 @@ class Sequence(object):
         self.p.save(os.path.join(directory, PROCESSOR_FILE_NAME))
         print('preprocessor saved')
 
+        if self.embeddings is not None and self.training_vocabulary is not None:
+            with open(os.path.join(directory, TRAINING_VOCABULARY_FILE_NAME), 'w', encoding='utf-8') as vocabulary_file:
+                json.dump(self.training_vocabulary, vocabulary_file, ensure_ascii=False)
+            print('training vocabulary saved')
+
         if self.model is None and self.model_config.fold_number > 1:
             print('Error: model not saved. Evaluation need to be called first to select the best fold model to be saved')
         else:
@@ -587,17 +573,51 @@ class Sequence(object):
 
         print('model saved')
 
-    def load(self, dir_path='data/models/sequenceLabelling/', weight_file=DEFAULT_WEIGHT_FILE_NAME):
+        if embeddings_snapshot:
+            self.save_embeddings_snapshot(dir_path, top_n=snapshot_top_n)
+
+    def save_embeddings_snapshot(self, dir_path='data/models/sequenceLabelling/', vocabulary=None, top_n=DEFAULT_SNAPSHOT_TOP_WORDS):
+        """
+        Write next to the model a pruned snapshot of its static embeddings, covering the vocabulary (default 
+        is the training vocabulary, in memory after a training or saved with the model) and the top_n most 
+        frequent words of the embeddings, so that the model can be loaded without the complete embeddings with 
+        load(use_embeddings_snapshot=True)
+        """
+        if self.embeddings is None:
+            print("Error: the model does not use static embeddings, no embeddings snapshot saved")
+            return
+        if vocabulary is None:
+            vocabulary = self.training_vocabulary
+        vocabulary_path = os.path.join(dir_path, self.model_config.model_name, TRAINING_VOCABULARY_FILE_NAME)
+        if vocabulary is None and os.path.isfile(vocabulary_path):
+            with open(vocabulary_path, encoding='utf-8') as vocabulary_file:
+                vocabulary = json.load(vocabulary_file)
+        if vocabulary is None:
+            print("Error: no training vocabulary available, the model must be trained first or a vocabulary provided")
+            return
+        snapshot_path = os.path.join(dir_path, self.model_config.model_name, EMBEDDINGS_SNAPSHOT_DIR_NAME)
+        nb_words = self.embeddings.save_snapshot(snapshot_path, vocabulary, top_n=top_n)
+        print('embeddings snapshot saved for', nb_words, 'words')
+
+    def load(self, dir_path='data/models/sequenceLabelling/', weight_file=DEFAULT_WEIGHT_FILE_NAME, use_embeddings_snapshot=False):
         model_path = os.path.join(dir_path, self.model_config.model_name)
         self.model_config = ModelConfig.load(os.path.join(model_path, CONFIG_FILE_NAME))
 
+        snapshot_path = None
+        if use_embeddings_snapshot:
+            snapshot_path = os.path.join(model_path, EMBEDDINGS_SNAPSHOT_DIR_NAME)
+            if not os.path.isdir(snapshot_path):
+                print("warning: no embeddings snapshot saved with the model, the complete embeddings will be used")
+                snapshot_path = None
+
         if self.model_config.embeddings_name is not None:
             # load embeddings
             # Do not use cache in 'prediction/production' mode
-            self.embeddings = Embeddings(self.model_config.embeddings_name, resource_registry=self.registry, use_ELMo=self.model_config.use_ELMo, use_cache=False)
+            self._set_embeddings(acquire_embeddings(self.model_config.embeddings_name, resource_registry=self.registry, use_ELMo=self.model_config.use_ELMo, use_cache=False,
+                snapshot_path=snapshot_path))
             self.model_config.word_embedding_size = self.embeddings.embed_size
         else:
-            self.embeddings = None
+            self._set_embeddings(None)
             self.model_config.word_embedding_size = 0
 
         self.p = Preprocessor.load(os.path.join(dir_path, self.model_config.model_name, PROCESSOR_FILE_NAME))
@@ -0,0 +1,317 @@
+"""
+Local HTTP inference server with dynamic micro-batching
+
+One or more saved models (sequence labelling or text classification) are served over HTTP. The texts of the
+concurrent requests to a model are coalesced by a MicroBatcher into a single call to the model: a batch is made
+as soon as max_batch_tokens tokens are waiting, or when the oldest waiting request has waited max_wait seconds.
+The model of a batcher is only called by the thread of the batcher.
+
+    python -m delft.serve --sequence-labelling grobid-date-BidLSTM_CRF --classification toxic_gru --port 8080
+
+API (JSON):
+- POST /<model name> {"texts": [...]} (or {"text": "..."}) -> {"model": ..., "results": [...], "runtime": ...}
+  where the results are the "texts" of Sequence.tag(texts, 'json') or the "classifications" of
+  Classifier.predict(texts, 'json')
+- GET /models -> the names of the served models
+- GET /stats -> the number of requests, batches and texts of each model, and the latency percentiles in ms
+"""
+import argparse
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from delft.utilities.Tokenizer import tokenizeBatchSimple
+
+# seconds a request can wait for other requests to be batched with
+DEFAULT_MAX_WAIT = 0.005
+
+DEFAULT_MAX_BATCH_TOKENS = 4096
+
+LATENCY_PERCENTILES = (50, 90, 99)
+
+# number of the most recent requests used for the latency percentiles
+DEFAULT_LATENCY_WINDOW = 10000
+
+
+class MicroBatcher(object):
+    """
+    Coalesce the texts of concurrent calls to submit(texts) into batches given to a batch function
+    process(texts), which returns the list of the results of the texts. A batch holds at most max_batch_tokens
+    tokens, except a single request larger than that.
+    """
+
+    def __init__(self, process, max_wait=DEFAULT_MAX_WAIT, max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS,
+                 latency_window=DEFAULT_LATENCY_WINDOW):
+        if max_batch_tokens <= 0:
+            raise ValueError("The maximum number of tokens of a batch must be positive, got " + str(max_batch_tokens))
+        self.process = process
+        self.max_wait = max_wait
+        self.max_batch_tokens = max_batch_tokens
+        self.latencies = deque(maxlen=latency_window)
+        self.nb_requests = 0
+        self.nb_batches = 0
+        self.nb_texts = 0
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._pending_tokens = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """
+        Return the results of a list of texts, once processed with the texts of the concurrent requests. The
+        error raised by the batch function, if any, is raised again.
+        """
+        request = _Request(texts, int(sum(len(tokens) for tokens in tokenizeBatchSimple(texts))))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The micro-batcher is closed")
+            self._pending.append(request)
+            self._pending_tokens += request.nb_tokens
+            self._condition.notify()
+        request.done.wait()
+        self.latencies.append(time.monotonic() - request.arrival)
+        if request.error is not None:
+            raise request.error
+        return request.results
+
+    def close(self):
+        """
+        Stop the batcher once the requests already submitted are processed
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join()
+
+    def stats(self):
+        latencies = np.asarray(list(self.latencies), dtype=np.float64) * 1000
+        stats = {
+            "requests": self.nb_requests,
+            "batches": self.nb_batches,
+            "texts": self.nb_texts,
+            "mean_batch_texts": self.nb_texts / self.nb_batches if self.nb_batches > 0 else 0.0
+        }
+        for percentile in LATENCY_PERCENTILES:
+            stats["latency_p%d_ms" % percentile] = float(np.percentile(latencies, percentile)) \
+                if len(latencies) > 0 else 0.0
+        return stats
+
+    def _next_batch(self):
+        with self._condition:
+            while len(self._pending) == 0 and not self._closed:
+                self._condition.wait()
+            if len(self._pending) == 0:
+                return None
+            deadline = self._pending[0].arrival + self.max_wait
+            while self._pending_tokens < self.max_batch_tokens and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch = []
+            nb_tokens = 0
+            while len(self._pending) > 0 and \
+                    (len(batch) == 0 or nb_tokens + self._pending[0].nb_tokens <= self.max_batch_tokens):
+                request = self._pending.popleft()
+                nb_tokens += request.nb_tokens
+                batch.append(request)
+            self._pending_tokens -= nb_tokens
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            texts = [text for request in batch for text in request.texts]
+            try:
+                results = self.process(texts) if len(texts) > 0 else []
+                error = None
+            except Exception as e:
+                results = None
+                error = e
+            self.nb_requests += len(batch)
+            self.nb_batches += 1
+            self.nb_texts += len(texts)
+            start = 0
+            for request in batch:
+                if error is None:
+                    request.results = results[start:start + len(request.texts)]
+                    start += len(request.texts)
+                else:
+                    request.error = error
+                request.done.set()
+
+
+class _Request(object):
+
+    def __init__(self, texts, nb_tokens):
+        self.texts = texts
+        self.nb_tokens = nb_tokens
+        self.arrival = time.monotonic()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+def sequence_labelling_process(model):
+    """
+    Batch function of a loaded delft.sequenceLabelling.Sequence
+    """
+    return lambda texts: model.tag(texts, 'json')["texts"]
+
+
+def classification_process(model):
+    """
+    Batch function of a loaded delft.textClassification.Classifier
+    """
+    return lambda texts: model.predict(texts, 'json')["classifications"]
+
+
+class InferenceServer(object):
+    """
+    HTTP server of the models of a dict model name -> MicroBatcher, on a port chosen by the system if port is 0
+    """
+
+    def __init__(self, batchers, host='127.0.0.1', port=8080):
+        self.batchers = batchers
+        self.httpd = ThreadingHTTPServer((host, port), _handler_class(batchers))
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def start(self):
+        """
+        Serve in a background thread, as done for an in-process client
+        """
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+        for batcher in self.batchers.values():
+            batcher.close()
+
+
+def _handler_class(batchers):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == '/models':
+                self._send(200, sorted(batchers.keys()))
+            elif self.path == '/stats':
+                self._send(200, {name: batcher.stats() for name, batcher in batchers.items()})
+            else:
+                self._send(404, {"error": "unknown path " + self.path})
+
+        def do_POST(self):
+            batcher = batchers.get(self.path.strip('/'))
+            if batcher is None:
+                self._send(404, {"error": "unknown model " + self.path.strip('/')})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                query = json.loads(self.rfile.read(length).decode('utf-8'))
+                texts = query["texts"] if "texts" in query else [query["text"]]
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise ValueError("the texts must be a list of strings")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self._send(400, {"error": "invalid query: " + str(e)})
+                return
+            start_time = time.time()
+            try:
+                results = batcher.submit(texts)
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {
+                "model": self.path.strip('/'),
+                "results": results,
+                "runtime": round(time.time() - start_time, 3)
+            })
+
+        def _send(self, status, content):
+            body = json.dumps(content, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # no log line per request
+            pass
+
+    return Handler
+
+
+def load_batchers(sequence_labelling_models=(), classification_models=(), max_wait=DEFAULT_MAX_WAIT,
+                  max_batch_tokens=DEFAULT_MAX_BATCH_TOKENS):
+    """
+    Load saved models by name, return a dict model name -> MicroBatcher
+    """
+    batchers = {}
+    if len(sequence_labelling_models) > 0:
+        from delft.sequenceLabelling import Sequence
+        for model_name in sequence_labelling_models:
+            model = Sequence(model_name)
+            model.load()
+            batchers[model_name] = MicroBatcher(sequence_labelling_process(model), max_wait=max_wait,
+                                                max_batch_tokens=max_batch_tokens)
+    if len(classification_models) > 0:
+        from delft.textClassification import Classifier
+        for model_name in classification_models:
+            model = Classifier(model_name)
+            model.load()
+            batchers[model_name] = MicroBatcher(classification_process(model), max_wait=max_wait,
+                                                max_batch_tokens=max_batch_tokens)
+    return batchers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP inference server of DeLFT models with micro-batching")
+    parser.add_argument("--sequence-labelling", nargs="*", default=[],
+                        help="names of the saved sequence labelling models to serve")
+    parser.add_argument("--classification", nargs="*", default=[],
+                        help="names of the saved text classification models to serve")
+    parser.add_argument("--host", default="127.0.0.1", help="host name or address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--max-wait-ms", type=float, default=DEFAULT_MAX_WAIT * 1000,
+                        help="maximum time in ms a request waits for other requests to be batched with")
+    parser.add_argument("--max-batch-tokens", type=int, default=DEFAULT_MAX_BATCH_TOKENS,
+                        help="maximum number of tokens of the texts of a batch")
+
+    args = parser.parse_args()
+
+    if len(args.sequence_labelling) + len(args.classification) == 0:
+        raise ValueError("At least one model must be given with --sequence-labelling or --classification")
+
+    server = InferenceServer(load_batchers(args.sequence_labelling, args.classification,
+                                           max_wait=args.max_wait_ms / 1000, max_batch_tokens=args.max_batch_tokens),
+                             host=args.host, port=args.port)
+    print("serving", sorted(server.batchers.keys()), "on", server.address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -1 +1,9 @@
-from delft.textClassification.wrapper import Classifier
\ No newline at end of file
+# Classifier is imported on first access, so that the light modules of the package (e.g. reader)
+# can be imported without TensorFlow and transformers
+
+
+def __getattr__(name):
+    if name == "Classifier":
+        from delft.textClassification.wrapper import Classifier
+        return Classifier
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
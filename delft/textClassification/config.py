@@ -69,7 +69,11 @@ class TrainingConfig(object):
                  early_stop=True,
                  use_roc_auc=True,
                  class_weights=None,
-                 multiprocessing=True):
+                 multiprocessing=True,
+                 featurization_cache_dir=None,
+                 use_tf_data=False,
+                 tf_data_cache=None,
+                 shared_memory_batches=False):
 
         self.batch_size = batch_size # this is the batch size for training
         self.optimizer = optimizer
@@ -82,4 +86,14 @@ class TrainingConfig(object):
         self.class_weights = class_weights
         self.multiprocessing = multiprocessing
         self.early_stop = early_stop
+        # directory of the featurized training texts, tokenized once instead of at each epoch,
+        # None to tokenize the texts at each epoch
+        self.featurization_cache_dir = featurization_cache_dir
+        # produce the training batches with a tf.data pipeline instead of the Keras workers, optionally caching
+        # the batches of the first epoch, "memory" or a directory for a cache file
+        self.use_tf_data = use_tf_data
+        self.tf_data_cache = tf_data_cache
+        # optional, with multiprocessing, the worker processes give the batches to the trainer through shared 
+        # memory instead of pickling them, otherwise the Keras worker processes are used
+        self.shared_memory_batches = shared_memory_batches
         
\ No newline at end of file
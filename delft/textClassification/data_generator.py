@@ -2,8 +2,9 @@ import numpy as np
 import tensorflow.keras as keras
 
 from delft.utilities.numpy import shuffle_triple_with_view
-from delft.textClassification.preprocess import to_vector_single
+from delft.textClassification.preprocess import to_vector_batch
 from delft.textClassification.preprocess import create_single_input_bert, create_batch_input_bert
+from delft.textClassification.featurization import featurize_texts
 from delft.utilities.Tokenizer import tokenizeAndFilterSimple
 
 class DataGenerator(keras.utils.Sequence):
@@ -15,7 +16,8 @@ class DataGenerator(keras.utils.Sequence):
     When the Keras input will feed a BERT layer, sentence piece tokenization is kept outside 
     the model so that we can serialize the model and have it more compact.  
     """
-    def __init__(self, x, y, batch_size=256, maxlen=300, list_classes=[], embeddings=(), shuffle=True, bert_data=False, transformer_tokenizer=None):
+    def __init__(self, x, y, batch_size=256, maxlen=300, list_classes=[], embeddings=(), shuffle=True, bert_data=False, transformer_tokenizer=None, 
+                featurization_cache_dir=None):
         self.x = x
         self.y = y
         self.batch_size = batch_size
@@ -25,6 +27,15 @@ class DataGenerator(keras.utils.Sequence):
         self.shuffle = shuffle
         self.bert_data = bert_data
         self.transformer_tokenizer = transformer_tokenizer
+        # with a featurization cache directory, texts are tokenized once for all the epochs, self.order
+        # then gives the indices of the featurized texts in the order of self.x
+        self.featurized = None
+        self.order = None
+        if featurization_cache_dir is not None and self.x is not None:
+            self.featurized = featurize_texts(self.x, self.maxlen, bert_data=self.bert_data, 
+                                              transformer_tokenizer=self.transformer_tokenizer, 
+                                              cache_dir=featurization_cache_dir)
+            self.order = np.arange(len(self.featurized))
         self.on_epoch_end()
 
     def __len__(self):
@@ -56,7 +67,10 @@ class DataGenerator(keras.utils.Sequence):
 
         # other shuffle dataset for next epoch
         if self.shuffle:
-            self.x, self.y, _ = shuffle_triple_with_view(self.x, self.y)
+            if self.featurized is not None:
+                self.order, self.x, self.y = shuffle_triple_with_view(self.order, self.x, self.y)
+            else:
+                self.x, self.y, _ = shuffle_triple_with_view(self.x, self.y)
 
     def __data_generation(self, index):
         """
@@ -64,17 +78,20 @@ class DataGenerator(keras.utils.Sequence):
         """
         max_iter = min(self.batch_size, len(self.x)-self.batch_size*index)
 
-        if not self.bert_data:
-            batch_x = np.zeros((max_iter, self.maxlen, self.embeddings.embed_size), dtype='float32')
         batch_y = None
         if self.y is not None:
             batch_y = np.zeros((max_iter, len(self.list_classes)), dtype='float32')
 
         # Generate data
-        if not self.bert_data:
-            for i in range(0, max_iter):
-                # for input as word embeddings: 
-                batch_x[i] = to_vector_single(self.x[(index*self.batch_size)+i], self.embeddings, self.maxlen)
+        if self.featurized is not None:
+            samples = self.order[(index*self.batch_size):(index*self.batch_size)+max_iter]
+            if not self.bert_data:
+                batch_x = self.embeddings.get_word_vectors(self.featurized.tokens(samples), self.maxlen)
+            else:
+                batch_x = self.featurized.bert_input_ids(samples)
+        elif not self.bert_data:
+            # for input as word embeddings: 
+            batch_x = to_vector_batch(self.x[(index*self.batch_size):(index*self.batch_size)+max_iter], self.embeddings, self.maxlen)
         else:
             # for input as sentence piece token index for BERT layer
             input_ids, input_masks, input_segments = create_batch_input_bert(self.x[(index*self.batch_size):(index*self.batch_size)+max_iter], 
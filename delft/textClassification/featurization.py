@@ -0,0 +1,72 @@
+"""
+Epoch-invariant featurization of text classification corpora
+
+For input as word embeddings, the texts are stored as the ids of their last maxlen tokens (the ones used by
+to_vector_single()) in the vocabulary of the corpus. For input to a transformer layer, the sentence piece
+token indices, padded to maxlen, are stored as a (nb_texts, maxlen) array.
+"""
+import numpy as np
+
+from delft.textClassification.preprocess import clean_text, create_batch_input_bert
+from delft.utilities.Tokenizer import tokenizeAndFilterSimple
+from delft.utilities.featurization_cache import content_hash, compact_int_dtype, range_indices, \
+    encode_token_sequences, decode_vocabulary, load_featurization, save_featurization
+
+# number of texts encoded at once by the transformer tokenizer
+_bert_batch_size = 1024
+
+
+class FeaturizedTexts(object):
+
+    def __init__(self, arrays):
+        self.input_ids = arrays.get("input_ids")
+        if self.input_ids is None:
+            self.offsets = arrays["offsets"]
+            self.token_ids = arrays["token_ids"]
+            self.vocabulary = decode_vocabulary(arrays)
+
+    def __len__(self):
+        if self.input_ids is not None:
+            return self.input_ids.shape[0]
+        return len(self.offsets) - 1
+
+    def tokens(self, samples):
+        samples = np.asarray(samples, dtype=np.int64)
+        starts = self.offsets[samples]
+        lengths = self.offsets[samples + 1] - starts
+        words = [self.vocabulary[token_id] for token_id in self.token_ids[range_indices(starts, lengths)].tolist()]
+        tokens = []
+        start = 0
+        for length in lengths.tolist():
+            tokens.append(words[start:start + length])
+            start += length
+        return tokens
+
+    def bert_input_ids(self, samples):
+        return self.input_ids[samples].astype(np.int32)
+
+
+def featurize_texts(texts, maxlen, bert_data=False, transformer_tokenizer=None, cache_dir=None):
+    """
+    Featurize a list of texts, loading the result from the cache directory if the same texts were already
+    featurized, otherwise storing it there
+    """
+    tokenizer_name = None
+    if bert_data:
+        tokenizer_name = getattr(transformer_tokenizer, "name_or_path", type(transformer_tokenizer).__name__)
+    key = content_hash("text-classification", texts, maxlen, bert_data, tokenizer_name)
+
+    arrays = load_featurization(cache_dir, key)
+    if arrays is None:
+        if bert_data:
+            input_ids = []
+            for start in range(0, len(texts), _bert_batch_size):
+                ids, _, _ = create_batch_input_bert(texts[start:start + _bert_batch_size], maxlen=maxlen,
+                                                    transformer_tokenizer=transformer_tokenizer)
+                input_ids.extend(ids)
+            input_ids = np.asarray(input_ids, dtype=np.int64).reshape((len(texts), maxlen))
+            arrays = {"input_ids": input_ids.astype(compact_int_dtype(int(input_ids.max(initial=0))))}
+        else:
+            arrays, _ = encode_token_sequences(tokenizeAndFilterSimple(clean_text(text))[-maxlen:] for text in texts)
+        save_featurization(cache_dir, key, arrays)
+    return FeaturizedTexts(arrays)
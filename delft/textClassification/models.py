@@ -2,19 +2,22 @@ import math
 import os
 
 import numpy as np
+import tensorflow as tf
 from sklearn.metrics import log_loss, roc_auc_score, r2_score
 from tensorflow.keras.layers import Dense, Input, concatenate
 from tensorflow.keras.layers import GRU, MaxPooling1D, Conv1D, GlobalMaxPool1D, Activation, Add, Flatten
 from tensorflow.keras.layers import LSTM, Bidirectional, Dropout, GlobalAveragePooling1D
 from tensorflow.keras.models import Model
 from tensorflow.keras.optimizers import RMSprop
-from transformers import create_optimizer
 
 from delft.textClassification.data_generator import DataGenerator
 from delft.utilities.Embeddings import load_resource_registry
 
-from delft.utilities.Transformer import Transformer, TRANSFORMER_CONFIG_FILE_NAME, DEFAULT_TRANSFORMER_TOKENIZER_DIR
+from delft.utilities.Transformer import Transformer, TRANSFORMER_CONFIG_FILE_NAME, DEFAULT_TRANSFORMER_TOKENIZER_DIR, \
+    import_transformers
 from delft.utilities.misc import print_parameters
+from delft.utilities.input_pipeline import TrainingDataset
+from delft.utilities.shared_memory_batches import SharedMemoryBatches, shared_memory_supported
 
 architectures = [
     'lstm',
@@ -117,7 +120,10 @@ class BaseModel(object):
                 val_y, 
                 multiprocessing=True, 
                 patience=5,
-                callbacks=None):
+                callbacks=None,
+                use_tf_data=False,
+                tf_data_cache=None,
+                shared_memory_batches=False):
 
         nb_train_steps = (len(val_y) // batch_size) * max_epoch
         self.compile(nb_train_steps)
@@ -132,14 +138,28 @@ class BaseModel(object):
             nb_workers = 0
             multiprocessing = False
 
+        training_data = training_generator
+        fit_options = {"use_multiprocessing": multiprocessing, "workers": nb_workers}
+        training_dataset = None
+        if use_tf_data:
+            # batches are produced by a tf.data pipeline, overlapping with the training, transformer
+            # tokenizers are not shared between parallel calls
+            training_dataset = TrainingDataset(training_generator, cache=tf_data_cache,
+                                               num_parallel_calls=tf.data.AUTOTUNE if nb_workers > 0 else 1)
+            training_data = training_dataset.dataset
+            fit_options = {}
+            callbacks = training_dataset.callbacks + (callbacks or [])
+        elif multiprocessing and shared_memory_batches and shared_memory_supported():
+            # batches are sent by the worker processes through shared memory, in a shuffled order
+            training_data = SharedMemoryBatches(training_generator, nb_workers=nb_workers, shuffle=True)
+            fit_options = {"shuffle": False}
+
         if validation_generator == None:
             # no early stop
             best_loss = self.model.fit(
-                training_generator,
-                use_multiprocessing=multiprocessing,
-                workers=nb_workers,
+                training_data,
                 class_weight=class_weights,
-                epochs=max_epoch, callbacks=callbacks)
+                epochs=max_epoch, callbacks=callbacks, **fit_options)
         else:
             best_weights = None
             current_epoch = 1
@@ -147,11 +167,9 @@ class BaseModel(object):
             while current_epoch <= max_epoch:
 
                 loss = self.model.fit(
-                    training_generator,
-                    use_multiprocessing=multiprocessing,
-                    workers=nb_workers,
+                    training_data,
                     class_weight=class_weights,
-                    epochs=max_epoch, callbacks=callbacks)
+                    epochs=max_epoch, callbacks=callbacks, **fit_options)
 
                 y_pred = self.model.predict(
                     validation_generator, 
@@ -216,6 +234,11 @@ class BaseModel(object):
 
             self.model.set_weights(best_weights)
 
+        if training_dataset is not None:
+            training_dataset.close()
+        if isinstance(training_data, SharedMemoryBatches):
+            training_data.close()
+
     def predict(self, predict_generator, use_main_thread_only=False):
         # default
         nb_workers = 6
@@ -307,17 +330,21 @@ def train_folds(X, y, model_config, training_config, embeddings, models=None, ca
 
         training_generator = DataGenerator(train_x, train_y, batch_size=training_config.batch_size,
             maxlen=model_config.maxlen, list_classes=model_config.list_classes, 
-            embeddings=embeddings, bert_data=bert_data, shuffle=True, transformer_tokenizer=foldModel.transformer_tokenizer)
+            embeddings=embeddings, bert_data=bert_data, shuffle=True, transformer_tokenizer=foldModel.transformer_tokenizer,
+            featurization_cache_dir=training_config.featurization_cache_dir)
 
         validation_generator = None
         if training_config.early_stop:
             validation_generator = DataGenerator(val_x, val_y, batch_size=training_config.batch_size, 
                 maxlen=model_config.maxlen, list_classes=model_config.list_classes, 
-                embeddings=embeddings, bert_data=bert_data, shuffle=False, transformer_tokenizer=foldModel.transformer_tokenizer)
+                embeddings=embeddings, bert_data=bert_data, shuffle=False, transformer_tokenizer=foldModel.transformer_tokenizer,
+                featurization_cache_dir=training_config.featurization_cache_dir)
 
         foldModel.train_model(model_config.list_classes, training_config.batch_size, max_epoch, use_roc_auc, 
                 class_weights, training_generator, validation_generator, val_y, multiprocessing=training_config.multiprocessing, 
-                patience=training_config.patience, callbacks=callbacks)
+                patience=training_config.patience, callbacks=callbacks, use_tf_data=training_config.use_tf_data,
+                tf_data_cache=training_config.tf_data_cache,
+                shared_memory_batches=training_config.shared_memory_batches)
         
         if model_config.transformer_name is None:
             if incremental:
@@ -846,7 +873,7 @@ class bert(BaseModel):
 
     def compile(self, train_size):
         #optimizer = Adam(learning_rate=2e-5, clipnorm=1)
-        optimizer, lr_schedule = create_optimizer(
+        optimizer, lr_schedule = import_transformers().create_optimizer(
                 init_lr=self.training_config.learning_rate,
                 num_train_steps=train_size,
                 weight_decay_rate=0.01,
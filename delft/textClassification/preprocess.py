@@ -1,9 +1,11 @@
 import itertools
+from collections import Counter
 import regex as re
 import numpy as np
 
 from unidecode import unidecode
-from delft.utilities.Tokenizer import tokenizeAndFilterSimple
+from delft.utilities.Tokenizer import tokenizeAndFilterSimple, tokenizeBatchSimple
+from delft.utilities.subtoken_cache import get_subtoken_cache
 
 special_character_removal = re.compile(r'[^A-Za-z\.\-\?\!\,\#\@\% ]',re.IGNORECASE)
 
@@ -27,6 +29,25 @@ def to_vector_single(text, embeddings, maxlen=300):
 
     return x
 
+def to_vector_batch(texts, embeddings, maxlen=300):
+    """
+    Given a batch of strings, tokenize them, then convert them to a (batch, maxlen, dim) 
+    float32 tensor of word embedding vectors with the provided embeddings, as to_vector_single() 
+    for each string, but looking up each distinct token of the batch only once
+    """
+    batch_tokens = tokenizeBatchSimple(map(clean_text, texts))
+    return embeddings.get_word_vectors(batch_tokens, maxlen)
+
+def words_by_frequency(texts):
+    """
+    Return the distinct tokens of a list of strings, tokenized as in to_vector_single(), 
+    by decreasing frequency
+    """
+    counter = Counter()
+    for text in texts:
+        counter.update(tokenizeAndFilterSimple(clean_text(text)))
+    return [word for word, _ in counter.most_common()]
+
 def clean_text(text):
     x_ascii = unidecode(text)
     x_clean = special_character_removal.sub('',x_ascii)
@@ -55,18 +76,47 @@ def create_single_input_bert(text, maxlen=512, transformer_tokenizer=None):
     return ids, masks, segments
 
 def create_batch_input_bert(texts, maxlen=512, transformer_tokenizer=None):
+    """
+    Sub-tokenize a batch of texts for a transformer layer, padded to maxlen. The sub-tokenization of the
+    texts is cached for the tokenizer (see delft.utilities.subtoken_cache), so that the texts are encoded
+    by the tokenizer only once for all the epochs and the repeated predictions.
+    """
     # TBD: exception if tokenizer is not valid/None
 
     if isinstance(texts, np.ndarray):
         texts = texts.tolist()
 
-    encoded_tokens = transformer_tokenizer.batch_encode_plus(texts, add_special_tokens=True, truncation=True, 
-                                                max_length=maxlen, padding='max_length')
+    encoded_texts = get_subtoken_cache(transformer_tokenizer).lookup("text", texts, maxlen,
+        lambda missing: _encode_texts_bert(missing, maxlen, transformer_tokenizer))
 
     # note: special tokens like [CLS] and [SEP] are added by the tokenizer
 
-    ids = encoded_tokens["input_ids"]
-    masks = encoded_tokens["token_type_ids"]
-    segments = encoded_tokens["attention_mask"]
+    ids = []
+    masks = []
+    segments = []
+    for input_ids, token_type_ids, attention_mask in encoded_texts:
+        ids.append(_pad_bert_input(input_ids, maxlen, transformer_tokenizer.pad_token_id, transformer_tokenizer))
+        masks.append(_pad_bert_input(token_type_ids, maxlen, transformer_tokenizer.pad_token_type_id,
+                                     transformer_tokenizer))
+        segments.append(_pad_bert_input(attention_mask, maxlen, 0, transformer_tokenizer))
 
     return ids, masks, segments
+
+def _encode_texts_bert(texts, maxlen, transformer_tokenizer):
+    """
+    Return for each text a (3, nb_sub_tokens) array of the input ids, token type ids and attention mask,
+    truncated at maxlen and not padded
+    """
+    encoded_tokens = transformer_tokenizer.batch_encode_plus(texts, add_special_tokens=True, truncation=True, 
+                                                max_length=maxlen)
+    results = []
+    for i, input_ids in enumerate(encoded_tokens["input_ids"]):
+        token_type_ids = encoded_tokens["token_type_ids"][i] if "token_type_ids" in encoded_tokens else [0] * len(input_ids)
+        results.append(np.asarray([input_ids, token_type_ids, encoded_tokens["attention_mask"][i]], dtype=np.int32))
+    return results
+
+def _pad_bert_input(values, maxlen, pad_value, transformer_tokenizer):
+    padding = [pad_value] * (maxlen - len(values))
+    if transformer_tokenizer.padding_side == "left":
+        return padding + values.tolist()
+    return values.tolist() + padding
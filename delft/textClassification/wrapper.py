@@ -28,23 +28,23 @@ deprecation._PRINT_DEPRECATION_WARNINGS = False
 #disable_eager_execution()
 
 import datetime
+import weakref
 
 from delft.textClassification.config import ModelConfig, TrainingConfig
 from delft.textClassification.models import getModel
 from delft.textClassification.models import train_folds
 from delft.textClassification.models import predict_folds
 from delft.textClassification.data_generator import DataGenerator
+from delft.textClassification.preprocess import words_by_frequency
 
 from delft.utilities.Transformer import Transformer, TRANSFORMER_CONFIG_FILE_NAME, DEFAULT_TRANSFORMER_TOKENIZER_DIR
 
 from delft.utilities.Embeddings import Embeddings, load_resource_registry
+from delft.utilities.shared_embeddings import acquire_embeddings, release_embeddings
 
 from sklearn.metrics import log_loss, roc_auc_score, accuracy_score, f1_score, r2_score, precision_recall_fscore_support
 from sklearn.model_selection import train_test_split
 
-import transformers
-transformers.logging.set_verbosity(transformers.logging.ERROR) 
-
 from tensorflow.keras.utils import plot_model
 
 class Classifier(object):
@@ -75,7 +75,11 @@ class Classifier(object):
                  early_stop=True,
                  class_weights=None,
                  multiprocessing=True,
-                 transformer_name: str=None):
+                 transformer_name: str=None,
+                 featurization_cache_dir=None,
+                 use_tf_data=False,
+                 tf_data_cache=None,
+                 shared_memory_batches=False):
 
         if model_name is None:
             # add a dummy name based on the architecture
@@ -109,7 +113,7 @@ class Classifier(object):
             self.embeddings_name = None
             self.embeddings = None
         elif self.embeddings_name is not None:
-            self.embeddings = Embeddings(self.embeddings_name, resource_registry=self.registry)
+            self._set_embeddings(acquire_embeddings(self.embeddings_name, resource_registry=self.registry))
             word_emb_size = self.embeddings.embed_size
         
         self.model_config = ModelConfig(model_name=model_name, 
@@ -136,9 +140,24 @@ class Classifier(object):
                                               use_roc_auc=use_roc_auc, 
                                               early_stop=early_stop,
                                               class_weights=class_weights, 
-                                              multiprocessing=multiprocessing)
+                                              multiprocessing=multiprocessing,
+                                              featurization_cache_dir=featurization_cache_dir,
+                                              use_tf_data=use_tf_data,
+                                              tf_data_cache=tf_data_cache,
+                                              shared_memory_batches=shared_memory_batches)
+
+    def _set_embeddings(self, embeddings):
+        # the embeddings are shared with the other models of the process (see shared_embeddings), the
+        # previous embeddings are released, and these ones when the model is garbage collected
+        if getattr(self, '_embeddings_finalizer', None) is not None:
+            self._embeddings_finalizer()
+        self.embeddings = embeddings
+        self._embeddings_finalizer = None
+        if embeddings is not None:
+            self._embeddings_finalizer = weakref.finalize(self, release_embeddings, embeddings)
 
     def train(self, x_train, y_train, vocab_init=None, incremental=False, callbacks=None):
+        self.warm_embeddings_cache(x_train)
 
         if incremental:
             if self.model == None and self.models == None:
@@ -161,16 +180,19 @@ class Classifier(object):
 
             training_generator = DataGenerator(xtr, y, batch_size=self.training_config.batch_size, 
                 maxlen=self.model_config.maxlen, list_classes=self.model_config.list_classes, 
-                embeddings=self.embeddings, shuffle=True, bert_data=bert_data, transformer_tokenizer=self.model.transformer_tokenizer)
+                embeddings=self.embeddings, shuffle=True, bert_data=bert_data, transformer_tokenizer=self.model.transformer_tokenizer,
+                featurization_cache_dir=self.training_config.featurization_cache_dir)
             validation_generator = DataGenerator(val_x, None, batch_size=self.training_config.batch_size, 
                 maxlen=self.model_config.maxlen, list_classes=self.model_config.list_classes, 
-                embeddings=self.embeddings, shuffle=False, bert_data=bert_data, transformer_tokenizer=self.model.transformer_tokenizer)
+                embeddings=self.embeddings, shuffle=False, bert_data=bert_data, transformer_tokenizer=self.model.transformer_tokenizer,
+                featurization_cache_dir=self.training_config.featurization_cache_dir)
         else:
             val_y = y_train
 
             training_generator = DataGenerator(x_train, y_train, batch_size=self.training_config.batch_size, 
                 maxlen=self.model_config.maxlen, list_classes=self.model_config.list_classes, 
-                embeddings=self.embeddings, shuffle=True, bert_data=bert_data, transformer_tokenizer=self.model.transformer_tokenizer)
+                embeddings=self.embeddings, shuffle=True, bert_data=bert_data, transformer_tokenizer=self.model.transformer_tokenizer,
+                featurization_cache_dir=self.training_config.featurization_cache_dir)
             validation_generator = None
 
 
@@ -191,10 +213,15 @@ class Classifier(object):
             val_y, 
             patience=self.training_config.patience, 
             multiprocessing=self.training_config.multiprocessing, 
-            callbacks=callbacks)
+            callbacks=callbacks,
+            use_tf_data=self.training_config.use_tf_data,
+            tf_data_cache=self.training_config.tf_data_cache,
+            shared_memory_batches=self.training_config.shared_memory_batches)
 
 
     def train_nfold(self, x_train, y_train, vocab_init=None, incremental=False, callbacks=None):
+        self.warm_embeddings_cache(x_train)
+
         if incremental:
             if self.models == None:
                 print("error: you must load a model first for an incremental training")
@@ -205,21 +232,32 @@ class Classifier(object):
             self.models = train_folds(x_train, y_train, self.model_config, self.training_config, self.embeddings, None, callbacks=callbacks)
 
 
+    def warm_embeddings_cache(self, texts):
+        """
+        Pre-load the word vector cache of the embeddings, if enabled, with the most frequent tokens of texts
+        """
+        if self.embeddings is not None and self.embeddings.cache is not None:
+            nb_words = self.embeddings.warm_cache(words_by_frequency(texts))
+            print("word vector cache warmed with", nb_words, "words")
+
     def predict(self, texts, output_format='json', use_main_thread_only=False, batch_size=None):
+        # predict() is reentrant: the model config is not modified (batch_size only applies to 
+        # this call), so several threads can predict at the same time with the same loaded model
         bert_data = False
         if self.transformer_name != None:
             bert_data = True
 
         if batch_size != None:
-            self.model_config.batch_size = batch_size
             print("---")
-            print("batch_size (prediction):", self.model_config.batch_size)
+            print("batch_size (prediction):", batch_size)
             print("---")
+        else:
+            batch_size = self.model_config.batch_size
 
         if self.model_config.fold_number == 1:
             if self.model != None: 
                 
-                predict_generator = DataGenerator(texts, None, batch_size=self.model_config.batch_size, 
+                predict_generator = DataGenerator(texts, None, batch_size=batch_size, 
                     maxlen=self.model_config.maxlen, list_classes=self.model_config.list_classes, 
                     embeddings=self.embeddings, shuffle=False, bert_data=bert_data, transformer_tokenizer=self.model.transformer_tokenizer)
 
@@ -230,7 +268,7 @@ class Classifier(object):
             if self.models != None: 
 
                 # just a warning: n classifiers using BERT layer for prediction might be heavy in term of model sizes 
-                predict_generator = DataGenerator(texts, None, batch_size=self.model_config.batch_size, 
+                predict_generator = DataGenerator(texts, None, batch_size=batch_size, 
                     maxlen=self.model_config.maxlen, list_classes=self.model_config.list_classes, 
                     embeddings=self.embeddings, shuffle=False, bert_data=bert_data, transformer_tokenizer=self.model.transformer_tokenizer)
 
@@ -462,11 +500,11 @@ class Classifier(object):
         if self.model_config.transformer_name is None:
             # load embeddings
             # Do not use cache in 'production' mode
-            self.embeddings = Embeddings(self.model_config.embeddings_name, resource_registry=self.registry, use_cache=False)
+            self._set_embeddings(acquire_embeddings(self.model_config.embeddings_name, resource_registry=self.registry, use_cache=False))
             self.model_config.word_embedding_size = self.embeddings.embed_size
         else:
             self.transformer_name = self.model_config.transformer_name
-            self.embeddings = None
+            self._set_embeddings(None)
 
         self.model = getModel(self.model_config, 
                               self.training_config, 
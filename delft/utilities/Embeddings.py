@@ -2,6 +2,7 @@
 import gzip
 import hashlib
 import io
+import itertools
 import logging
 import mmap
 import os
@@ -10,16 +11,14 @@ import shutil
 import ntpath
 import struct
 import sys
+import threading
 import zipfile
 import json
 import lmdb
 import numpy as np
-import tensorflow as tf
 from tqdm import tqdm
 from pathlib import Path
 
-from delft.utilities.simple_elmo import ElmoModel, elmo
-
 logging.basicConfig()
 logging.getLogger().setLevel(logging.ERROR)
 
@@ -31,6 +30,12 @@ except ImportError as e:
     fasttext_support = False
 
 from delft.utilities.Utilities import download_file
+from delft.utilities.embeddings_cache import WordVectorCache
+from delft.utilities.embeddings_lmdb import LMDB_FORMAT_VERSION, LMDB_META_KEY, serialize_raw, deserialize_raw, \
+    read_lmdb_meta, read_lmdb_progress, write_lmdb_meta, compile_embeddings_lmdb
+from delft.utilities.embeddings_quantization import DEFAULT_STORAGE_DTYPE, STORAGE_DTYPES, check_storage_dtype, \
+    store_name, decode_vectors
+from delft.utilities.embeddings_matrix import EmbeddingsMatrix, build_embeddings_matrix
 
 # for ELMo embeddings
 #from delft.utilities.bilm.data import Batcher
@@ -48,6 +53,21 @@ map_size = 100 * 1024 * 1024 * 1024
 # dim of ELMo embeddings (2 times the dim of the LSTM for LM)
 ELMo_embed_size = 1024
 
+# storage backends for static embeddings, selected with the attribute "embedding-backend" of the resource registry
+# - lmdb: the embeddings are compiled in a LMDB database under "embedding-lmdb-path" (default)
+# - memmap: the embeddings are compiled in a dense memory-mapped matrix under "embedding-memmap-path"
+# - memory: the embeddings are loaded in memory (also used when "embedding-lmdb-path" is "None")
+BACKEND_LMDB = "lmdb"
+BACKEND_MEMMAP = "memmap"
+BACKEND_MEMORY = "memory"
+
+DEFAULT_EMBEDDING_MEMMAP_PATH = "data/db/matrix"
+
+# default number of most frequent words of the embeddings added to the snapshots saved with a model
+DEFAULT_SNAPSHOT_TOP_WORDS = 20000
+_snapshot_batch_size = 10000
+
+
 class Embeddings(object):
 
     def __init__(self, name,
@@ -57,7 +77,8 @@ class Embeddings(object):
         use_ELMo=False,
         use_cache=True,
         load=True,
-        elmo_model_name=None):
+        elmo_model_name=None,
+        snapshot_path=None):
 
         self.name = name
         self.embed_size = 0
@@ -70,10 +91,35 @@ class Embeddings(object):
         self.embedding_lmdb_path = None
         if self.registry is not None and "embedding-lmdb-path" in self.registry:
             self.embedding_lmdb_path = self.registry["embedding-lmdb-path"]
+        self.backend = BACKEND_LMDB
+        if self.registry is not None and "embedding-backend" in self.registry:
+            self.backend = self.registry["embedding-backend"]
+        self.embedding_memmap_path = DEFAULT_EMBEDDING_MEMMAP_PATH
+        if self.registry is not None and "embedding-memmap-path" in self.registry:
+            self.embedding_memmap_path = self.registry["embedding-memmap-path"]
+        # storage dtype of the compiled embeddings, see embeddings_quantization
+        self.storage_dtype = DEFAULT_STORAGE_DTYPE
+        if self.registry is not None and "embedding-dtype" in self.registry:
+            self.storage_dtype = self.registry["embedding-dtype"]
+        check_storage_dtype(self.storage_dtype)
+        # storage dtype of the vectors of the opened LMDB database, None for a legacy database with pickled vectors
+        self.lmdb_value_dtype = None
         self.env = None
-        if load:
+        self.matrix = None
+        self.cache = None
+        if snapshot_path is not None:
+            # pruned embeddings saved with a model, see save_snapshot()
+            self.make_embeddings_from_snapshot(snapshot_path)
+        elif load:
             self.make_embeddings_simple(name)
         self.static_embed_size = self.embed_size
+
+        # optional LRU cache of word vectors in front of the LMDB database
+        cache_size = 0
+        if self.registry is not None and "embedding-cache-size" in self.registry:
+            cache_size = int(self.registry["embedding-cache-size"])
+        if cache_size > 0 and self.env is not None and self.extension != 'bin':
+            self.cache = WordVectorCache(cache_size, self.static_embed_size)
         self.elmo_model = None
 
         self.use_cache = use_cache
@@ -85,7 +131,8 @@ class Embeddings(object):
             self.elmo_model_name = 'elmo-'+self.lang
         if use_ELMo:
             #tf.compat.v1.disable_eager_execution()
-            self.make_ELMo()
+            # the ELMo model, its TensorFlow graph and session are created at the first use of ELMo, 
+            # see _ensure_ELMo()
             self.embed_size = ELMo_embed_size + self.embed_size
             description = self.get_description(self.elmo_model_name)
             self.env_ELMo = None
@@ -158,71 +205,18 @@ class Embeddings(object):
         self.clean_downloads()
 
     def load_embeddings_from_file(self, embeddings_path):
-        begin = True
-        nbWords = 0
-        txn = self.env.begin(write=True)
-        # batch_size = 1024
-        i = 0
-        nb_lines = 0
-
-        # read number of lines first
         embedding_file = open_embedding_file(embeddings_path)
         if embedding_file is None:
             print("Error: could not open embeddings file", embeddings_path)
             return
 
-        for line in embedding_file:
-            nb_lines += 1
-        embedding_file.close()
-
-        embedding_file = open_embedding_file(embeddings_path)
-        #with open(embeddings_path, encoding='utf8') as f:
-        for line in tqdm(embedding_file, total=nb_lines):
-            line = line.decode()
-            line = line.split(' ')
-            if begin:
-                begin = False
-                nb_words, embed_size = _fetch_header_if_available(line)
-
-                if nb_words > 0 and embed_size > 0:
-                    nbWords = nb_words
-                    self.embed_size = embed_size
-                    continue
-
-            word = line[0]
-            try:
-                if line[len(line)-1] == '\n':
-                    vector = np.array([float(val) for val in line[1:len(line)-1]], dtype='float32')
-                else:
-                    vector = np.array([float(val) for val in line[1:len(line)]], dtype='float32')
-
-                #vector = np.array([float(val) for val in line[1:len(line)]], dtype='float32')
-            except:
-                print(len(line))
-                print(line[1:len(line)])
-            #else:
-            #    vector = np.array([float(val) for val in line[1:len(line)-1]], dtype='float32')
-            if self.embed_size == 0:
-                self.embed_size = len(vector)
-
-            if len(word.encode(encoding='UTF-8')) < self.env.max_key_size():
-                txn.put(word.encode(encoding='UTF-8'), _serialize_pickle(vector))
-                #txn.put(word.encode(encoding='UTF-8'), _serialize_byteio(vector))
-                i += 1
-
-            # commit batch
-            # if i % batch_size == 0:
-            #     txn.commit()
-            #     txn = self.env.begin(write=True)
-
+        nb_words, embed_size = compile_embeddings_lmdb(self.env, embedding_file, dtype=self.storage_dtype)
         embedding_file.close()
 
-        #if i % batch_size != 0:
-        txn.commit()
-        if nbWords == 0:
-            nbWords = i
-        self.vocab_size = nbWords
-        print('embeddings loaded for', nbWords, "words and", self.embed_size, "dimensions")
+        self.embed_size = embed_size
+        self.vocab_size = nb_words
+        self.lmdb_value_dtype = self.storage_dtype
+        print('embeddings loaded for', nb_words, "words and", self.embed_size, "dimensions")
 
     def clean_downloads(self):
         # cleaning possible downloaded embeddings
@@ -252,7 +246,10 @@ class Embeddings(object):
                 else:
                     raise ValueError('Go to the documentation to get more information on how to install FastText .bin support')
 
-        elif self.embedding_lmdb_path is None or self.embedding_lmdb_path == "None":
+        elif self.backend == BACKEND_MEMMAP:
+            self.make_embeddings_memmap(name)
+
+        elif self.backend == BACKEND_MEMORY or self.embedding_lmdb_path is None or self.embedding_lmdb_path == "None":
             print("embedding_lmdb_path is not specified in the embeddings registry, so the embeddings will be loaded in memory...")
             embeddings_path = None
             if "path" in description:
@@ -271,7 +268,7 @@ class Embeddings(object):
                     os.makedirs(self.embedding_lmdb_path)
 
             # check if the lmdb database exists
-            envFilePath = os.path.join(self.embedding_lmdb_path, name)
+            envFilePath = os.path.join(self.embedding_lmdb_path, store_name(name, self.storage_dtype))
             load_db = True
             if os.path.isdir(envFilePath):
                 description = self.get_description(name)
@@ -283,17 +280,29 @@ class Embeddings(object):
                 if self.env:
                     # we need to set self.embed_size and self.vocab_size
                     with self.env.begin() as txn:
+                        meta = read_lmdb_meta(txn)
+                        progress = read_lmdb_progress(txn)
                         stats = txn.stat()
                         size = stats['entries']
                         self.vocab_size = size
 
-                    with self.env.begin() as txn:
-                        cursor = txn.cursor()
-                        for key, value in cursor:
-                            vector = _deserialize_pickle(value)
-                            self.embed_size = vector.shape[0]
-                            break
-                        cursor.close()
+                    if progress is not None:
+                        # interrupted compilation, it will be resumed
+                        self.vocab_size = 0
+                    elif meta is not None:
+                        self.vocab_size = meta["vocab_size"]
+                        self.embed_size = meta["embed_size"]
+                        self.lmdb_value_dtype = meta["dtype"]
+                    else:
+                        print("warning: embeddings database", envFilePath, "uses the legacy pickle layout, convert it with:",
+                            "python -m delft.utilities.Embeddings convert --embedding", name)
+                        with self.env.begin() as txn:
+                            cursor = txn.cursor()
+                            for key, value in cursor:
+                                vector = _deserialize_pickle(value)
+                                self.embed_size = vector.shape[0]
+                                break
+                            cursor.close()
 
                     if self.vocab_size > 100 and self.embed_size > 10:
                         # lmdb database exists and looks valid
@@ -306,10 +315,96 @@ class Embeddings(object):
                         self.env = lmdb.open(envFilePath, readonly=True, max_readers=2048, max_spare_txns=2)
 
             if load_db:
+                if self.env is not None:
+                    self.env.close()
                 # create and load the database in write mode
                 self.env = lmdb.open(envFilePath, map_size=map_size)
                 self.make_embeddings_lmdb(name)
 
+    def make_embeddings_memmap(self, name="fasttext-crawl"):
+        """
+        Open the dense memory-mapped matrix of the embeddings, compiling it first from the embeddings
+        file if not already done
+        """
+        description = self.get_description(name)
+        if description is None:
+            raise ValueError("No description found in embeddings registry for embeddings " + name)
+        self.lang = description["lang"]
+
+        matrix_path = os.path.join(self.embedding_memmap_path, store_name(name, self.storage_dtype))
+        if not EmbeddingsMatrix.exists(matrix_path):
+            print('\nCompiling embeddings matrix... (this is done only one time per embeddings at first usage)')
+            # the following method will possibly download the embedding file if not available locally
+            embeddings_path = self.get_embedding_path(description)
+            if embeddings_path is None:
+                raise ValueError("Could not locate a usable resource for embeddings " + name)
+            nb_words, embed_size = build_embeddings_matrix(tqdm(read_word_vectors(embeddings_path)), matrix_path, name=name,
+                                                           dtype=self.storage_dtype)
+            print('embeddings compiled for', nb_words, "words and", embed_size, "dimensions")
+            self.clean_downloads()
+
+        self.matrix = EmbeddingsMatrix(matrix_path)
+        self.embed_size = self.matrix.embed_size
+        self.vocab_size = self.matrix.vocab_size
+
+    def make_embeddings_from_snapshot(self, path):
+        """
+        Open a pruned snapshot of the embeddings saved with save_snapshot(), the words not in the snapshot
+        are handled as unknown words
+        """
+        if not EmbeddingsMatrix.exists(path):
+            raise ValueError("No embeddings snapshot found at " + path)
+        self.matrix = EmbeddingsMatrix(path)
+        self.embed_size = self.matrix.embed_size
+        self.vocab_size = self.matrix.vocab_size
+        self.storage_dtype = self.matrix.dtype
+        print("embeddings snapshot loaded for", self.vocab_size, "words and", self.embed_size, "dimensions")
+
+    def save_snapshot(self, path, words, top_n=DEFAULT_SNAPSHOT_TOP_WORDS):
+        """
+        Write a pruned snapshot of the static embeddings as an embeddings matrix, covering the given words 
+        (typically the training vocabulary of a model) and the top_n most frequent words of the embeddings. 
+        Words without vector are left out, so lookups with the snapshot give the same vectors as with the 
+        complete embeddings for all the covered words. Return the number of words in the snapshot.
+        """
+        words = list(words) + self.get_top_words(top_n)
+        if (self.name == 'wiki.fr') or (self.name == 'wiki.fr.bin'):
+            # the pre-trained embeddings are not cased
+            words = [word.lower() for word in words]
+        # remove duplicates, keeping the order
+        words = list(dict.fromkeys(words))
+
+        def known_word_vectors():
+            for start in range(0, len(words), _snapshot_batch_size):
+                batch_words = words[start:start+_snapshot_batch_size]
+                vectors = self._get_unique_word_vectors(batch_words)
+                for word, vector in zip(batch_words, vectors):
+                    if vector.any():
+                        yield word, vector
+
+        nb_words, _ = build_embeddings_matrix(known_word_vectors(), path, name=self.name, dtype=self.storage_dtype)
+        return nb_words
+
+    def get_top_words(self, n):
+        """
+        Return the n first words of the embeddings, embeddings files being usually sorted by decreasing 
+        word frequency
+        """
+        if n <= 0:
+            return []
+        if self.matrix is not None:
+            return [self.matrix.get_word(row) for row in range(min(n, self.matrix.vocab_size))]
+        if self.extension == 'bin':
+            return list(self.model.get_words()[:n])
+        if self.env is None:
+            return list(itertools.islice(self.model.keys(), n))
+        # the LMDB database is sorted by words, the embeddings file gives the frequency order
+        description = self.get_description(self.name)
+        if description is not None and "path" in description and os.path.isfile(description["path"]):
+            return [word for word, _ in itertools.islice(read_word_vectors(description["path"]), n)]
+        print("warning: the embeddings file of", self.name, "is not available, no frequent words can be added")
+        return []
+
     def make_ELMo(self):
         # Location of pretrained BiLM for the specified language
         description = self.get_description(self.elmo_model_name)
@@ -324,6 +419,10 @@ class Embeddings(object):
                 logging.error("fail to find ELMo model path for " + self.elmo_model_name)
                 return
 
+            # TensorFlow is only needed for ELMo, it is imported here to keep the import of the embeddings fast
+            import tensorflow as tf
+            from delft.utilities.simple_elmo import ElmoModel, elmo
+
             graph = tf.Graph()
             with graph.as_default() as elmo_graph:
                 self.elmo_model = ElmoModel()
@@ -341,6 +440,10 @@ class Embeddings(object):
                     self.elmo_model.elmo_sentence_input = elmo.weight_layers("input", self.elmo_model.sentence_embeddings_op)
                     sess.run(tf.compat.v1.global_variables_initializer())
 
+    def _ensure_ELMo(self):
+        if self.elmo_model is None:
+            self.make_ELMo()
+
     def get_description(self, name):
         for emb in self.registry["embeddings"]:
             if emb["name"] == name:
@@ -360,15 +463,29 @@ class Embeddings(object):
         if (self.name == 'wiki.fr') or (self.name == 'wiki.fr.bin'):
             # the pre-trained embeddings are not cased
             word = word.lower()
+        if self.matrix is not None:
+            word_vector = self.matrix.get_word_vector(word)
+            if word_vector is None:
+                word_vector = np.zeros((self.static_embed_size,), dtype=np.float32)
+            return word_vector
         if self.env is None or self.extension == 'bin':
             # db not available or embeddings in bin format, the embeddings should be available in memory (normally!)
             return self.get_word_vector_in_memory(word)
+        if self.cache is not None:
+            word_vector = self.cache.get(word)
+            if word_vector is not None:
+                return word_vector
         try:
             with self.env.begin() as txn:
                 vector = txn.get(word.encode(encoding='UTF-8'))
                 if vector:
-                    word_vector = _deserialize_pickle(vector)
+                    word_vector = self._decode_vector(vector)
                     vector = None
+                    if self.cache is not None:
+                        self.cache.put(word, word_vector)
+                elif self.cache is not None:
+                    # the shared zero vector of the cache is used for OOV
+                    word_vector = self.cache.put(word, None)
                 else:
                     word_vector = np.zeros((self.static_embed_size,), dtype=np.float32)
                     # alternatively, initialize with random negative values
@@ -379,11 +496,164 @@ class Embeddings(object):
             # mdb_txn_begin: MDB_BAD_RSLOT: Invalid reuse of reader locktable slot
             # when opening new transaction !
             self.env.close()
-            envFilePath = os.path.join(self.embedding_lmdb_path, self.name)
+            envFilePath = os.path.join(self.embedding_lmdb_path, store_name(self.name, self.storage_dtype))
             self.env = lmdb.open(envFilePath, readonly=True, max_readers=2048, max_spare_txns=2, lock=False)
             return self.get_word_vector(word)
         return word_vector
 
+    def get_word_vectors(self, token_lists, maxlen):
+        """
+            Get static embeddings for a batch of token sequences as a float32 tensor of shape
+            (batch, maxlen, static_embed_size), zero-padded. The distinct tokens of the batch are resolved
+            only once, with a single gather for the memory-mapped matrix and a single read transaction for LMDB.
+            As for get_word_vector, unknown tokens are represented by a vector filled with 0.0
+        """
+        batch = np.zeros((len(token_lists), maxlen, self.static_embed_size), dtype=np.float32)
+
+        # index the distinct tokens of the batch
+        token_indices = {}
+        positions_batch = []
+        positions_sequence = []
+        positions_token = []
+        for i, tokens in enumerate(token_lists):
+            window = tokens[-maxlen:]
+            for j, token in enumerate(window):
+                index = token_indices.get(token)
+                if index is None:
+                    index = len(token_indices)
+                    token_indices[token] = index
+                positions_batch.append(i)
+                positions_sequence.append(j)
+                positions_token.append(index)
+
+        if len(token_indices) == 0:
+            return batch
+
+        unique_vectors = self._get_unique_word_vectors(list(token_indices.keys()))
+        batch[positions_batch, positions_sequence] = unique_vectors[positions_token]
+        return batch
+
+    def _get_unique_word_vectors(self, words):
+        """
+            Return a (len(words), static_embed_size) float32 array with the static embeddings of a list
+            of distinct words
+        """
+        if (self.name == 'wiki.fr') or (self.name == 'wiki.fr.bin'):
+            # the pre-trained embeddings are not cased
+            words = [word.lower() for word in words]
+
+        vectors = np.zeros((len(words), self.static_embed_size), dtype=np.float32)
+        if self.matrix is not None:
+            rows = self.matrix.get_rows(words)
+            known = rows != -1
+            if known.any():
+                vectors[known] = self.matrix.get_vectors(rows[known])
+        elif self.env is None or self.extension == 'bin':
+            for i, word in enumerate(words):
+                vectors[i] = self.get_word_vector_in_memory(word)
+        else:
+            missing = range(len(words))
+            if self.cache is not None:
+                missing = []
+                for i, word in enumerate(words):
+                    word_vector = self.cache.get(word)
+                    if word_vector is None:
+                        missing.append(i)
+                    else:
+                        vectors[i] = word_vector
+            found = []
+            values = []
+            try:
+                with self.env.begin() as txn:
+                    for i in missing:
+                        value = txn.get(words[i].encode(encoding='UTF-8'))
+                        if value:
+                            found.append(i)
+                            values.append(value)
+                        elif self.cache is not None:
+                            self.cache.put(words[i], None)
+            except lmdb.Error:
+                # see get_word_vector(), we need to close and reopen the environment to avoid
+                # mdb_txn_begin: MDB_BAD_RSLOT: Invalid reuse of reader locktable slot
+                self.env.close()
+                envFilePath = os.path.join(self.embedding_lmdb_path, store_name(self.name, self.storage_dtype))
+                self.env = lmdb.open(envFilePath, readonly=True, max_readers=2048, max_spare_txns=2, lock=False)
+                return self._get_unique_word_vectors(words)
+
+            if len(found) > 0:
+                # stored vectors are decoded (and dequantized) in one go
+                found_vectors = self._decode_vectors(values)
+                vectors[found] = found_vectors
+                if self.cache is not None:
+                    for j, i in enumerate(found):
+                        self.cache.put(words[i], found_vectors[j].copy())
+        return vectors
+
+    def reopen_after_fork(self):
+        """
+            Open a new reader of the LMDB database in a forked process: an LMDB environment must not be used
+            across a fork (the MDB_BAD_RSLOT errors worked around in get_word_vector()). Closing the inherited
+            environment only releases the reader slots of the current process, not the ones of the parent.
+        """
+        if self.env is None or self.extension == 'bin':
+            return
+        self.env.close()
+        envFilePath = os.path.join(self.embedding_lmdb_path, store_name(self.name, self.storage_dtype))
+        self.env = lmdb.open(envFilePath, readonly=True, max_readers=2048, max_spare_txns=2, lock=False)
+
+    def close(self):
+        """
+            Close the LMDB database or the memory-mapped matrix of the embeddings, or free the embeddings
+            loaded in memory, see shared_embeddings
+        """
+        if self.env is not None:
+            self.env.close()
+            self.env = None
+        if self.matrix is not None:
+            self.matrix.close()
+            self.matrix = None
+        if self.cache is not None:
+            self.cache.clear()
+        self.model = {}
+
+    def warm_cache(self, words):
+        """
+            Pre-load the word vector cache with a list of words, typically the training vocabulary sorted 
+            by decreasing frequency, until the cache is full. Return the number of words added to the cache.
+        """
+        if self.cache is None:
+            return 0
+        nb_words = 0
+        with self.env.begin() as txn:
+            for word in words:
+                if self.cache.is_full():
+                    break
+                if (self.name == 'wiki.fr') or (self.name == 'wiki.fr.bin'):
+                    word = word.lower()
+                if word in self.cache:
+                    continue
+                vector = txn.get(word.encode(encoding='UTF-8'))
+                self.cache.put(word, self._decode_vector(vector) if vector else None)
+                nb_words += 1
+        return nb_words
+
+    def _decode_vector(self, value):
+        """
+            Decode a vector stored in the LMDB database, raw bytes are read without copy 
+            when stored as float32
+        """
+        if self.lmdb_value_dtype is None:
+            return _deserialize_pickle(value)
+        return deserialize_raw(value, self.lmdb_value_dtype)
+
+    def _decode_vectors(self, values):
+        """
+            Decode a list of vectors stored in the LMDB database as a float32 matrix
+        """
+        if self.lmdb_value_dtype is None:
+            return np.stack([_deserialize_pickle(value) for value in values])
+        return decode_vectors(b''.join(values), self.lmdb_value_dtype, self.static_embed_size)
+
     def get_word_vector_in_memory(self, word):
         if (self.name == 'wiki.fr') or (self.name == 'wiki.fr.bin'):
             # the pre-trained embeddings are not cased
@@ -557,6 +827,7 @@ class Embeddings(object):
         if not self.use_ELMo:
             print("Warning: ELMo embeddings requested but embeddings object wrongly initialised")
             return
+        self._ensure_ELMo()
 
         # Create batches of data
         local_token_ids = self.elmo_model.batcher.batch_sentences(token_list)
@@ -581,6 +852,7 @@ class Embeddings(object):
         if not self.use_ELMo:
             print("Warning: ELMo embeddings requested but embeddings object wrongly initialised")
             return
+        self._ensure_ELMo()
 
         local_token_ids = self.elmo_model.batcher.batch_sentences(token_list)
         max_size_sentence = local_token_ids[0].shape[0]
@@ -689,6 +961,71 @@ def _serialize_pickle(a):
 def _deserialize_pickle(serialized):
     return pickle.loads(serialized)
 
+
+def convert_lmdb_embeddings(env_path, dtype=DEFAULT_STORAGE_DTYPE, batch_size=100000, target_path=None):
+    """
+    Convert an embeddings LMDB database to the raw vector layout with the given storage dtype, e.g. a legacy 
+    database with pickled vectors. The vectors are copied into a new database by batches of write transactions, 
+    which then replaces the original one, or is moved to target_path if provided. Return the number of 
+    converted vectors.
+    """
+    check_storage_dtype(dtype)
+    env_path = env_path.rstrip(os.sep)
+    if target_path is not None:
+        target_path = target_path.rstrip(os.sep)
+    in_place = target_path is None or target_path == env_path
+    source_env = lmdb.open(env_path, readonly=True, lock=False)
+    with source_env.begin() as txn:
+        meta = read_lmdb_meta(txn)
+    if in_place and meta is not None and meta["format_version"] == LMDB_FORMAT_VERSION and meta["dtype"] == dtype:
+        print("embeddings database", env_path, "is already stored as", dtype)
+        source_env.close()
+        return 0
+
+    converted_path = (env_path if in_place else target_path) + ".converting"
+    if os.path.isdir(converted_path):
+        shutil.rmtree(converted_path)
+    target_env = lmdb.open(converted_path, map_size=map_size)
+
+    nb_words = 0
+    embed_size = 0
+    with source_env.begin() as source_txn:
+        target_txn = target_env.begin(write=True)
+        cursor = source_txn.cursor()
+        for key, value in tqdm(cursor, total=source_txn.stat()['entries']):
+            if key == LMDB_META_KEY:
+                continue
+            if meta is None:
+                vector = _deserialize_pickle(value)
+            else:
+                vector = deserialize_raw(value, meta["dtype"])
+            embed_size = vector.shape[0]
+            target_txn.put(key, serialize_raw(vector, dtype))
+            nb_words += 1
+            if nb_words % batch_size == 0:
+                target_txn.commit()
+                target_txn = target_env.begin(write=True)
+        cursor.close()
+        # the metadata key is written last, a database without it is never used as a raw database
+        write_lmdb_meta(target_txn, dtype, embed_size, nb_words)
+        target_txn.commit()
+    target_env.close()
+    source_env.close()
+
+    if not in_place:
+        if os.path.isdir(target_path):
+            shutil.rmtree(target_path)
+        os.rename(converted_path, target_path)
+        print("embeddings database", env_path, "converted into", target_path, "for", nb_words, "words and", embed_size, "dimensions stored as", dtype)
+        return nb_words
+
+    previous_path = env_path + ".previous"
+    os.rename(env_path, previous_path)
+    os.rename(converted_path, env_path)
+    shutil.rmtree(previous_path)
+    print("embeddings database", env_path, "converted for", nb_words, "words and", embed_size, "dimensions stored as", dtype)
+    return nb_words
+
 def open_embedding_file(embeddings_path):
     # embeddings can be uncompressed or compressed with gzip or zip
     if embeddings_path.endswith(".gz"):
@@ -703,6 +1040,33 @@ def open_embedding_file(embeddings_path):
         embedding_file = open(embeddings_path, mode="rb")
     return embedding_file
 
+def read_word_vectors(embeddings_path):
+    """
+    Iterate over the (word, vector) pairs of an embeddings file in the usual .vec/.txt format, skipping
+    the possible header line. A few embeddings files (e.g. glove-840B) contain words with spaces, so the
+    vector is always taken as the last embed_size values of the line.
+    """
+    embedding_file = open_embedding_file(embeddings_path)
+    embed_size = 0
+    begin = True
+    for line in embedding_file:
+        line = line.decode().rstrip('\r\n ').split(' ')
+        if begin:
+            begin = False
+            nb_words, header_embed_size = _fetch_header_if_available(line)
+            if nb_words > 0 and header_embed_size > 0:
+                embed_size = header_embed_size
+                continue
+        if embed_size == 0:
+            embed_size = len(line) - 1
+        if len(line) <= embed_size:
+            # malformed line
+            continue
+        word = ' '.join(line[:len(line)-embed_size])
+        vector = np.asarray(line[len(line)-embed_size:], dtype=np.float32)
+        yield word, vector
+    embedding_file.close()
+
 def _get_num_lines(file_path):
     fp = open(file_path, "r+")
     buf = mmap.mmap(fp.fileno(), 0)
@@ -753,11 +1117,57 @@ def _fetch_header_if_available(line):
 
     return nb_words, embed_size
 
+# absolute path of a resource registry file -> (modification time, size, parsed registry)
+_resource_registries = {}
+_resource_registries_lock = threading.Lock()
+
 def load_resource_registry(path='delft/resources-registry.json'):
     """
     Load the resource registry file in memory. Each description provides a name,
     a file path (used only if necessary) and an embeddings type (to take into account
     small variation of format)
+
+    The file is parsed once per process and again only when modified. Each call returns its own 
+    copy of the top-level settings (e.g. "embedding-dtype"), which the caller can modify, while 
+    the lists of descriptions are shared and must not be modified.
     """
-    registry_json = open(path).read()
-    return json.loads(registry_json)
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    with _resource_registries_lock:
+        cached = _resource_registries.get(abs_path)
+        if cached is None or cached[0] != stat.st_mtime_ns or cached[1] != stat.st_size:
+            with open(abs_path) as registry_file:
+                cached = (stat.st_mtime_ns, stat.st_size, json.load(registry_file))
+            _resource_registries[abs_path] = cached
+    return dict(cached[2])
+
+
+if __name__ == "__main__":
+    # usage example - convert in place a legacy LMDB database of glove-840B to the raw vector layout:
+    # > python3 -m delft.utilities.Embeddings convert --embedding glove-840B
+    # create the int8 quantized LMDB database of glove-840B from its existing database:
+    # > python3 -m delft.utilities.Embeddings convert --embedding glove-840B --dtype int8
+
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description = "Management of the compiled embeddings databases")
+
+    parser.add_argument("action", help="one of ['convert']")
+    parser.add_argument("--embedding", required=True, help="name of the embeddings, as in the resource registry")
+    parser.add_argument("--dtype", default=DEFAULT_STORAGE_DTYPE, help="storage dtype of the vectors, one of " + str(list(STORAGE_DTYPES.keys())))
+    parser.add_argument("--registry", default='delft/resources-registry.json', help="path to the resource registry")
+
+    args = parser.parse_args()
+
+    if args.action == 'convert':
+        registry = load_resource_registry(args.registry)
+        env_path = os.path.join(registry["embedding-lmdb-path"], args.embedding)
+        if not os.path.isdir(env_path):
+            print("error: no embeddings database found at", env_path)
+            sys.exit(1)
+        target_path = os.path.join(registry["embedding-lmdb-path"], store_name(args.embedding, args.dtype))
+        convert_lmdb_embeddings(env_path, dtype=args.dtype, target_path=target_path)
+    else:
+        print("error: unknown action", args.action)
+        sys.exit(1)
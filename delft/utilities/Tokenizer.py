@@ -1,3 +1,7 @@
+import operator
+import re as stdlib_re
+
+import numpy as np
 import regex as re
 
 # Generic simple tokenizer for Indo-European languages
@@ -10,6 +14,18 @@ pattern = re.compile('('+regex+')')
 
 blanks = ' \t\n\u00A0\u2000\u2001\u2002\u2003\u2004\u2005\u2006\u2007\u2008\u2009\u200A\u200B'
 
+# single-pass scanner for batches of texts, built from the delimiter table: a token is a run of non-delimiter 
+# characters or a single delimiter character which is not blank, and the blank characters before a token are 
+# skipped by the scanner (captured to compute the offsets of the tokens). With offsets, the texts of a batch 
+# are scanned at once, joined by a blank character.
+_delimiter_class = ''.join(map(stdlib_re.escape, sorted(set(delimiters))))
+_blank_class = ''.join(map(stdlib_re.escape, sorted(set(blanks))))
+_token_delimiter_class = ''.join(map(stdlib_re.escape, sorted(set(delimiters) - set(blanks))))
+_token_pattern = '[^' + _delimiter_class + ']+|[' + _token_delimiter_class + ']'
+_scanner = stdlib_re.compile('([' + _blank_class + ']*)(' + _token_pattern + ')')
+_simple_scanner = stdlib_re.compile(_token_pattern)
+_text_separator = '\n'
+
 def tokenize(text):
     """
     Tokenization following the above pattern with offset information and keep 
@@ -43,6 +59,96 @@ def tokenizeAndFilter(text, filterBlank=True):
     return finalTokens, finalOffsets
 
 
+class TokenizedDocument(object):
+    """
+    A text tokenized once: its tokens, the offsets of the tokens in the text (pairs of start and end character
+    positions) and optionally the features of the tokens. The text can be None for tokens obtained elsewhere,
+    e.g. a document already tokenized by GROBID.
+    """
+    __slots__ = ("text", "tokens", "offsets", "features")
+
+    def __init__(self, text, tokens, offsets, features=None):
+        self.text = text
+        self.tokens = tokens
+        self.offsets = offsets
+        self.features = features
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+class TokenizedBatch(object):
+    """
+    Tokens of a list of texts stored flat: the tokens of all the texts (tokens), the start and end offsets of 
+    the tokens in their text (starts and ends, int64 arrays), and the index of the first token of each text 
+    followed by the total number of tokens (boundaries, int64 array of size nb_texts + 1)
+    """
+
+    def __init__(self, texts, tokens, starts, ends, boundaries):
+        self.texts = texts
+        self.tokens = tokens
+        self.starts = starts
+        self.ends = ends
+        self.boundaries = boundaries
+
+    def __len__(self):
+        return len(self.texts)
+
+    def lengths(self):
+        return np.diff(self.boundaries)
+
+    def token_lists(self):
+        boundaries = self.boundaries.tolist()
+        return [self.tokens[boundaries[i]:boundaries[i+1]] for i in range(len(self.texts))]
+
+    def offset_lists(self):
+        offsets = list(zip(self.starts.tolist(), self.ends.tolist()))
+        boundaries = self.boundaries.tolist()
+        return [offsets[boundaries[i]:boundaries[i+1]] for i in range(len(self.texts))]
+
+    def documents(self):
+        return [TokenizedDocument(text, tokens, offsets) 
+                for text, tokens, offsets in zip(self.texts, self.token_lists(), self.offset_lists())]
+
+
+def tokenizeBatchFlat(texts):
+    """
+    Tokenization of a list of texts as tokenizeAndFilter(), in a single pass of the scanner over all the texts,
+    giving a TokenizedBatch
+    """
+    texts = list(texts)
+    pairs = _scanner.findall(_text_separator.join(texts))
+    nb_tokens = len(pairs)
+    tokens = list(map(operator.itemgetter(1), pairs))
+    lengths = np.fromiter(map(len, tokens), dtype=np.int64, count=nb_tokens)
+    skipped = np.fromiter(map(len, map(operator.itemgetter(0), pairs)), dtype=np.int64, count=nb_tokens)
+    # offsets in the joined texts, then in each text
+    ends = np.cumsum(lengths + skipped)
+    starts = ends - lengths
+    text_starts = np.zeros((len(texts) + 1,), dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, texts), dtype=np.int64, count=len(texts)) + len(_text_separator), 
+              out=text_starts[1:])
+    boundaries = np.searchsorted(starts, text_starts)
+    shifts = np.repeat(text_starts[:-1], np.diff(boundaries))
+    return TokenizedBatch(texts, tokens, starts - shifts, ends - shifts, boundaries)
+
+
+def tokenizeBatch(texts):
+    """
+    Tokenization of a list of texts following the above pattern, with filtering of blank characters, 
+    giving a TokenizedDocument with the tokens and their offsets for each text
+    """
+    return tokenizeBatchFlat(texts).documents()
+
+
+def tokenizeBatchSimple(texts):
+    """
+    Tokenization of a list of texts as tokenizeAndFilterSimple(), with the scanner, giving the list of tokens 
+    of each text
+    """
+    return [_simple_scanner.findall(text) for text in texts]
+
+
 def tokenizeAndFilterSimple(text):
     """
     Tokenization following the above pattern without offset information
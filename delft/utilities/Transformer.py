@@ -1,7 +1,7 @@
 import os
 from typing import Union, Iterable
 
-from transformers import AutoTokenizer, TFAutoModel, AutoConfig, BertTokenizer, TFBertModel
+# transformers (which imports TensorFlow) is only imported when a transformer is used, see import_transformers()
 
 TRANSFORMER_CONFIG_FILE_NAME = 'transformer-config.json'
 DEFAULT_TRANSFORMER_TOKENIZER_DIR = "transformer-tokenizer"
@@ -12,6 +12,15 @@ LOADING_METHOD_PLAIN_MODEL = "plain_model"
 LOADING_METHOD_DELFT_MODEL = "delft_model"
 
 
+def import_transformers():
+    """
+    Import the transformers library on first use, with its logging limited to errors
+    """
+    import transformers
+    transformers.logging.set_verbosity(transformers.logging.ERROR)
+    return transformers
+
+
 class Transformer(object):
     """
     This class provides a wrapper around a transformer model (pre-trained or fine-tuned)
@@ -108,6 +117,7 @@ class Transformer(object):
         Load the tokenizer according to the provided information, in case of missing configuration,
         it will try to use huggingface as fallback solution.
         """
+        transformers = import_transformers()
         if self.loading_method == LOADING_METHOD_HUGGINGFACE_NAME:
             # fix for model without tokenizer config on HuggingFace which might default to
             # invalid casing (e.g. allenai/scibert_scivocab_cased, defaulting to uncase see #144)
@@ -119,77 +129,78 @@ class Transformer(object):
                 do_lower_case = False
 
             if do_lower_case is not None:
-                self.tokenizer = AutoTokenizer.from_pretrained(self.name,
+                self.tokenizer = transformers.AutoTokenizer.from_pretrained(self.name,
                                                                add_special_tokens=add_special_tokens,
                                                                max_length=max_sequence_length,
                                                                add_prefix_space=add_prefix_space, 
                                                                do_lower_case=do_lower_case)
             else:
-                self.tokenizer = AutoTokenizer.from_pretrained(self.name,
+                self.tokenizer = transformers.AutoTokenizer.from_pretrained(self.name,
                                                                add_special_tokens=add_special_tokens,
                                                                max_length=max_sequence_length,
                                                                add_prefix_space=add_prefix_space)
 
         elif self.loading_method == LOADING_METHOD_LOCAL_MODEL_DIR:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.local_dir_path,
+            self.tokenizer = transformers.AutoTokenizer.from_pretrained(self.local_dir_path,
                                                            add_special_tokens=add_special_tokens,
                                                            max_length=max_sequence_length,
                                                            add_prefix_space=add_prefix_space)
         elif self.loading_method == LOADING_METHOD_PLAIN_MODEL:
-            self.tokenizer = BertTokenizer.from_pretrained(self.local_vocab_file)
+            self.tokenizer = transformers.BertTokenizer.from_pretrained(self.local_vocab_file)
 
         elif self.loading_method == LOADING_METHOD_DELFT_MODEL:
             config_path = os.path.join(".", self.local_dir_path, TRANSFORMER_CONFIG_FILE_NAME)
-            self.transformer_config = AutoConfig.from_pretrained(config_path)
-            self.tokenizer = AutoTokenizer.from_pretrained(os.path.join(self.local_dir_path, DEFAULT_TRANSFORMER_TOKENIZER_DIR), config=self.transformer_config)
+            self.transformer_config = transformers.AutoConfig.from_pretrained(config_path)
+            self.tokenizer = transformers.AutoTokenizer.from_pretrained(os.path.join(self.local_dir_path, DEFAULT_TRANSFORMER_TOKENIZER_DIR), config=self.transformer_config)
 
     def save_tokenizer(self, output_directory):
         self.tokenizer.save_pretrained(output_directory)
 
-    def instantiate_layer(self, load_pretrained_weights=True) -> Union[object, TFAutoModel, TFBertModel]:
+    def instantiate_layer(self, load_pretrained_weights=True) -> Union[object, "TFAutoModel", "TFBertModel"]:
         """
         Instanciate a transformer to be loaded in a Keras layer using the availability method of the pre-trained transformer.
         """
+        transformers = import_transformers()
         if self.loading_method == LOADING_METHOD_HUGGINGFACE_NAME:
             if load_pretrained_weights:
-                transformer_model = TFAutoModel.from_pretrained(self.name, from_pt=True)
+                transformer_model = transformers.TFAutoModel.from_pretrained(self.name, from_pt=True)
                 self.transformer_config = transformer_model.config
                 return transformer_model
             else:
                 config_path = os.path.join(".", self.local_dir_path, TRANSFORMER_CONFIG_FILE_NAME)
-                self.transformer_config = AutoConfig.from_pretrained(config_path)
-                return TFAutoModel.from_config(self.transformer_config)
+                self.transformer_config = transformers.AutoConfig.from_pretrained(config_path)
+                return transformers.TFAutoModel.from_config(self.transformer_config)
 
         elif self.loading_method == LOADING_METHOD_LOCAL_MODEL_DIR:
             if load_pretrained_weights:
-                transformer_model = TFAutoModel.from_pretrained(self.local_dir_path, from_pt=True)
+                transformer_model = transformers.TFAutoModel.from_pretrained(self.local_dir_path, from_pt=True)
                 self.transformer_config = transformer_model.config
                 return transformer_model
             else:
                 config_path = os.path.join(".", self.local_dir_path, TRANSFORMER_CONFIG_FILE_NAME)
-                self.transformer_config = AutoConfig.from_pretrained(config_path)
+                self.transformer_config = transformers.AutoConfig.from_pretrained(config_path)
                 #self.transformer_config = AutoConfig.from_pretrained(self.local_dir_path)
-                return TFAutoModel.from_config(self.transformer_config)
+                return transformers.TFAutoModel.from_config(self.transformer_config)
 
         elif self.loading_method == LOADING_METHOD_PLAIN_MODEL:
             if load_pretrained_weights:
-                self.transformer_config = AutoConfig.from_pretrained(self.local_config_file)
+                self.transformer_config = transformers.AutoConfig.from_pretrained(self.local_config_file)
                 # transformer_model = TFBertModel.from_pretrained(self.local_weight_file, from_tf=True)
                 raise NotImplementedError(
                     "The load of TF weights from huggingface automodel classes is not yet implemented. \
                     Please use load from Hugging Face Hub or from directory for the initial loading of the transformers weights.")
             else:
                 config_path = os.path.join(".", self.local_dir_path, TRANSFORMER_CONFIG_FILE_NAME)
-                self.transformer_config = AutoConfig.from_pretrained(config_path)
-                return TFBertModel.from_config(self.transformer_config)
+                self.transformer_config = transformers.AutoConfig.from_pretrained(config_path)
+                return transformers.TFBertModel.from_config(self.transformer_config)
 
         else:
             # TODO: revise this
             if load_pretrained_weights:
-                transformer_model = TFAutoModel.from_pretrained(self.local_dir_path, from_pt=True)
+                transformer_model = transformers.TFAutoModel.from_pretrained(self.local_dir_path, from_pt=True)
                 self.transformer_config = transformer_model.config
                 return transformer_model
             else:
                 config_path = os.path.join(".", self.local_dir_path, TRANSFORMER_CONFIG_FILE_NAME)
-                self.transformer_config = AutoConfig.from_pretrained(config_path)
-                return TFAutoModel.from_config(self.transformer_config)
+                self.transformer_config = transformers.AutoConfig.from_pretrained(config_path)
+                return transformers.TFAutoModel.from_config(self.transformer_config)
@@ -1,5 +1,4 @@
 # some convenient methods for all models
-import pandas as pd
 import regex as re
 import numpy as np
 # seed is fixed for reproducibility
@@ -10,12 +9,12 @@ import shutil
 import requests
 from urllib.parse import urlparse
 
-from tensorflow.keras.preprocessing import text
-
 from tqdm import tqdm 
 
 import argparse
-import truecase
+
+# pandas, tensorflow and truecase (which loads nltk) are imported by the functions using them,
+# so that importing this module (e.g. for download_file) stays fast
 
 def truncate_batch_values(batch_values: list, max_sequence_length: int) -> list:
     return [
@@ -158,6 +157,9 @@ def stats(x_train=None, y_train=None, x_valid=None, y_valid=None, x_eval=None, y
 # generate the list of out of vocabulary words present in the Toxic dataset 
 # with respect to 3 embeddings: fastText, Gloves and word2vec
 def generateOOVEmbeddings():
+    import pandas as pd
+    from tensorflow.keras.preprocessing import text
+
     # read the (DL cleaned) dataset and build the vocabulary
     print('loading dataframes...')
     train_df = pd.read_csv('../data/training/train2.cleaned.dl.csv')
@@ -512,6 +514,8 @@ def truecase_sentence(tokens):
     from https://github.com/ghaddarAbs
     for experimenting with CoNLL-2003 casing
     """
+    import truecase
+
     word_lst = [(w, idx) for idx, w in enumerate(tokens) if all(c.isalpha() for c in w)]
     lst = [w for w, _ in word_lst if re.match(r'\b[A-Z\.\-]+\b', w)]
 
@@ -0,0 +1,88 @@
+"""
+Bounded in-process cache of word vectors
+
+Word frequencies follow a Zipf distribution, so a cache of a few thousand entries in front of a
+store with per-lookup cost (LMDB transaction + deserialization) serves most of the lookups.
+
+Cached vectors are shared between calls, so they are made read-only. Unknown words are cached too,
+all mapped to the same read-only zero vector. The cache can be used by several threads at the same time,
+e.g. when tagging concurrently with the same loaded model.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class WordVectorCache(object):
+    """
+    LRU cache of word vectors with a maximum number of entries
+    """
+
+    def __init__(self, max_size, embed_size):
+        if max_size <= 0:
+            raise ValueError("The size of the word vector cache must be positive, got " + str(max_size))
+        self.max_size = max_size
+        self.embed_size = embed_size
+        self.vectors = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.oov_vector = np.zeros((embed_size,), dtype=np.float32)
+        self.oov_vector.flags.writeable = False
+        # get() and put() reorder the entries, so a lookup is not atomic
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def __contains__(self, word):
+        return word in self.vectors
+
+    def get(self, word):
+        """
+        Return the cached vector of a word (the shared zero vector for a cached unknown word),
+        or None if the word is not in the cache
+        """
+        with self._lock:
+            vector = self.vectors.get(word)
+            if vector is None:
+                self.misses += 1
+                return None
+            self.vectors.move_to_end(word)
+            self.hits += 1
+            return vector
+
+    def put(self, word, vector):
+        """
+        Add the vector of a word to the cache, None for an unknown word, evicting the least recently
+        used entry if the cache is full. Return the cached vector.
+        """
+        if vector is None:
+            vector = self.oov_vector
+        elif vector.flags.writeable:
+            vector.flags.writeable = False
+        with self._lock:
+            self.vectors[word] = vector
+            self.vectors.move_to_end(word)
+            if len(self.vectors) > self.max_size:
+                self.vectors.popitem(last=False)
+        return vector
+
+    def is_full(self):
+        return len(self.vectors) >= self.max_size
+
+    def clear(self):
+        with self._lock:
+            self.vectors.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.vectors),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0
+        }
@@ -0,0 +1,242 @@
+"""
+Storage layout and compilation of the embeddings LMDB databases
+
+Vectors are stored as raw little-endian bytes of the storage dtype (see embeddings_quantization), the format
+version, the dtype and the size of the vectors being recorded as JSON under a metadata key. The metadata key starts with a NUL char, so it can't
+clash with a word. A database without metadata key is a legacy database storing pickled vectors.
+
+While a database is being compiled, the number of lines of the embeddings file already committed is
+stored under a progress key, in the same transaction as the vectors, so that an interrupted compilation
+can be resumed. The metadata key is written, and the progress key removed, only when the compilation
+is complete.
+"""
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import warnings
+from collections import deque
+
+import numpy as np
+from tqdm import tqdm
+
+from delft.utilities.embeddings_quantization import DEFAULT_STORAGE_DTYPE, encode_vectors, decode_vector
+
+LMDB_FORMAT_VERSION = 2
+LMDB_META_KEY = b'\x00delft-embeddings-meta'
+LMDB_PROGRESS_KEY = b'\x00delft-embeddings-progress'
+
+# number of lines of the embeddings file parsed by a worker and written in one LMDB transaction
+DEFAULT_COMPILE_CHUNK_SIZE = 20000
+
+
+def serialize_raw(a, dtype=DEFAULT_STORAGE_DTYPE):
+    return encode_vectors(np.asarray(a)[None, :], dtype)[0].tobytes()
+
+
+def deserialize_raw(serialized, dtype=DEFAULT_STORAGE_DTYPE):
+    return decode_vector(serialized, dtype)
+
+
+def read_lmdb_meta(txn):
+    """
+    Return the metadata of an embeddings LMDB database, or None for a legacy database with pickled vectors
+    or a database being compiled
+    """
+    meta = txn.get(LMDB_META_KEY)
+    if meta is None:
+        return None
+    meta = json.loads(meta.decode(encoding='UTF-8'))
+    if meta["format_version"] > LMDB_FORMAT_VERSION:
+        raise ValueError("Unsupported embeddings database format version " + str(meta["format_version"]) +
+            ", this version of DeLFT supports up to version " + str(LMDB_FORMAT_VERSION))
+    return meta
+
+
+def write_lmdb_meta(txn, dtype, embed_size, vocab_size):
+    meta = {
+        "format_version": LMDB_FORMAT_VERSION,
+        "dtype": dtype,
+        "embed_size": embed_size,
+        "vocab_size": vocab_size
+    }
+    txn.put(LMDB_META_KEY, json.dumps(meta).encode(encoding='UTF-8'))
+
+
+def read_lmdb_progress(txn):
+    """
+    Return the progress of an interrupted compilation of an embeddings LMDB database, or None if the
+    database is not being compiled
+    """
+    progress = txn.get(LMDB_PROGRESS_KEY)
+    if progress is None:
+        return None
+    return json.loads(progress.decode(encoding='UTF-8'))
+
+
+def parse_vector_lines(lines, embed_size, dtype=DEFAULT_STORAGE_DTYPE):
+    """
+    Parse a chunk of lines (bytes) of an embeddings file in the .vec/.txt format into a list of words
+    (UTF-8 bytes) and a matrix of the vectors encoded for the given storage dtype (see encode_vectors()). The values of the whole chunk
+    are parsed with a single NumPy call when each line has embed_size values after its first space, otherwise
+    (words containing spaces as in glove-840B, malformed lines) the lines are parsed one by one, as in
+    read_word_vectors().
+    """
+    words = []
+    values = []
+    bulk = True
+    for line in lines:
+        line = line.rstrip(b'\r\n ')
+        position = line.find(b' ')
+        if position <= 0:
+            continue
+        if line.count(b' ') != embed_size:
+            bulk = False
+            break
+        words.append(line[:position])
+        values.append(line[position+1:])
+
+    if bulk:
+        matrix = _parse_values(b' '.join(values))
+        if matrix is not None and matrix.shape[0] == len(words) * embed_size:
+            return words, encode_vectors(matrix.reshape((len(words), embed_size)), dtype)
+
+    # slow path, line by line
+    words = []
+    vectors = []
+    for line in lines:
+        line = line.rstrip(b'\r\n ').split(b' ')
+        if len(line) <= embed_size:
+            # malformed line
+            continue
+        vector = _parse_values(b' '.join(line[len(line)-embed_size:]))
+        if vector is None or vector.shape[0] != embed_size:
+            continue
+        words.append(b' '.join(line[:len(line)-embed_size]))
+        vectors.append(vector)
+    if len(vectors) == 0:
+        return words, encode_vectors(np.zeros((0, embed_size)), dtype)
+    return words, encode_vectors(np.stack(vectors), dtype)
+
+
+def _parse_values(values):
+    with warnings.catch_warnings():
+        # unparsable values raise a DeprecationWarning with current NumPy versions, a ValueError in the future
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(values, dtype=np.float32, sep=' ')
+        except (DeprecationWarning, ValueError):
+            return None
+
+
+def _parse_chunk(args):
+    lines, embed_size, dtype = args
+    words, matrix = parse_vector_lines(lines, embed_size, dtype)
+    return words, matrix, len(lines)
+
+
+def _read_chunks(lines, chunk_size):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def _fetch_header(line):
+    parts = line.split()
+    if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
+        return int(parts[0]), int(parts[1])
+    return -1, -1
+
+
+def compile_embeddings_lmdb(env, embedding_file, dtype=DEFAULT_STORAGE_DTYPE, nb_workers=None,
+                            chunk_size=DEFAULT_COMPILE_CHUNK_SIZE):
+    """
+    Compile an embeddings file (opened in binary mode) in the .vec/.txt format into an LMDB environment,
+    in a single streaming pass over the file. Chunks of lines are parsed in parallel by a pool of
+    nb_workers processes (default is the number of CPUs, 1 to parse in the current process), then
+    written in order, one transaction per chunk. If the environment contains an interrupted compilation,
+    it is resumed after the last committed chunk. Return the number of words and the embeddings size.
+    """
+    start_time = time.time()
+    if nb_workers is None:
+        nb_workers = os.cpu_count() or 1
+
+    with env.begin() as txn:
+        progress = read_lmdb_progress(txn)
+    nb_skipped_lines = 0
+    nb_words = 0
+    if progress is not None:
+        if progress["dtype"] != dtype:
+            raise ValueError("The interrupted compilation used dtype " + progress["dtype"] + ", not " + dtype)
+        nb_skipped_lines = progress["lines"]
+        nb_words = progress["words"]
+        print("resuming compilation after", nb_skipped_lines, "lines")
+
+    lines = iter(embedding_file)
+    first_line = next(lines, None)
+    if first_line is None:
+        return 0, 0
+    nb_header_words, embed_size = _fetch_header(first_line)
+    if embed_size <= 0:
+        # no header, the first line is a vector
+        embed_size = len(first_line.rstrip(b'\r\n ').split(b' ')) - 1
+        lines = itertools.chain([first_line], lines)
+
+    # skip the lines already committed before an interruption, without parsing them
+    for _ in range(nb_skipped_lines):
+        if next(lines, None) is None:
+            break
+
+    max_key_size = env.max_key_size()
+    progress_bar = tqdm(total=nb_header_words if nb_header_words > 0 else None, initial=nb_skipped_lines,
+                        unit=" lines", unit_scale=True, smoothing=0.1)
+    nb_lines = nb_skipped_lines
+
+    def write_chunk(result):
+        nonlocal nb_lines, nb_words
+        words, matrix, nb_chunk_lines = result
+        with env.begin(write=True) as txn:
+            for i, word in enumerate(words):
+                # as for the memory-mapped matrix, duplicated words keep their first vector
+                if len(word) < max_key_size and txn.put(word, matrix[i].tobytes(), overwrite=False):
+                    nb_words += 1
+            nb_lines += nb_chunk_lines
+            progress = {"lines": nb_lines, "words": nb_words, "dtype": dtype}
+            txn.put(LMDB_PROGRESS_KEY, json.dumps(progress).encode(encoding='UTF-8'))
+        progress_bar.update(nb_chunk_lines)
+
+    chunks = ((chunk, embed_size, dtype) for chunk in _read_chunks(lines, chunk_size))
+    first_chunks = [chunk for chunk in (next(chunks, None), next(chunks, None)) if chunk is not None]
+    chunks = itertools.chain(first_chunks, chunks)
+    if nb_workers <= 1 or len(first_chunks) < 2:
+        # no need to start a pool for a file of one chunk
+        for chunk in chunks:
+            write_chunk(_parse_chunk(chunk))
+    else:
+        # the workers only need NumPy, spawn avoids forking a process with TensorFlow threads, the number of
+        # pending chunks is bounded to keep the memory usage independent from the size of the file
+        with multiprocessing.get_context('spawn').Pool(nb_workers) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(_parse_chunk, (chunk,)))
+                if len(pending) >= 2 * nb_workers:
+                    write_chunk(pending.popleft().get())
+            while len(pending) > 0:
+                write_chunk(pending.popleft().get())
+    progress_bar.close()
+
+    with env.begin(write=True) as txn:
+        write_lmdb_meta(txn, dtype, embed_size, nb_words)
+        txn.delete(LMDB_PROGRESS_KEY)
+
+    duration = time.time() - start_time
+    print("compiled", nb_words, "words in", "%.1f" % duration, "seconds",
+        "(%.0f lines/s)" % ((nb_lines - nb_skipped_lines) / duration if duration > 0 else 0))
+    return nb_words, embed_size
+
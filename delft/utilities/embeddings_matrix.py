@@ -0,0 +1,216 @@
+"""
+Dense memory-mapped storage of static embeddings
+
+An embeddings matrix is a directory containing:
+
+    vectors.npy         the contiguous (vocab_size, embed_size) matrix of vectors, in the order of the original
+                        embeddings file (so usually by decreasing word frequency), with the storage dtype
+                        (see embeddings_quantization)
+    scales.npy          the (vocab_size,) float32 scales of the vectors, only for the int8 storage dtype
+    vocab.bin           the UTF-8 bytes of the words, concatenated
+    vocab-offsets.npy   (vocab_size + 1) start offsets of each word in vocab.bin
+    vocab-hash.npy      open addressing hash table (crc32 + linear probing) giving row index + 1 for a word,
+                        0 for an empty slot
+    meta.json           description of the matrix, written last so that its presence indicates a complete build
+
+All the files are opened memory-mapped in read-only mode, so loading is immediate and all the processes
+using the same embeddings share the same page cache, without any per-token deserialization.
+"""
+import json
+import mmap
+import os
+import shutil
+import zlib
+
+import numpy as np
+
+from delft.utilities.embeddings_quantization import DEFAULT_STORAGE_DTYPE, STORAGE_DTYPES, quantize, dequantize
+
+MATRIX_FORMAT_VERSION = 1
+
+VECTORS_FILE_NAME = "vectors.npy"
+SCALES_FILE_NAME = "scales.npy"
+VOCAB_FILE_NAME = "vocab.bin"
+VOCAB_OFFSETS_FILE_NAME = "vocab-offsets.npy"
+VOCAB_HASH_FILE_NAME = "vocab-hash.npy"
+META_FILE_NAME = "meta.json"
+
+# size of the chunk of rows copied when finalizing the vectors file
+_copy_chunk_rows = 65536
+
+
+class EmbeddingsMatrix(object):
+    """
+    Read-only access to an embeddings matrix directory
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE_NAME)) as f:
+            self.meta = json.load(f)
+        self.vocab_size = self.meta["vocab_size"]
+        self.embed_size = self.meta["embed_size"]
+        self.dtype = self.meta.get("dtype", DEFAULT_STORAGE_DTYPE)
+
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE_NAME), mmap_mode='r')
+        self.scales = None
+        if os.path.isfile(os.path.join(path, SCALES_FILE_NAME)):
+            self.scales = np.load(os.path.join(path, SCALES_FILE_NAME), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, VOCAB_OFFSETS_FILE_NAME), mmap_mode='r')
+        self.hash_table = np.load(os.path.join(path, VOCAB_HASH_FILE_NAME), mmap_mode='r')
+        self.hash_mask = self.hash_table.shape[0] - 1
+
+        self._vocab_file = open(os.path.join(path, VOCAB_FILE_NAME), 'rb')
+        if os.path.getsize(os.path.join(path, VOCAB_FILE_NAME)) > 0:
+            self.vocab = mmap.mmap(self._vocab_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.vocab = b''
+
+    @staticmethod
+    def exists(path):
+        return os.path.isfile(os.path.join(path, META_FILE_NAME))
+
+    def get_row(self, word):
+        """
+        Return the row index of a word in the matrix, or -1 if the word is unknown
+        """
+        key = word.encode(encoding='UTF-8')
+        slot = zlib.crc32(key) & self.hash_mask
+        while True:
+            row = int(self.hash_table[slot]) - 1
+            if row == -1:
+                return -1
+            if self.vocab[int(self.offsets[row]):int(self.offsets[row+1])] == key:
+                return row
+            slot = (slot + 1) & self.hash_mask
+
+    def get_rows(self, words):
+        """
+        Return the row indices of a list of words as an int64 array, -1 for unknown words
+        """
+        return np.asarray([self.get_row(word) for word in words], dtype=np.int64)
+
+    def get_vectors(self, rows):
+        """
+        Return the float32 (len(rows), embed_size) matrix of the vectors of the given rows, dequantized 
+        if stored with a quantized dtype
+        """
+        if self.scales is None:
+            return dequantize(self.vectors[rows])
+        return dequantize(self.vectors[rows], self.scales[rows])
+
+    def get_word_vector(self, word):
+        """
+        Return the vector of a word, or None if the word is unknown. For float32 storage, it is a read-only
+        view on the memory-mapped matrix
+        """
+        row = self.get_row(word)
+        if row == -1:
+            return None
+        if self.dtype == DEFAULT_STORAGE_DTYPE:
+            return self.vectors[row]
+        return self.get_vectors(np.asarray([row]))[0]
+
+    def get_word(self, row):
+        return self.vocab[int(self.offsets[row]):int(self.offsets[row+1])].decode(encoding='UTF-8')
+
+    def close(self):
+        if isinstance(self.vocab, mmap.mmap):
+            self.vocab.close()
+        self._vocab_file.close()
+
+
+def build_embeddings_matrix(word_vectors, path, name=None, dtype=DEFAULT_STORAGE_DTYPE):
+    """
+    Build an embeddings matrix directory from an iterable of (word, vector) pairs, e.g. as read from
+    a .vec file, with the vectors stored with the given storage dtype. Duplicated words keep their 
+    first vector.
+
+    The vectors are streamed to disk, so the memory usage is limited to the vocabulary index.
+    """
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+
+    raw_vectors_path = os.path.join(path, VECTORS_FILE_NAME + ".tmp")
+    raw_scales_path = os.path.join(path, SCALES_FILE_NAME + ".tmp")
+    embed_size = 0
+    nb_rows = 0
+    offsets = [0]
+    with open(raw_vectors_path, 'wb') as raw_vectors, open(raw_scales_path, 'wb') as raw_scales, \
+            open(os.path.join(path, VOCAB_FILE_NAME), 'wb') as vocab:
+        for word, vector in word_vectors:
+            if embed_size == 0:
+                embed_size = len(vector)
+            elif len(vector) != embed_size:
+                # malformed line
+                continue
+            key = word.encode(encoding='UTF-8')
+            vocab.write(key)
+            offsets.append(offsets[-1] + len(key))
+            values, scales = quantize(np.asarray(vector)[None, :], dtype)
+            raw_vectors.write(values.tobytes())
+            if scales is not None:
+                raw_scales.write(scales.tobytes())
+            nb_rows += 1
+
+    # finalize the .npy vectors file from the raw streamed vectors
+    _finalize_npy(raw_vectors_path, os.path.join(path, VECTORS_FILE_NAME), STORAGE_DTYPES[dtype], (nb_rows, embed_size))
+    if dtype == "int8":
+        _finalize_npy(raw_scales_path, os.path.join(path, SCALES_FILE_NAME), '<f4', (nb_rows,))
+    else:
+        os.remove(raw_scales_path)
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    np.save(os.path.join(path, VOCAB_OFFSETS_FILE_NAME), offsets)
+    np.save(os.path.join(path, VOCAB_HASH_FILE_NAME), _build_hash_table(path, offsets))
+
+    meta = {
+        "format_version": MATRIX_FORMAT_VERSION,
+        "name": name,
+        "vocab_size": nb_rows,
+        "embed_size": embed_size,
+        "dtype": dtype
+    }
+    with open(os.path.join(path, META_FILE_NAME), 'w') as f:
+        json.dump(meta, f, indent=4)
+
+    return nb_rows, embed_size
+
+
+def _finalize_npy(raw_path, npy_path, dtype, shape):
+    array = np.lib.format.open_memmap(npy_path, mode='w+', dtype=dtype, shape=shape)
+    if shape[0] > 0:
+        raw = np.memmap(raw_path, dtype=dtype, mode='r', shape=shape)
+        for start in range(0, shape[0], _copy_chunk_rows):
+            array[start:start+_copy_chunk_rows] = raw[start:start+_copy_chunk_rows]
+        del raw
+    array.flush()
+    del array
+    os.remove(raw_path)
+
+
+def _build_hash_table(path, offsets):
+    nb_rows = offsets.shape[0] - 1
+    # power of 2 size with a load factor at most 0.5
+    table_size = 2
+    while table_size < 2 * nb_rows:
+        table_size *= 2
+    mask = table_size - 1
+    table = [0] * table_size
+    offsets = offsets.tolist()
+    with open(os.path.join(path, VOCAB_FILE_NAME), 'rb') as f:
+        vocab = f.read()
+    for row in range(nb_rows):
+        key = vocab[offsets[row]:offsets[row+1]]
+        slot = zlib.crc32(key) & mask
+        duplicate = False
+        while table[slot] != 0:
+            other = table[slot] - 1
+            if vocab[offsets[other]:offsets[other+1]] == key:
+                duplicate = True
+                break
+            slot = (slot + 1) & mask
+        if not duplicate:
+            table[slot] = row + 1
+    return np.asarray(table, dtype=np.int32)
@@ -0,0 +1,97 @@
+"""
+Quantized storage of static embeddings
+
+The compiled embeddings (LMDB databases and memory-mapped matrices) can store the vectors as:
+
+    float32     no loss
+    float16     half the size, with a negligible loss for usual embeddings value ranges
+    int8        a quarter of the size, each vector is stored as int8 values with a float32 scale
+                (max absolute value of the vector / 127), dequantized as value * scale
+
+Vectors are always returned dequantized as float32. The storage dtype is selected with the attribute
+"embedding-dtype" of the resource registry. Stores of a quantized dtype are compiled under a distinct name,
+so the stores of the different dtypes of the same embeddings can be used side by side.
+"""
+import numpy as np
+
+STORAGE_DTYPES = {"float32": "<f4", "float16": "<f2", "int8": "<i1"}
+DEFAULT_STORAGE_DTYPE = "float32"
+
+# size in bytes of the scale stored in front of the int8 values of a vector
+_SCALE_SIZE = 4
+
+
+def check_storage_dtype(dtype):
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError("Invalid embeddings storage dtype " + str(dtype) + ", expected one of " + str(list(STORAGE_DTYPES.keys())))
+
+
+def store_name(name, dtype):
+    """
+    Name of the compiled store of the embeddings name for the given storage dtype
+    """
+    if dtype == DEFAULT_STORAGE_DTYPE:
+        return name
+    return name + "." + dtype
+
+
+def quantize(vectors, dtype):
+    """
+    Quantize a (nb_vectors, embed_size) matrix for the given storage dtype, return the quantized values and
+    the per-vector float32 scales (None if the dtype has no scale)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype != "int8":
+        return vectors.astype(STORAGE_DTYPES[dtype]), None
+    scales = np.abs(vectors).max(axis=-1, initial=0.0) / 127.0
+    scales[scales == 0.0] = 1.0
+    values = np.clip(np.rint(vectors / scales[..., None]), -127, 127).astype(np.int8)
+    return values, scales.astype(np.float32)
+
+
+def dequantize(values, scales=None):
+    """
+    Return the float32 vectors of quantized values and their scales
+    """
+    if scales is None:
+        if values.dtype == np.float32:
+            return values
+        return values.astype(np.float32)
+    return values.astype(np.float32) * np.asarray(scales, dtype=np.float32)[..., None]
+
+
+def encode_vectors(vectors, dtype):
+    """
+    Encode a (nb_vectors, embed_size) matrix as a 2D array whose rows, as bytes, are the stored values of the
+    vectors: the raw little-endian values, preceded by the scale for int8
+    """
+    values, scales = quantize(vectors, dtype)
+    if scales is None:
+        return values
+    nb_vectors = values.shape[0]
+    encoded = np.empty((nb_vectors, _SCALE_SIZE + values.shape[1]), dtype=np.uint8)
+    encoded[:, :_SCALE_SIZE] = scales.astype('<f4').view(np.uint8).reshape(nb_vectors, _SCALE_SIZE)
+    encoded[:, _SCALE_SIZE:] = values.view(np.uint8)
+    return encoded
+
+
+def decode_vectors(buffer, dtype, embed_size):
+    """
+    Decode the concatenated stored values of vectors (see encode_vectors) as a (nb_vectors, embed_size)
+    float32 matrix, float32 values being read without copy
+    """
+    if dtype == "int8":
+        records = np.frombuffer(buffer, dtype=[('scale', '<f4'), ('values', 'i1', (embed_size,))])
+        return dequantize(records['values'], records['scale'])
+    return dequantize(np.frombuffer(buffer, dtype=STORAGE_DTYPES[dtype]).reshape((-1, embed_size)))
+
+
+def decode_vector(buffer, dtype):
+    """
+    Decode the stored values of a single vector as a float32 vector
+    """
+    if dtype == "int8":
+        embed_size = len(buffer) - _SCALE_SIZE
+    else:
+        embed_size = len(buffer) // np.dtype(STORAGE_DTYPES[dtype]).itemsize
+    return decode_vectors(buffer, dtype, embed_size)[0]
@@ -0,0 +1,159 @@
+"""
+On-disk cache of featurized corpora
+
+The epoch-invariant part of the input of a model (tokenization, char ids, casing, feature indexes, label ids...)
+can be computed once for a training corpus and stored as compact int arrays. A featurized corpus is stored as a
+.npz file named by a content hash of the corpus, the preprocessor state and the relevant model configuration,
+so any change of these gives a new entry and an entry is never stale.
+
+Sequences of variable lengths are stored flat, with an array of offsets of size nb_sequences + 1.
+"""
+import hashlib
+import os
+
+import numpy as np
+
+# to be incremented when the layout of the featurized arrays changes
+FEATURIZATION_VERSION = 1
+
+DEFAULT_FEATURIZATION_CACHE_DIR = "data/cache/featurization"
+
+
+def content_hash(*values):
+    """
+    SHA-1 hex digest of nested str, bytes, numbers, None, lists, tuples, dicts and NumPy arrays
+    """
+    hasher = hashlib.sha1()
+    hasher.update(b'delft-featurization-%d' % FEATURIZATION_VERSION)
+    for value in values:
+        _update_hash(hasher, value)
+    return hasher.hexdigest()
+
+
+def _update_hash(hasher, value):
+    # every value is prefixed by a type tag and strings by their length, so that distinct nestings
+    # can't give the same byte sequence
+    if isinstance(value, str):
+        encoded = value.encode('UTF-8')
+        hasher.update(b's%d:' % len(encoded))
+        hasher.update(encoded)
+    elif isinstance(value, bytes):
+        hasher.update(b'b%d:' % len(value))
+        hasher.update(value)
+    elif value is None:
+        hasher.update(b'n')
+    elif isinstance(value, (bool, int, float, np.integer, np.floating)):
+        hasher.update(b'i' + repr(value).encode('UTF-8') + b';')
+    elif isinstance(value, dict):
+        hasher.update(b'd%d:' % len(value))
+        for key in sorted(value.keys(), key=str):
+            _update_hash(hasher, str(key))
+            _update_hash(hasher, value[key])
+    elif isinstance(value, np.ndarray) and value.dtype != object:
+        hasher.update(b'a' + str(value.dtype).encode('UTF-8') + str(value.shape).encode('UTF-8'))
+        hasher.update(np.ascontiguousarray(value).tobytes())
+    else:
+        value = list(value)
+        if len(value) > 0 and all(isinstance(item, str) for item in value):
+            # common case of a sequence of tokens, hashed at once
+            encoded = [item.encode('UTF-8') for item in value]
+            hasher.update(b't%d:' % len(value))
+            hasher.update(np.asarray([len(item) for item in encoded], dtype=np.int64).tobytes())
+            hasher.update(b''.join(encoded))
+            return
+        hasher.update(b'l%d:' % len(value))
+        for item in value:
+            _update_hash(hasher, item)
+
+
+def compact_int_dtype(max_value):
+    """
+    Smallest dtype among uint8, uint16 and int32 able to store the non-negative values up to max_value
+    """
+    if max_value < 2**8:
+        return np.uint8
+    if max_value < 2**16:
+        return np.uint16
+    return np.int32
+
+
+def range_indices(starts, counts):
+    """
+    Concatenation of the ranges [starts[i], starts[i] + counts[i]), as a single int64 array
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros((0,), dtype=np.int64)
+    first_positions = np.cumsum(counts) - counts
+    return np.repeat(np.asarray(starts, dtype=np.int64) - first_positions, counts) + np.arange(total)
+
+
+def encode_token_sequences(sequences):
+    """
+    Encode sequences of tokens as compact arrays: the token ids of all the sequences ("token_ids") with the
+    offsets of each sequence ("offsets"), and the vocabulary of the distinct tokens as UTF-8 bytes
+    ("vocabulary_bytes") with the offsets of each token ("vocabulary_offsets"). Return the arrays and the
+    vocabulary as a list.
+    """
+    vocabulary = {}
+    token_ids = []
+    offsets = [0]
+    for tokens in sequences:
+        for token in tokens:
+            token_id = vocabulary.get(token)
+            if token_id is None:
+                token_id = vocabulary[token] = len(vocabulary)
+            token_ids.append(token_id)
+        offsets.append(len(token_ids))
+    vocabulary = list(vocabulary.keys())
+    encoded = [token.encode('UTF-8') for token in vocabulary]
+    vocabulary_offsets = np.zeros((len(encoded) + 1,), dtype=np.int64)
+    np.cumsum([len(token) for token in encoded], out=vocabulary_offsets[1:])
+    arrays = {
+        "offsets": np.asarray(offsets, dtype=np.int64),
+        "token_ids": np.asarray(token_ids, dtype=compact_int_dtype(len(vocabulary))),
+        "vocabulary_bytes": np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        "vocabulary_offsets": vocabulary_offsets
+    }
+    return arrays, vocabulary
+
+
+def decode_vocabulary(arrays):
+    """
+    Return the vocabulary encoded by encode_token_sequences() as a list of tokens
+    """
+    data = arrays["vocabulary_bytes"].tobytes()
+    offsets = arrays["vocabulary_offsets"].tolist()
+    return [data[offsets[i]:offsets[i+1]].decode('UTF-8') for i in range(len(offsets) - 1)]
+
+
+def featurization_path(cache_dir, key):
+    return os.path.join(cache_dir, key + ".npz")
+
+
+def load_featurization(cache_dir, key):
+    """
+    Return the dict of arrays of a cached featurization, or None if not in the cache
+    """
+    if cache_dir is None:
+        return None
+    path = featurization_path(cache_dir, key)
+    if not os.path.isfile(path):
+        return None
+    with np.load(path, allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def save_featurization(cache_dir, key, arrays):
+    """
+    Store a dict of arrays in the cache, written to a temporary file first so that an interrupted write
+    never leaves a truncated entry
+    """
+    if cache_dir is None:
+        return
+    os.makedirs(cache_dir, exist_ok=True)
+    path = featurization_path(cache_dir, key)
+    tmp_path = path + ".%d.tmp.npz" % os.getpid()
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
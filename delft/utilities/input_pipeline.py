@@ -0,0 +1,108 @@
+"""
+tf.data input pipeline over the DeLFT data generators
+
+The data generators are keras.utils.Sequence objects producing padded batches. Keras runs them with a pool of
+workers (threads or processes), or in the main thread for transformer and ELMo models. As an alternative, the
+batches can be produced by a tf.data pipeline: the batches are made by the generator in parallel calls of
+Dataset.map() and prefetched while the model trains on the previous ones.
+
+With a cache, the batches of the first epoch are stored (in memory or in a file) and replayed in a shuffled
+order at the next epochs: the composition of the batches is then fixed, only their order changes.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+CACHE_IN_MEMORY = "memory"
+
+
+def sequence_to_dataset(sequence, num_parallel_calls=tf.data.AUTOTUNE, shuffle_batches=False, cache=None):
+    """
+    Return a tf.data.Dataset of the batches (inputs, targets) of a keras.utils.Sequence. cache is None for
+    no cache, CACHE_IN_MEMORY, or the path of a cache file. The sequence must be notified of the end of
+    each epoch with SequenceEpochEndCallback when the dataset is not cached.
+    """
+    inputs, targets = sequence[0]
+    single_input = not isinstance(inputs, (list, tuple))
+    arrays = _flatten(inputs, targets)
+    dtypes = []
+    for array in arrays:
+        if array.dtype == object:
+            raise ValueError("Batches with arrays of Python objects can't be produced by a tf.data pipeline")
+        dtypes.append(tf.as_dtype(array.dtype))
+    ranks = [array.ndim for array in arrays]
+    nb_inputs = 1 if single_input else len(inputs)
+
+    def load_batch(index):
+        batch_inputs, batch_targets = sequence[int(index)]
+        return [np.asarray(array, dtype=dtype.as_numpy_dtype)
+                for array, dtype in zip(_flatten(batch_inputs, batch_targets), dtypes)]
+
+    def make_batch(index):
+        tensors = tf.numpy_function(load_batch, [index], dtypes)
+        for tensor, rank in zip(tensors, ranks):
+            tensor.set_shape([None] * rank)
+        batch_inputs = tensors[0] if single_input else tuple(tensors[:nb_inputs])
+        if targets is None:
+            return batch_inputs
+        return batch_inputs, tensors[nb_inputs]
+
+    # the number of batches can change from one epoch to the next (e.g. with a budget of tokens per batch),
+    # so the indices are generated again at each iteration over the dataset
+    dataset = tf.data.Dataset.from_generator(lambda: range(len(sequence)),
+                                             output_signature=tf.TensorSpec(shape=(), dtype=tf.int64))
+    dataset = dataset.map(make_batch, num_parallel_calls=num_parallel_calls, deterministic=True)
+    if cache is not None:
+        dataset = dataset.cache("" if cache == CACHE_IN_MEMORY else cache)
+    if shuffle_batches:
+        dataset = dataset.shuffle(len(sequence), reshuffle_each_iteration=True)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def _flatten(inputs, targets):
+    arrays = [np.asarray(inputs)] if not isinstance(inputs, (list, tuple)) else [np.asarray(array) for array in inputs]
+    if targets is not None:
+        arrays.append(np.asarray(targets))
+    return arrays
+
+
+class SequenceEpochEndCallback(tf.keras.callbacks.Callback):
+    """
+    Call on_epoch_end() of a keras.utils.Sequence read through a tf.data pipeline, as Keras does when
+    training directly on the Sequence
+    """
+
+    def __init__(self, sequence):
+        super().__init__()
+        self.sequence = sequence
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.sequence.on_epoch_end()
+
+
+class TrainingDataset(object):
+    """
+    tf.data pipeline of a training generator (dataset), with the callbacks it needs during the training
+    (callbacks). A cache file is created in a new temporary directory under the cache directory, removed
+    by close().
+    """
+
+    def __init__(self, sequence, cache=None, num_parallel_calls=tf.data.AUTOTUNE):
+        self.cache_dir = None
+        if cache is not None and cache != CACHE_IN_MEMORY:
+            os.makedirs(cache, exist_ok=True)
+            self.cache_dir = tempfile.mkdtemp(prefix="tf-data-", dir=cache)
+            cache = os.path.join(self.cache_dir, "batches")
+        self.dataset = sequence_to_dataset(sequence, num_parallel_calls=num_parallel_calls,
+                                           shuffle_batches=cache is not None, cache=cache)
+        self.callbacks = []
+        if cache is None:
+            self.callbacks.append(SequenceEpochEndCallback(sequence))
+
+    def close(self):
+        if self.cache_dir is not None:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            self.cache_dir = None
@@ -0,0 +1,93 @@
+"""
+Process-wide registry of the embeddings shared by the models
+
+An application can load many models using the same static embeddings (e.g. the GROBID models with glove-840B).
+Instead of opening the embeddings once per model (LMDB environment, memory-mapped matrix, or the complete
+embeddings in memory for the memory backend), the models share one Embeddings object per name, resource registry
+and options, counting its references. The embeddings are closed when their last reference is released, which
+Sequence and Classifier do when they are garbage collected or load other embeddings.
+
+Embeddings with ELMo are not shared, the ELMo cache being specific to a training.
+"""
+import os
+import threading
+
+from delft.utilities.Embeddings import Embeddings
+from delft.utilities.featurization_cache import content_hash
+
+# sharing key -> _SharedEntry
+_shared = {}
+
+# id of a shared Embeddings object -> sharing key
+_keys = {}
+
+_lock = threading.Lock()
+
+
+class _SharedEntry(object):
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.references = 0
+
+
+def embeddings_key(name, resource_registry=None, snapshot_path=None, **options):
+    """
+    Sharing key of embeddings: content hash of the name, the resource registry (backend, paths, storage dtype,
+    cache size, descriptions) and the Embeddings options
+    """
+    if snapshot_path is not None:
+        snapshot_path = os.path.abspath(snapshot_path)
+    return content_hash("embeddings", name, resource_registry, snapshot_path, options)
+
+
+def acquire_embeddings(name, resource_registry=None, use_ELMo=False, snapshot_path=None, **options):
+    """
+    Return the shared Embeddings of a name, resource registry and options (see Embeddings), loaded on the first
+    acquisition, and count a reference to them, to be released with release_embeddings()
+    """
+    if use_ELMo:
+        return Embeddings(name, resource_registry=resource_registry, use_ELMo=use_ELMo, snapshot_path=snapshot_path,
+                          **options)
+    # use_cache is the ELMo cache, not relevant without ELMo
+    options.pop("use_cache", None)
+    key = embeddings_key(name, resource_registry, snapshot_path, **options)
+    with _lock:
+        entry = _shared.get(key)
+        if entry is None:
+            embeddings = Embeddings(name, resource_registry=resource_registry, snapshot_path=snapshot_path, **options)
+            entry = _shared[key] = _SharedEntry(embeddings)
+            _keys[id(embeddings)] = key
+        entry.references += 1
+        return entry.embeddings
+
+
+def release_embeddings(embeddings):
+    """
+    Release a reference to shared Embeddings, closed when no reference remains. Embeddings which are not shared
+    are left as is.
+    """
+    if embeddings is None:
+        return
+    with _lock:
+        key = _keys.get(id(embeddings))
+        if key is None or _shared[key].embeddings is not embeddings:
+            return
+        entry = _shared[key]
+        entry.references -= 1
+        if entry.references > 0:
+            return
+        del _shared[key]
+        del _keys[id(embeddings)]
+    embeddings.close()
+
+
+def shared_embeddings_stats():
+    """
+    Return the number of references of each shared Embeddings, by embeddings name
+    """
+    with _lock:
+        stats = {}
+        for entry in _shared.values():
+            stats[entry.embeddings.name] = stats.get(entry.embeddings.name, 0) + entry.references
+        return stats
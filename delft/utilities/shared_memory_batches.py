@@ -0,0 +1,272 @@
+"""
+Transport of the training batches from worker processes through shared memory
+
+With use_multiprocessing=True, Keras pickles every batch produced by a worker process to send it to the
+trainer, which means megabytes per batch for the embedding tensors. Here, the batches of a data generator
+are written by the workers into a ring of shared memory slots, and given to the trainer as arrays viewing
+these slots, without copy.
+
+A slot is given again to a worker only when no array of its previous batch is still referenced (Keras or
+TensorFlow can keep an array of a batch after the next batch is requested). A batch larger than its slot is
+sent pickled, and the slots are enlarged to the size of this batch at the start of the next epoch.
+
+The workers are forked at the start of each epoch, after the generator has been updated by on_epoch_end(),
+as Keras does for its own worker processes. An embedding database inherited through the fork is not used
+by the workers, they open their own reader (see Embeddings.reopen_after_fork()).
+"""
+import ctypes
+import multiprocessing
+import queue
+import sys
+import traceback
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+from tensorflow.keras.utils import Sequence
+
+DEFAULT_SLOT_SIZE = 16 * 1024 * 1024
+
+# alignment of the arrays in a slot, in bytes
+_ALIGNMENT = 64
+
+# seconds between two checks of the worker processes while waiting for a batch
+_POLL_INTERVAL = 1.0
+
+
+def shared_memory_supported():
+    """
+    Shared memory batches need the fork start method, to give the generator to the workers without pickling it
+    """
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+class SharedMemoryBatches(Sequence):
+    """
+    keras.utils.Sequence giving the batches of a generator produced by a pool of nb_workers processes,
+    through nb_slots shared memory slots of initial size slot_size bytes. The batches are best requested
+    in increasing order, as done by Model.fit() with shuffle=False, since they are prepared in this order.
+    With shuffle, the batches of the generator are given in a new random order at each epoch, as done by
+    Model.fit() with shuffle=True. close() must be called when the training is done.
+    """
+
+    def __init__(self, sequence, nb_workers, nb_slots=None, slot_size=DEFAULT_SLOT_SIZE, shuffle=False):
+        self.sequence = sequence
+        self.shuffle = shuffle
+        # index in the generator of each batch of the epoch, when shuffled
+        self.batch_order = None
+        self.nb_workers = max(1, nb_workers)
+        self.nb_slots = nb_slots if nb_slots is not None else 2 * self.nb_workers
+        self.required_slot_size = slot_size
+        self.slots = [_Slot(slot_size) for _ in range(self.nb_slots)]
+        self._finalizer = weakref.finalize(self, _release_slots, self.slots)
+        self.workers = None
+        self._reset_epoch()
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def __getitem__(self, index):
+        if self.workers is None:
+            self._start_workers()
+        self._schedule(index)
+        if index not in self._pending and index not in self._ready:
+            # no free slot, the batch is made here
+            return self.sequence[self._batch_index(index)]
+        while index not in self._ready:
+            self._receive()
+        slot, layout, batch = self._ready.pop(index)
+        if batch is None:
+            batch = _read_batch(self.slots[slot].buffer, layout)
+        # the slot can be given to a worker again once the arrays of the batch are released
+        self._used_slots.discard(slot)
+        self._schedule()
+        return batch
+
+    def on_epoch_end(self):
+        self._stop_workers()
+        self.sequence.on_epoch_end()
+
+    def close(self):
+        self._stop_workers()
+        self._finalizer()
+
+    def _batch_index(self, index):
+        return index if self.batch_order is None else int(self.batch_order[index])
+
+    def _reset_epoch(self):
+        # batch index -> slot of the batches being made by the workers
+        self._pending = {}
+        # batch index -> (slot, layout, pickled batch or None) of the batches made and not yet requested
+        self._ready = {}
+        # slots of the pending and ready batches
+        self._used_slots = set()
+        self._next_index = 0
+
+    def _start_workers(self):
+        self._enlarge_slots()
+        if self.shuffle:
+            self.batch_order = np.random.permutation(len(self.sequence))
+        context = multiprocessing.get_context("fork")
+        self._tasks = context.SimpleQueue()
+        self._results = context.Queue()
+        self.workers = [context.Process(target=_worker_loop, args=(self.sequence, self.slots, self._tasks, self._results),
+                                        daemon=True) for _ in range(self.nb_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def _stop_workers(self):
+        if self.workers is None:
+            return
+        if len(self._pending) > 0:
+            # batches still being made are not waited for
+            for worker in self.workers:
+                worker.terminate()
+        else:
+            for _ in self.workers:
+                self._tasks.put(None)
+        for worker in self.workers:
+            worker.join()
+        self._tasks.close()
+        self._results.close()
+        self.workers = None
+        self._reset_epoch()
+
+    def _enlarge_slots(self):
+        for i, slot in enumerate(self.slots):
+            if slot.size < self.required_slot_size and self._is_free(i):
+                self.slots[i] = _Slot(self.required_slot_size)
+                slot.release()
+
+    def _is_free(self, slot):
+        return slot not in self._used_slots and not self.slots[slot].is_referenced()
+
+    def _free_slot(self):
+        for slot in range(len(self.slots)):
+            if self._is_free(slot):
+                return slot
+        return None
+
+    def _schedule(self, index=None):
+        """
+        Give the requested batch to a worker if not already done, and the next batches as long as there
+        are free slots
+        """
+        if index is not None and index not in self._pending and index not in self._ready:
+            self._submit(index)
+            self._next_index = max(self._next_index, index + 1)
+        while self._next_index < len(self.sequence):
+            if self._next_index in self._pending or self._next_index in self._ready:
+                self._next_index += 1
+                continue
+            if not self._submit(self._next_index):
+                break
+            self._next_index += 1
+
+    def _submit(self, index):
+        slot = self._free_slot()
+        if slot is None:
+            return False
+        self._used_slots.add(slot)
+        self._pending[index] = slot
+        self._tasks.put((index, self._batch_index(index), slot))
+        return True
+
+    def _receive(self):
+        while True:
+            try:
+                index, slot, layout, batch, size, error = self._results.get(timeout=_POLL_INTERVAL)
+                break
+            except queue.Empty:
+                if any(worker.exitcode is not None for worker in self.workers):
+                    self._stop_workers()
+                    raise RuntimeError("A batch worker process exited unexpectedly")
+        if error is not None:
+            self._stop_workers()
+            raise RuntimeError("Error in a batch worker process:\n" + error)
+        self.required_slot_size = max(self.required_slot_size, size)
+        del self._pending[index]
+        self._ready[index] = (slot, layout, batch)
+
+
+class _Slot(object):
+
+    def __init__(self, size):
+        memory = shared_memory.SharedMemory(create=True, size=size)
+        self.size = size
+        # the arrays of a batch are views of this buffer, and keep a reference to it (NumPy would reference
+        # the underlying mmap, shared by all the views of the memory, for a memoryview). The buffer keeps the
+        # memory mapped, so that the arrays of a batch remain valid after the release of the slot.
+        first_byte = ctypes.c_uint8.from_buffer(memory.buf)
+        self.buffer = (ctypes.c_uint8 * size).from_address(ctypes.addressof(first_byte))
+        del first_byte
+        self.buffer.memory = memory
+
+    def is_referenced(self):
+        # the buffer is otherwise only referenced by the slot (and by the argument of getrefcount)
+        return sys.getrefcount(self.buffer) > 2
+
+    def release(self):
+        if self.buffer is None:
+            return
+        try:
+            self.buffer.memory.unlink()
+        except FileNotFoundError:
+            pass
+        self.buffer = None
+
+
+def _release_slots(slots):
+    for slot in slots:
+        slot.release()
+
+
+def _worker_loop(sequence, slots, tasks, results):
+    embeddings = getattr(sequence, "embeddings", None)
+    if embeddings is not None and hasattr(embeddings, "reopen_after_fork"):
+        embeddings.reopen_after_fork()
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        index, batch_index, slot = task
+        try:
+            batch = sequence[batch_index]
+            layout, size = _write_batch(slots[slot].buffer, batch)
+            results.put((index, slot, layout, batch if layout is None else None, size, None))
+        except Exception:
+            results.put((index, slot, None, None, 0, traceback.format_exc()))
+
+
+def _write_batch(buffer, batch):
+    """
+    Write the arrays of a batch (inputs, targets) in a buffer, return the layout of the batch in the buffer
+    (None if it does not fit or can't be stored in a buffer) and the size it needs
+    """
+    inputs, targets = batch
+    single_input = not isinstance(inputs, (list, tuple))
+    arrays = [np.asarray(inputs)] if single_input else [np.asarray(array) for array in inputs]
+    if targets is not None:
+        arrays.append(np.asarray(targets))
+    if any(array.dtype == object for array in arrays):
+        return None, 0
+
+    specs = []
+    offset = 0
+    for array in arrays:
+        specs.append((array.dtype.str, array.shape, offset))
+        offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+    if offset > len(buffer):
+        return None, offset
+
+    for array, (dtype, shape, array_offset) in zip(arrays, specs):
+        np.ndarray(shape, dtype=dtype, buffer=buffer, offset=array_offset)[...] = array
+    return (single_input, targets is not None, specs), offset
+
+
+def _read_batch(buffer, layout):
+    single_input, has_targets, specs = layout
+    arrays = [np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset) for dtype, shape, offset in specs]
+    targets = arrays.pop() if has_targets else None
+    inputs = arrays[0] if single_input else arrays
+    return inputs, targets
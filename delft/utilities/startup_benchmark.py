@@ -0,0 +1,104 @@
+"""
+Import time and cold start benchmark of DeLFT
+
+Each measure is made in a fresh Python interpreter, so that nothing is already imported, and repeated to report
+the median time. The import of a module gives the time and the heavy libraries it loads, the cold start of a saved
+sequence labelling model is the time of the import, the load of the model and the labelling of a first text.
+
+    python -m delft.utilities.startup_benchmark
+    python -m delft.utilities.startup_benchmark --model grobid-date-BidLSTM_CRF --repeat 3
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+DEFAULT_MODULES = (
+    "delft.utilities.Tokenizer",
+    "delft.utilities.Embeddings",
+    "delft.utilities.Utilities",
+    "delft.sequenceLabelling",
+    "delft.sequenceLabelling.reader",
+    "delft.sequenceLabelling.evaluation",
+    "delft.textClassification",
+    "delft.sequenceLabelling.wrapper",
+    "delft.textClassification.wrapper"
+)
+
+# libraries reported when loaded by an import
+HEAVY_MODULES = ("tensorflow", "tensorflow_addons", "transformers", "sklearn", "pandas", "nltk", "lmdb")
+
+DEFAULT_REPEAT = 5
+
+DEFAULT_TEXT = "The 12th of March 2021"
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+runtime = time.perf_counter() - start
+print(json.dumps({{"runtime": runtime, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+_COLD_START_SCRIPT = """
+import json, time
+start = time.perf_counter()
+from delft.sequenceLabelling import Sequence
+imported = time.perf_counter()
+model = Sequence({model!r})
+model.load()
+loaded = time.perf_counter()
+model.tag([{text!r}], "json")
+tagged = time.perf_counter()
+print(json.dumps({{"import": imported - start, "load": loaded - imported, "first_tag": tagged - loaded,
+                  "runtime": tagged - start}}))
+"""
+
+
+def _run(script):
+    # the result is the last line printed, TensorFlow may print before
+    process = subprocess.run([sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True)
+    if process.returncode != 0:
+        raise RuntimeError("The benchmark run failed:\n" + process.stderr)
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def measure_import(module, repeat=DEFAULT_REPEAT):
+    """
+    Return the median time in seconds of the import of a module in a fresh interpreter, and the heavy libraries
+    it loads
+    """
+    results = [_run(_IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)) for _ in range(repeat)]
+    return float(np.median([result["runtime"] for result in results])), results[-1]["loaded"]
+
+
+def measure_cold_start(model_name, text=DEFAULT_TEXT, repeat=DEFAULT_REPEAT):
+    """
+    Return the median times in seconds of the import of Sequence, the load of a saved model, the labelling of a
+    first text and their total, each run in a fresh interpreter
+    """
+    results = [_run(_COLD_START_SCRIPT.format(model=model_name, text=text)) for _ in range(repeat)]
+    return {key: float(np.median([result[key] for result in results])) for key in results[0]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time and cold start benchmark of DeLFT")
+    parser.add_argument("--modules", nargs="*", default=list(DEFAULT_MODULES), help="modules to import")
+    parser.add_argument("--model", default=None,
+                        help="name of a saved sequence labelling model for the cold start measure")
+    parser.add_argument("--text", default=DEFAULT_TEXT, help="first text labelled for the cold start measure")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="number of runs of each measure")
+
+    args = parser.parse_args()
+
+    for module in args.modules:
+        runtime, loaded = measure_import(module, repeat=args.repeat)
+        print("import %-40s %7.3f s   %s" % (module, runtime, ", ".join(loaded)))
+
+    if args.model is not None:
+        times = measure_cold_start(args.model, text=args.text, repeat=args.repeat)
+        print("cold start of %s: %.3f s (import %.3f s, load %.3f s, first text %.3f s)"
+              % (args.model, times["runtime"], times["import"], times["load"], times["first_tag"]))
@@ -0,0 +1,207 @@
+"""
+Cache of the sub-tokenization of texts by transformer tokenizers
+
+The same texts are sub-tokenized again at each epoch, for each fold of a n-fold training, for the validation
+by the Scorer and for repeated inference. The sub-tokenization of a text (input ids, token type ids, attention
+mask, offsets...) is cached as a single small (nb_rows, nb_sub_tokens) int32 array, keyed by a content hash of
+the kind of encoding, the maximum length and the text (a string or a list of tokens).
+
+There is one cache per tokenizer identity: two tokenizer objects loaded from the same files share their cache.
+The cache is bounded in number of entries (LRU). With a cache directory, the cache is loaded from the entries
+stored there, and save() stores the new entries as a new shard file. A cache can be used by several threads at
+the same time, the texts missing from the cache being possibly encoded by more than one thread.
+"""
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+from delft.utilities.featurization_cache import content_hash
+
+DEFAULT_SUBTOKEN_CACHE_SIZE = 100000
+
+# tokenizer identity -> SubTokenCache
+_caches = {}
+
+# tokenizer object -> tokenizer identity, to hash the tokenizer definition once per tokenizer object
+_identities = weakref.WeakKeyDictionary()
+
+_registry_lock = threading.Lock()
+
+
+def tokenizer_identity(tokenizer):
+    """
+    Content hash of the definition of a tokenizer: the serialized tokenizer for a fast tokenizer (vocabulary,
+    normalization, pre-tokenization, post-processing), the vocabulary and the init parameters otherwise
+    """
+    try:
+        return _identities[tokenizer]
+    except (KeyError, TypeError):
+        pass
+    backend_tokenizer = getattr(tokenizer, "backend_tokenizer", None)
+    if backend_tokenizer is not None:
+        definition = backend_tokenizer.to_str()
+    else:
+        init_kwargs = {key: str(value) for key, value in getattr(tokenizer, "init_kwargs", {}).items()}
+        definition = [getattr(tokenizer, "name_or_path", None), init_kwargs, sorted(tokenizer.get_vocab().items())]
+    identity = content_hash("sub-tokenizer", type(tokenizer).__name__, definition)
+    try:
+        _identities[tokenizer] = identity
+    except TypeError:
+        pass
+    return identity
+
+
+def get_subtoken_cache(tokenizer, max_size=DEFAULT_SUBTOKEN_CACHE_SIZE):
+    """
+    Return the process-wide sub-token cache of a tokenizer
+    """
+    identity = tokenizer_identity(tokenizer)
+    with _registry_lock:
+        cache = _caches.get(identity)
+        if cache is None:
+            cache = _caches[identity] = SubTokenCache(identity, max_size)
+    return cache
+
+
+class SubTokenCache(object):
+    """
+    LRU cache of sub-tokenized texts for one tokenizer identity, with a maximum number of entries
+    """
+
+    def __init__(self, identity, max_size=DEFAULT_SUBTOKEN_CACHE_SIZE):
+        if max_size <= 0:
+            raise ValueError("The size of the sub-token cache must be positive, got " + str(max_size))
+        self.identity = identity
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir = None
+        # keys of the entries not yet stored in the cache directory
+        self._unsaved = set()
+        # shard files already loaded from the cache directory
+        self._loaded_shards = set()
+        # held while reading or modifying the entries, not while encoding
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, kind, items, max_length, encode):
+        """
+        Return the cached arrays of the given items (texts or token lists) for an encoding kind and a maximum
+        length. The missing items are encoded with a single call to encode(missing_items), which returns
+        their (nb_rows, nb_sub_tokens) arrays.
+        """
+        keys = [content_hash(kind, max_length, item) for item in items]
+        results = [None] * len(items)
+        missing = []
+        with self._lock:
+            for i, key in enumerate(keys):
+                array = self.entries.get(key)
+                if array is None:
+                    missing.append(i)
+                else:
+                    self.entries.move_to_end(key)
+                    results[i] = array
+            self.hits += len(items) - len(missing)
+            self.misses += len(missing)
+
+        if len(missing) > 0:
+            encoded = encode([items[i] for i in missing])
+            arrays = []
+            for i, array in zip(missing, encoded):
+                array = np.asarray(array, dtype=np.int32)
+                array.flags.writeable = False
+                results[i] = array
+                arrays.append(array)
+            with self._lock:
+                for i, array in zip(missing, arrays):
+                    self._put(keys[i], array)
+                    if self.cache_dir is not None:
+                        self._unsaved.add(keys[i])
+        return results
+
+    def _put(self, key, array):
+        self.entries[key] = array
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            evicted, _ = self.entries.popitem(last=False)
+            self._unsaved.discard(evicted)
+
+    def persist(self, cache_dir):
+        """
+        Use a cache directory: the entries stored there are loaded, and save() stores there the other entries
+        """
+        cache_dir = os.path.join(cache_dir, self.identity)
+        if cache_dir != self.cache_dir:
+            self.cache_dir = cache_dir
+            self._loaded_shards = set()
+            self._unsaved = set(self.entries.keys())
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in sorted(os.listdir(self.cache_dir)):
+            if not name.endswith(".npz") or name.endswith(".tmp.npz") or name in self._loaded_shards:
+                continue
+            with np.load(os.path.join(self.cache_dir, name), allow_pickle=False) as shard:
+                keys = shard["keys"]
+                shapes = shard["shapes"]
+                values = shard["values"]
+            start = 0
+            with self._lock:
+                for key, (nb_rows, nb_columns) in zip(keys.tolist(), shapes.tolist()):
+                    end = start + nb_rows * nb_columns
+                    key = key.decode("ascii")
+                    if key in self.entries:
+                        self._unsaved.discard(key)
+                    else:
+                        array = values[start:end].reshape((nb_rows, nb_columns))
+                        array.flags.writeable = False
+                        self._put(key, array)
+                    start = end
+            self._loaded_shards.add(name)
+
+    def save(self):
+        """
+        Store the entries added since the last save in a new shard file of the cache directory
+        """
+        with self._lock:
+            if self.cache_dir is None or len(self._unsaved) == 0:
+                return
+            keys = sorted(self._unsaved)
+            arrays = [self.entries[key] for key in keys]
+            self._unsaved.difference_update(keys)
+        shard = {
+            "keys": np.asarray([key.encode("ascii") for key in keys]),
+            "shapes": np.asarray([array.shape for array in arrays], dtype=np.int64).reshape((len(arrays), 2)),
+            "values": np.concatenate([array.ravel() for array in arrays])
+        }
+        name = content_hash(keys) + ".npz"
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, name)
+        # written to a temporary file first so that an interrupted write never leaves a truncated shard
+        tmp_path = path + ".%d.tmp.npz" % os.getpid()
+        np.savez(tmp_path, **shard)
+        os.replace(tmp_path, path)
+        self._loaded_shards.add(name)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._unsaved.clear()
+            self._loaded_shards.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total > 0 else 0.0
+        }
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+from tokenizers import ByteLevelBPETokenizer
+from transformers import BertTokenizerFast, RobertaTokenizerFast
+
+from delft.sequenceLabelling.preprocess import BERTPreprocessor
+
+MAX_SEQUENCE_LENGTH = 16
+
+EMPTY_CHAR_VECTOR = [0, 0, 0]
+EMPTY_FEATURES_VECTOR = [0, 0]
+
+TEXTS = [
+    ['The', 'puppeteer', 'Jim', 'Henson'],
+    ['Zürich', 'café', '☃', 'naïve', '🙂', 'ok'],
+    ['unknownword', 'x'],
+    ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r'],
+    ['puppet', '.'],
+    ['Henry', '☂', 'puppets', 'Zürichs', 'ok']
+]
+
+
+def _wordpiece_tokenizer(tmp_path):
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', 'the', 'puppet', '##eer', 'jim', 'hen', '##son', 'ok',
+             'caf', '##e', 'z', '##uri', '##ch', 'na', '##ive', '.', 'x'] + [chr(c) for c in range(ord('a'), ord('z') + 1)]
+    vocab_file = tmp_path / 'vocab.txt'
+    vocab_file.write_text('\n'.join(dict.fromkeys(vocab)) + '\n', encoding='utf-8')
+    return BertTokenizerFast(vocab_file=str(vocab_file))
+
+
+def _byte_level_bpe_tokenizer(tmp_path):
+    # words are learnt with their leading space, as for the pre-trained RoBERTa tokenizers, except the words of
+    # the last text, which are sub-tokenized into smaller tokens or bytes
+    training_texts = [' ' + ' '.join(text) for text in TEXTS[:-1]] * 10
+    bpe = ByteLevelBPETokenizer()
+    bpe.train_from_iterator(training_texts, vocab_size=1000, min_frequency=2,
+                            special_tokens=['<s>', '<pad>', '</s>', '<unk>', '<mask>'])
+    bpe.save_model(str(tmp_path))
+    return RobertaTokenizerFast(vocab_file=str(tmp_path / 'vocab.json'), merges_file=str(tmp_path / 'merges.txt'),
+                                add_prefix_space=True)
+
+
+def _inputs():
+    # char ids are padded beyond the words of a text, as produced by Preprocessor.transform()
+    chars = [np.asarray([[len(token), i, j % 5] for j, token in enumerate(text)] + [EMPTY_CHAR_VECTOR] * 2,
+                        dtype=np.int32) for i, text in enumerate(TEXTS)]
+    features = [[[j + 1, len(token)] for j, token in enumerate(text)] for text in TEXTS]
+    labels = [['B-%d' % j if j % 2 == 0 else 'O' for j in range(len(text))] for text in TEXTS]
+    return chars, features, labels
+
+
+def _per_text_alignment(preprocessor, chars, features, labels):
+    results = [[] for _ in range(7)]
+    for i, text in enumerate(TEXTS):
+        converted = preprocessor.convert_single_text(text, chars[i],
+                                                     features[i] if features is not None else None,
+                                                     labels[i] if labels is not None else None, MAX_SEQUENCE_LENGTH)
+        for result, value in zip(results, converted):
+            result.append(value)
+    if features is None:
+        results[4] = None
+    if labels is None:
+        results[5] = None
+    return results
+
+
+def _assert_same_alignment(batched, expected):
+    assert len(batched) == len(expected)
+    for batched_values, expected_values in zip(batched, expected):
+        if expected_values is None:
+            assert batched_values is None
+            continue
+        assert len(batched_values) == len(expected_values)
+        for batched_row, expected_row in zip(batched_values, expected_values):
+            assert len(batched_row) == len(expected_row)
+            for batched_value, expected_value in zip(batched_row, expected_row):
+                np.testing.assert_array_equal(np.asarray(batched_value), np.asarray(expected_value))
+
+
+class TestBERTPreprocessor:
+    @pytest.mark.parametrize('tokenizer_factory', [_wordpiece_tokenizer, _byte_level_bpe_tokenizer])
+    @pytest.mark.parametrize('with_features,with_labels', [(True, True), (False, False)])
+    def test_should_align_batch_as_single_texts(self, tmp_path, tokenizer_factory, with_features, with_labels):
+        tokenizer = tokenizer_factory(tmp_path)
+        assert tokenizer.is_fast
+        preprocessor = BERTPreprocessor(tokenizer, EMPTY_FEATURES_VECTOR, EMPTY_CHAR_VECTOR)
+        chars, features, labels = _inputs()
+        features = features if with_features else None
+        labels = labels if with_labels else None
+
+        batched = preprocessor.tokenize_and_align_features_and_labels(TEXTS, chars, features, labels,
+                                                                      maxlen=MAX_SEQUENCE_LENGTH)
+
+        _assert_same_alignment(batched, _per_text_alignment(preprocessor, chars, features, labels))
+
+    def test_should_detect_byte_level_bpe_tokenizer(self, tmp_path):
+        preprocessor = BERTPreprocessor(_byte_level_bpe_tokenizer(tmp_path), EMPTY_FEATURES_VECTOR,
+                                        EMPTY_CHAR_VECTOR)
+        assert preprocessor.is_BPE_SP
+        empty, special, single_char, leading_space = preprocessor.get_vocabulary_tables()
+        assert special[preprocessor.tokenizer.pad_token_id]
+        assert leading_space[preprocessor.tokenizer.convert_tokens_to_ids('ĠThe')]
@@ -0,0 +1,113 @@
+import numpy as np
+
+from delft.sequenceLabelling.data_generator import BaseGenerator
+
+
+def _dataset(nb_samples=200, seed=0):
+    lengths = np.random.RandomState(seed).randint(1, 60, nb_samples)
+    x = np.empty(nb_samples, dtype=object)
+    y = np.empty(nb_samples, dtype=object)
+    for i, length in enumerate(lengths):
+        x[i] = ['w%d' % i] * length
+        y[i] = ['t%d' % i] * length
+    return x, y
+
+
+def _batches(generator):
+    batches = []
+    for start, end in generator.batch_bounds:
+        batches.append((generator.x[start:end], generator.y[start:end]))
+    return batches
+
+
+class TestBaseGeneratorBatching:
+    def test_should_keep_fixed_size_batches_by_default(self):
+        x, y = _dataset(50)
+
+        generator = BaseGenerator(x, y, batch_size=20, shuffle=False)
+
+        assert len(generator) == 3
+        assert generator.batch_bounds == [(0, 20), (20, 40), (40, 50)]
+
+    def test_should_see_each_sample_once_per_epoch_with_bucketing(self):
+        x, y = _dataset()
+        generator = BaseGenerator(x, y, batch_size=16, shuffle=True, length_bucketing=True)
+
+        for _ in range(2):
+            generator.on_epoch_end()
+            seen = []
+            for batch_x, batch_y in _batches(generator):
+                assert len(batch_x) <= 16
+                for tokens, tags in zip(batch_x, batch_y):
+                    # x and y stay aligned
+                    assert tags[0] == 't' + tokens[0][1:]
+                    seen.append(tokens[0])
+            assert sorted(seen) == sorted(tokens[0] for tokens in x)
+            assert len(generator) == int(np.ceil(len(x) / 16))
+
+    def test_should_reduce_padding_with_bucketing(self):
+        x, y = _dataset()
+
+        def padded_tokens(generator):
+            return sum(len(batch_x) * max(len(tokens) for tokens in batch_x) for batch_x, _ in _batches(generator))
+
+        bucketed = BaseGenerator(x, y, batch_size=16, shuffle=True, length_bucketing=True)
+        shuffled = BaseGenerator(x, y, batch_size=16, shuffle=True)
+        shuffled.on_epoch_end()
+
+        assert padded_tokens(bucketed) < padded_tokens(shuffled)
+
+    def test_should_sort_by_length_without_shuffling(self):
+        x, y = _dataset()
+
+        generator = BaseGenerator(x, y, batch_size=16, shuffle=False, length_bucketing=True)
+
+        lengths = [len(tokens) for tokens in generator.x]
+        assert lengths == sorted(lengths)
+
+    def test_should_size_batches_by_token_budget(self):
+        x, y = _dataset(300, seed=1)
+        x[0] = ['long'] * 120
+        y[0] = ['tlong'] * 120
+
+        generator = BaseGenerator(x, y, batch_size=16, shuffle=True, max_tokens_per_batch=100)
+
+        assert generator.length_bucketing
+        nb_samples = 0
+        for batch_x, _ in _batches(generator):
+            max_length = max(len(tokens) for tokens in batch_x)
+            assert len(batch_x) * max_length <= 100 or len(batch_x) == 1
+            nb_samples += len(batch_x)
+        assert nb_samples == len(x)
+
+    def test_should_keep_number_of_batches_with_token_budget(self):
+        x, y = _dataset(2000, seed=2)
+        generator = BaseGenerator(x, y, batch_size=16, shuffle=True, max_tokens_per_batch=400)
+        nb_batches = len(generator)
+        first_order = generator.order.copy()
+
+        for _ in range(5):
+            generator.on_epoch_end()
+            assert len(generator) == nb_batches
+            seen = []
+            for batch_x, batch_y in _batches(generator):
+                assert len(batch_x) * max(len(tokens) for tokens in batch_x) <= 400 or len(batch_x) == 1
+                for tokens, tags in zip(batch_x, batch_y):
+                    assert tags[0] == 't' + tokens[0][1:]
+                    seen.append(tokens[0])
+            assert sorted(seen) == sorted(tokens[0] for tokens in x)
+        # the samples of the same length are shuffled from one epoch to the next
+        assert not np.array_equal(generator.order, first_order)
+
+    def test_should_truncate_lengths_at_max_sequence_length(self):
+        x, y = _dataset()
+
+        generator = BaseGenerator(x, y, batch_size=16, shuffle=False, max_sequence_length=10,
+                                  max_tokens_per_batch=40)
+
+        assert generator.lengths.max() == 10
+        lengths = np.minimum([len(tokens) for tokens in generator.x], 10)
+        for start, end in generator.batch_bounds:
+            assert (end - start) * lengths[start:end].max() <= 40
+        # the longest sequences are truncated, so that batches of 4 of them fit in the budget
+        assert generator.batch_bounds[-2][1] - generator.batch_bounds[-2][0] == 4
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pytest
+
+from delft.sequenceLabelling.data_generator import DataGenerator
+from delft.sequenceLabelling.featurization import featurize_corpus
+from delft.sequenceLabelling.preprocess import Preprocessor, FeaturesPreprocessor
+
+EMBED_SIZE = 3
+
+
+class _HashEmbeddings:
+    """
+    Embeddings with a deterministic vector per word
+    """
+    use_ELMo = False
+
+    def get_word_vectors(self, token_lists, maxlen):
+        batch = np.zeros((len(token_lists), maxlen, EMBED_SIZE), dtype=np.float32)
+        for i, tokens in enumerate(token_lists):
+            for j, token in enumerate(tokens[-maxlen:]):
+                batch[i, j] = [len(token), sum(map(ord, token)) % 97, j]
+        return batch
+
+
+def _corpus():
+    x = np.asarray([['The', 'cat', 'sat', 'on', 'the', 'mat'], ['Paris', '2019'], ['é'], ['a', 'b', 'c'],
+                    ['Yes']], dtype=object)
+    y = np.asarray([['O', 'B-a', 'O', 'O', 'O', 'B-b'], ['B-c', 'B-a'], ['O'], ['O', 'O', 'B-c'], ['B-b']],
+                   dtype=object)
+    features = np.asarray([[[token, token[0].isupper() and 'U' or 'L'] for token in tokens] for tokens in x],
+                          dtype=object)
+    return x, y, features
+
+
+def _preprocessor(x, y, features, return_features, return_casing):
+    feature_preprocessor = None
+    if return_features:
+        feature_preprocessor = FeaturesPreprocessor(features_indices=[1])
+        feature_preprocessor.fit(features)
+    preprocessor = Preprocessor(max_char_length=4, feature_preprocessor=feature_preprocessor,
+                                return_features=return_features, return_casing=return_casing)
+    preprocessor.fit(x, y)
+    return preprocessor
+
+
+def _generator(x, y, features, preprocessor, **kwargs):
+    return DataGenerator(x, y, batch_size=2, preprocessor=preprocessor, embeddings=_HashEmbeddings(),
+                         max_sequence_length=5, shuffle=False, features=features, **kwargs)
+
+
+class TestFeaturization:
+    @pytest.mark.parametrize('return_features,return_casing,use_chain_crf',
+                             [(False, False, False), (True, False, True), (False, True, False)])
+    def test_should_generate_same_batches_as_raw_preprocessing(self, tmp_path, return_features, return_casing,
+                                                               use_chain_crf):
+        x, y, features = _corpus()
+        preprocessor = _preprocessor(x, y, features, return_features, return_casing)
+
+        raw = _generator(x, y, features, preprocessor, use_chain_crf=use_chain_crf)
+        featurized = _generator(x, y, features, preprocessor, use_chain_crf=use_chain_crf,
+                                featurization_cache_dir=str(tmp_path))
+
+        assert featurized.featurized is not None
+        assert len(raw) == len(featurized) == 3
+        for index in range(len(raw)):
+            raw_inputs, raw_y = raw[index]
+            inputs, batch_y = featurized[index]
+            assert len(raw_inputs) == len(inputs)
+            for raw_input, featurized_input in zip(raw_inputs, inputs):
+                assert np.array_equal(np.asarray(raw_input), featurized_input)
+            assert np.array_equal(raw_y, batch_y)
+
+    def test_should_follow_shuffled_order(self, tmp_path):
+        x, y, features = _corpus()
+        preprocessor = _preprocessor(x, y, features, False, False)
+        generator = DataGenerator(x, y, batch_size=2, preprocessor=preprocessor, embeddings=_HashEmbeddings(),
+                                  shuffle=True, featurization_cache_dir=str(tmp_path))
+
+        lengths = []
+        for index in range(len(generator)):
+            inputs, _ = generator[index]
+            lengths.extend(inputs[-1].reshape(-1).tolist())
+
+        assert lengths == [len(tokens) for tokens in generator.x]
+
+    def test_should_reuse_cached_featurization(self, tmp_path):
+        x, y, features = _corpus()
+        preprocessor = _preprocessor(x, y, features, True, True)
+
+        corpus = featurize_corpus(x, y, features, preprocessor, max_sequence_length=5, cache_dir=str(tmp_path))
+        assert len(os.listdir(str(tmp_path))) == 1
+        cached = featurize_corpus(x, y, features, preprocessor, max_sequence_length=5, cache_dir=str(tmp_path))
+
+        assert len(cached) == len(corpus) == len(x)
+        assert cached.vocabulary == corpus.vocabulary
+        assert np.array_equal(cached.labels, corpus.labels)
+        assert cached.lengths().tolist() == [5, 2, 1, 3, 1]
+        # another truncation is another featurization
+        featurize_corpus(x, y, features, preprocessor, max_sequence_length=4, cache_dir=str(tmp_path))
+        assert len(os.listdir(str(tmp_path))) == 2
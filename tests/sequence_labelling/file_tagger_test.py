@@ -0,0 +1,76 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from delft.sequenceLabelling.file_tagger import tag_file
+from delft.sequenceLabelling.preprocess import Preprocessor
+from delft.sequenceLabelling.tagger import Tagger
+
+from .tagger_test import _DigitTaggingModel
+
+TEXTS = ['a b c d e f g 1', 'x 2', 'y', '', 'the 3 little pigs', 'z 4', 'café 5 6']
+
+
+def _tagger(model_class=_DigitTaggingModel):
+    preprocessor = Preprocessor()
+    preprocessor.fit([['a', '1']], [['O', 'B-num']])
+    model_config = SimpleNamespace(model_name='test', batch_size=2, char_embedding_size=25,
+                                   max_sequence_length=None, use_crf=False, use_chain_crf=False)
+    return Tagger(model_class(preprocessor), model_config, preprocessor=preprocessor)
+
+
+class _FailingModel(_DigitTaggingModel):
+    def predict_on_batch(self, data):
+        if len(self.batch_lengths) == 2:
+            raise RuntimeError('prediction failed')
+        return super().predict_on_batch(data)
+
+
+@pytest.fixture
+def file_in(tmp_path):
+    path = tmp_path / 'texts.txt'
+    path.write_text('\n'.join(TEXTS) + '\n', encoding='utf-8')
+    return path
+
+
+class TestTagFile:
+    @pytest.mark.parametrize('chunk_size', [1, 3, 100])
+    def test_should_write_json_as_tagger(self, tmp_path, file_in, chunk_size):
+        file_out = tmp_path / 'out.json'
+
+        tag_file(_tagger(), str(file_in), 'json', file_out=str(file_out), chunk_size=chunk_size, queue_size=1)
+
+        expected = _tagger().tag(TEXTS, 'json')
+        output = file_out.read_text(encoding='utf-8')
+        annotations = json.loads(output)
+        assert annotations['texts'] == expected['texts']
+        expected['date'] = annotations['date']
+        expected['runtime'] = annotations['runtime']
+        assert output == json.dumps(expected, indent=4, ensure_ascii=False) + '\n'
+
+    def test_should_write_json_lines(self, tmp_path, file_in):
+        file_out = tmp_path / 'out.jsonl'
+
+        tag_file(_tagger(), str(file_in), 'jsonl', file_out=str(file_out), chunk_size=3)
+
+        lines = file_out.read_text(encoding='utf-8').splitlines()
+        assert [json.loads(line) for line in lines] == _tagger().tag(TEXTS, 'json')['texts']
+
+    def test_should_write_empty_json_document(self, tmp_path):
+        file_in = tmp_path / 'empty.txt'
+        file_in.write_text('', encoding='utf-8')
+        file_out = tmp_path / 'out.json'
+
+        tag_file(_tagger(), str(file_in), 'json', file_out=str(file_out))
+
+        assert json.loads(file_out.read_text(encoding='utf-8'))['texts'] == []
+
+    def test_should_raise_error_of_a_stage(self, tmp_path, file_in):
+        with pytest.raises(RuntimeError, match='prediction failed'):
+            tag_file(_tagger(_FailingModel), str(file_in), 'jsonl', file_out=str(tmp_path / 'out.jsonl'),
+                     chunk_size=1, queue_size=1)
+
+    def test_should_reject_unknown_output_format(self, file_in):
+        with pytest.raises(ValueError):
+            tag_file(_tagger(), str(file_in), 'conll')
@@ -5,7 +5,8 @@ import numpy as np
 import pytest
 
 # derived from https://github.com/elifesciences/sciencebeam-trainer-delft/tree/develop/tests
-from delft.sequenceLabelling.preprocess import Preprocessor, FeaturesPreprocessor
+from delft.sequenceLabelling.preprocess import Preprocessor, FeaturesPreprocessor, FeatureCardinality, \
+    calculate_cardinality
 
 LOGGER = logging.getLogger(__name__)
 
@@ -59,6 +60,30 @@ class TestWordPreprocessor:
         _, y_transformed = p.transform(X_test, y_test)
         assert y_transformed == [[1, 0]]
 
+    def test_should_pad_char_ids_and_labels(self):
+        preprocessor = Preprocessor(max_char_length=3)
+        preprocessor.fit([['ab', 'abcd']], [['A', 'B']])
+        a, b, c = (preprocessor.vocab_char[char] for char in 'abc')
+
+        (char_ids, lengths), y_transformed = preprocessor.transform(
+            [['abcd', 'x'], ['ba']], [['B', 'A'], ['C']], label_indices=True)
+
+        assert char_ids.dtype == np.int32
+        assert char_ids.tolist() == [[[a, b, c], [1, 0, 0]], [[b, a, 0], [0, 0, 0]]]
+        assert lengths.tolist() == [[2], [1]]
+        assert y_transformed.tolist() == [[2, 1], [0, 0]]
+
+    def test_should_extend_and_one_hot_encode_labels(self):
+        preprocessor = Preprocessor(max_char_length=3)
+        preprocessor.fit([['ab']], [['A']])
+        a, b = (preprocessor.vocab_char[char] for char in 'ab')
+
+        (char_ids, lengths), y_transformed = preprocessor.transform([['ab'], ['b']], [['A'], ['A']], extend=True)
+
+        assert char_ids.tolist() == [[[a, b, 0], [0, 0, 0]], [[b, 0, 0], [0, 0, 0]]]
+        assert lengths.tolist() == [[1], [1]]
+        assert y_transformed.tolist() == [[[0, 1], [1, 0]], [[0, 1], [1, 0]]]
+
     def test_load_example(self, preprocessor1):
         p = Preprocessor.load(preprocessor1)
 
@@ -133,6 +158,41 @@ class TestFeaturesPreprocessor:
         assert features_length == 1
         assert all_close(features_transformed, [[[1], [2], [3]]])
 
+    def test_should_pad_documents_into_int32_array(self):
+        preprocessor = FeaturesPreprocessor(features_indices=[2, 0])
+        features_batch = [
+            [[FEATURE_VALUE_1, FEATURE_VALUE_2, FEATURE_VALUE_3], [FEATURE_VALUE_2, FEATURE_VALUE_2, FEATURE_VALUE_4]],
+            [[FEATURE_VALUE_1, FEATURE_VALUE_1, FEATURE_VALUE_4]]
+        ]
+        preprocessor.fit(features_batch)
+        features_transformed = preprocessor.transform(features_batch, extend=True)
+        assert features_transformed.dtype == np.int32
+        # columns in their order in the tokens, an empty feature list added to each document
+        assert np.array_equal(features_transformed, [
+            [[1, 13], [2, 14], [0, 0]],
+            [[1, 14], [0, 0], [0, 0]]
+        ])
+
+    def test_should_transform_missing_columns_to_zero(self):
+        preprocessor = FeaturesPreprocessor()
+        preprocessor.fit([[[FEATURE_VALUE_1, FEATURE_VALUE_2]]])
+        features_transformed = preprocessor.transform([[[FEATURE_VALUE_1], [FEATURE_VALUE_1, FEATURE_VALUE_2]]])
+        assert np.array_equal(features_transformed, [[[1, 0], [1, 13]]])
+
+    def test_should_transform_same_after_load(self, tmp_path):
+        preprocessor = FeaturesPreprocessor(features_indices=[0, 1])
+        features_batch = [[[FEATURE_VALUE_1, FEATURE_VALUE_3], [FEATURE_VALUE_2, FEATURE_VALUE_4]]]
+        preprocessor.fit(features_batch)
+        expected = preprocessor.transform(features_batch)
+        word_preprocessor = Preprocessor(feature_preprocessor=preprocessor)
+        word_preprocessor.fit([['Word1', 'Word2']], [['label1', 'label2']])
+
+        serialised_file_path = os.path.join(str(tmp_path), "serialised.json")
+        word_preprocessor.save(file_path=serialised_file_path)
+        back = Preprocessor.load(serialised_file_path)
+
+        assert np.array_equal(back.feature_preprocessor.transform(features_batch), expected)
+
     def test_serialize_to_json(self, tmp_path):
         preprocessor = FeaturesPreprocessor(features_indices=[1])
         features_batch = [[
@@ -161,3 +221,38 @@ class TestFeaturesPreprocessor:
                     assert back_as_dict[key].__dict__[sub_key] == original_as_dict[key].__dict__[sub_key]
             else:
                 assert back_as_dict[key] == original_as_dict[key]
+
+
+class TestFeatureCardinality:
+    def test_should_count_all_columns_in_one_pass(self):
+        features_batch = [
+            [],
+            [[FEATURE_VALUE_2, ' ', FEATURE_VALUE_3], [FEATURE_VALUE_1, FEATURE_VALUE_1, FEATURE_VALUE_3]]
+        ]
+        assert calculate_cardinality(features_batch) == [
+            (0, {FEATURE_VALUE_1: 1, FEATURE_VALUE_2: 2}),
+            (1, {FEATURE_VALUE_1: 1}),
+            (2, {FEATURE_VALUE_3: 1})
+        ]
+        assert calculate_cardinality(features_batch, indices=[2]) == [(2, {FEATURE_VALUE_3: 1})]
+
+    def test_should_fit_on_a_stream_of_documents(self):
+        features_batch = [[[FEATURE_VALUE_1, FEATURE_VALUE_2]], [[FEATURE_VALUE_3, FEATURE_VALUE_4]]]
+        expected = FeaturesPreprocessor().fit(features_batch)
+        preprocessor = FeaturesPreprocessor().fit(document for document in features_batch)
+        assert preprocessor.features_indices == expected.features_indices
+        assert preprocessor.features_map_to_index == expected.features_map_to_index
+
+    def test_should_fit_on_merged_shards(self):
+        features_batch = [
+            [[FEATURE_VALUE_1, FEATURE_VALUE_2]],
+            [[FEATURE_VALUE_3, FEATURE_VALUE_2]],
+            [[FEATURE_VALUE_4, FEATURE_VALUE_1]]
+        ]
+        cardinality = FeatureCardinality()
+        for shard in [features_batch[:1], [], features_batch[1:]]:
+            cardinality.merge(FeatureCardinality().update(shard))
+        expected = FeaturesPreprocessor().fit(features_batch)
+        preprocessor = FeaturesPreprocessor().fit(cardinality)
+        assert preprocessor.features_indices == expected.features_indices
+        assert preprocessor.features_map_to_index == expected.features_map_to_index
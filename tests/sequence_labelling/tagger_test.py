@@ -1,7 +1,17 @@
 import logging
+import threading
+import time
+from types import SimpleNamespace
 
-from delft.sequenceLabelling.tagger import get_entities_with_offsets
-from delft.utilities.Tokenizer import tokenizeAndFilter
+import numpy as np
+import pytest
+
+from delft.sequenceLabelling.data_generator import BaseGenerator
+from delft.sequenceLabelling.preprocess import Preprocessor
+from delft.sequenceLabelling.wrapper import Sequence
+from delft.sequenceLabelling.tagger import Tagger, TaggingRun, LabelTables, get_entities_with_offsets, get_batch_chunks, \
+    _chunk_averages
+from delft.utilities.Tokenizer import tokenizeAndFilter, tokenizeAndFilterSimple, TokenizedDocument
 
 LOGGER = logging.getLogger(__name__)
 
@@ -58,3 +68,195 @@ def test_get_entities_with_offsets():
     #         text = text[0:-1]
     #
     #     assert text == original_string[char_start: char_end + 1]
+
+
+class _TokensGenerator(BaseGenerator):
+    def __getitem__(self, index):
+        start, end = self.batch_bounds[index]
+        return [[tokenizeAndFilterSimple(text) if self.tokenize else text for text in self.x[start:end]]], None
+
+
+class _DigitTaggingModel:
+    """
+    Tag the numbers as B-num, recording the padded length of each batch
+    """
+    def __init__(self, preprocessor):
+        self.preprocessor = preprocessor
+        self.batch_lengths = []
+
+    def get_generator(self):
+        return _TokensGenerator
+
+    def predict_on_batch(self, data):
+        batch_tokens = data[0]
+        max_length = max(len(tokens) for tokens in batch_tokens)
+        self.batch_lengths.append(max_length)
+        preds = np.zeros((len(batch_tokens), max_length, len(self.preprocessor.vocab_tag)), dtype=np.float32)
+        for i, tokens in enumerate(batch_tokens):
+            for j, token in enumerate(tokens):
+                preds[i, j, self.preprocessor.vocab_tag['B-num' if token.isdigit() else 'O']] = 1.0
+        return preds
+
+
+class _SparseDigitTaggingModel(_DigitTaggingModel):
+    """
+    Predict label ids, as a model with a CRF layer
+    """
+    def predict_on_batch(self, data):
+        return np.argmax(super().predict_on_batch(data), -1)
+
+
+class _SlowDigitTaggingModel(_DigitTaggingModel):
+    transformer_preprocessor = None
+
+    def predict_on_batch(self, data):
+        # gives the other threads the opportunity to run in the middle of a tagging
+        time.sleep(0.001)
+        return super().predict_on_batch(data)
+
+
+class TestTagger:
+    def test_should_tag_texts_sorted_by_length_in_original_order(self):
+        preprocessor = Preprocessor()
+        preprocessor.fit([['a', '1']], [['O', 'B-num']])
+        model = _DigitTaggingModel(preprocessor)
+        model_config = SimpleNamespace(model_name='test', batch_size=2, char_embedding_size=25,
+                                       max_sequence_length=None, use_crf=False, use_chain_crf=False)
+        texts = ['a b c d e f g 1', 'x 2', 'y', 'the 3 little pigs', 'z 4']
+
+        tags = Tagger(model, model_config, preprocessor=preprocessor).tag(texts, 'list')
+        json_tags = Tagger(model, model_config, preprocessor=preprocessor).tag(texts, 'json')
+
+        assert [[token for token, _ in text_tags] for text_tags in tags] == [text.split(' ') for text in texts]
+        assert tags[1] == [('x', 'O'), ('2', 'B-num')]
+        assert tags[3][1] == ('3', 'B-num')
+        assert [piece["text"] for piece in json_tags["texts"]] == texts
+        assert json_tags["texts"][0]["entities"][0]["text"] == '1'
+        # batches of texts of similar lengths
+        assert model.batch_lengths[:3] == [2, 4, 8]
+
+    def test_should_tag_tokenized_documents_with_their_offsets(self):
+        preprocessor = Preprocessor()
+        preprocessor.fit([['a', '1']], [['O', 'B-num']])
+        model = _DigitTaggingModel(preprocessor)
+        model_config = SimpleNamespace(model_name='test', batch_size=2, char_embedding_size=25,
+                                       max_sequence_length=None, use_crf=False, use_chain_crf=False)
+        # tokens and offsets computed by the caller, with a custom tokenization
+        documents = [TokenizedDocument('x  22', ['x', '22'], [(0, 1), (3, 5)]),
+                     TokenizedDocument('y-3', ['y-', '3'], [(0, 2), (2, 3)])]
+
+        tags = Tagger(model, model_config, preprocessor=preprocessor).tag(documents, 'list')
+        json_tags = Tagger(model, model_config, preprocessor=preprocessor).tag(documents, 'json')
+
+        assert tags == [[('x', 'O'), ('22', 'B-num')], [('y-', 'O'), ('3', 'B-num')]]
+        assert [piece["text"] for piece in json_tags["texts"]] == ['x  22', 'y-3']
+        entity = json_tags["texts"][0]["entities"][0]
+        assert (entity["text"], entity["beginOffset"], entity["endOffset"]) == ('22', 3, 4)
+
+
+    def test_should_not_modify_inputs_for_single_text_with_crf(self):
+        preprocessor = Preprocessor()
+        preprocessor.fit([['a', '1']], [['O', 'B-num']])
+        model = _SparseDigitTaggingModel(preprocessor)
+        model_config = SimpleNamespace(model_name='test', batch_size=1, char_embedding_size=25,
+                                       max_sequence_length=None, use_crf=True, use_chain_crf=False)
+        texts = ['x 2']
+
+        tags = Tagger(model, model_config, preprocessor=preprocessor).tag(texts, 'list')
+
+        assert texts == ['x 2']
+        assert tags == [[('x', 'O'), ('2', 'B-num')]]
+
+    def test_should_tag_single_token_list_with_crf_and_batch_size_one(self):
+        preprocessor = Preprocessor()
+        preprocessor.fit([['a', '1']], [['O', 'B-num']])
+        model_config = SimpleNamespace(model_name='test', batch_size=1, char_embedding_size=25,
+                                       max_sequence_length=None, use_crf=True, use_chain_crf=False)
+
+        # the dummy text added for the CRF layer is shorter than the text
+        tags = Tagger(_SparseDigitTaggingModel(preprocessor), model_config, preprocessor=preprocessor) \
+            .tag([['x', '2', 'y']], 'list')
+
+        assert tags == [[('x', 'O'), ('2', 'B-num'), ('y', 'O')]]
+
+    def test_should_raise_error_for_texts_not_tagged(self):
+        documents = [TokenizedDocument(None, ['x'], []) for _ in range(3)]
+        # the third text is a CRF dummy text, without result
+        run = TaggingRun(documents, None, 2, 1)
+        run.text_results[0] = [('x', 'O')]
+
+        with pytest.raises(RuntimeError):
+            run.results()
+
+        run.text_results[1] = [('x', 'O')]
+        assert run.results() == [[('x', 'O')], [('x', 'O')]]
+
+    def test_should_tag_concurrently_with_one_loaded_model(self):
+        preprocessor = Preprocessor()
+        preprocessor.fit([['a', '1']], [['O', 'B-num']])
+        sequence = Sequence('test', architecture='BidLSTM_CRF', batch_size=3)
+        sequence.p = preprocessor
+        sequence.model = _SlowDigitTaggingModel(preprocessor)
+        queries = [['text %d of %d' % (i, j) for j in range(i % 5 + 1)] + ['x', '1 2 3 4 5 6'] for i in range(16)]
+        expected = [sequence.tag(list(texts), 'list') for texts in queries]
+        results = [None] * len(queries)
+        barrier = threading.Barrier(8)
+
+        def tag(thread_index):
+            barrier.wait()
+            for i in range(thread_index, len(queries), 8):
+                results[i] = sequence.tag(queries[i], 'json' if i % 2 else 'list', batch_size=i % 4 + 1)
+
+        threads = [threading.Thread(target=tag, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i, (texts, result) in enumerate(zip(queries, results)):
+            if i % 2:
+                assert [piece["text"] for piece in result["texts"]] == texts
+                assert [len(piece["entities"]) for piece in result["texts"]] == \
+                       [sum(tag == 'B-num' for _, tag in text_tags) for text_tags in expected[i]]
+            else:
+                assert result == expected[i]
+        assert sequence.model_config.batch_size == 3
+
+
+class TestBatchChunks:
+    def test_should_get_same_chunks_as_get_entities_with_offsets(self):
+        vocab_tag = {'<PAD>': 0, 'O': 1, 'B-PER': 2, 'I-PER': 3, 'B-LOC': 4, 'I-LOC': 5, 'I-ORG': 6}
+        label_tables = LabelTables(vocab_tag)
+        random_state = np.random.RandomState(0)
+        # long sequences of inside labels, empty sequences and sequences longer than their offsets
+        batch_label_ids = [random_state.choice([1, 2, 3, 3, 3, 4, 5, 6], size=random_state.randint(0, 30))
+                           for _ in range(50)]
+        batch_offsets = [[(2 * j, 2 * j + 1) for j in range(max(0, len(label_ids) - random_state.randint(0, 3)))]
+                         for label_ids in batch_label_ids]
+        lengths = [min(len(label_ids), len(offsets)) for label_ids, offsets in zip(batch_label_ids, batch_offsets)]
+
+        text_starts, chunk_starts, chunk_ends, chunk_types = get_batch_chunks(batch_label_ids, lengths, label_tables)
+
+        chunks = [[] for _ in batch_label_ids]
+        chunk_texts = np.searchsorted(text_starts, chunk_starts, side='right') - 1
+        for text_id, chunk_start, chunk_end, type_id in zip(chunk_texts, chunk_starts, chunk_ends, chunk_types):
+            offsets = batch_offsets[text_id]
+            start = chunk_start - text_starts[text_id]
+            end = chunk_end - text_starts[text_id]
+            chunks[text_id].append((label_tables.type_names[type_id], start, end, offsets[start][0],
+                                    offsets[end - 1][1] - 1))
+        for label_ids, offsets, text_chunks in zip(batch_label_ids, batch_offsets, chunks):
+            tags = label_tables.tags[label_ids].tolist()
+            assert text_chunks == get_entities_with_offsets(tags, offsets)
+
+    def test_should_average_chunks_as_np_average(self):
+        random_state = np.random.RandomState(0)
+        values = (random_state.rand(500) * 10.0 ** random_state.randint(-6, 3, size=500)).astype(np.float32)
+        # chunks of 3 tokens or more, where a sequential and a pairwise summation differ
+        starts = np.sort(random_state.choice(490, size=60, replace=False))
+        ends = np.minimum(starts + random_state.randint(3, 12, size=60), len(values))
+
+        averages = _chunk_averages(values, starts, ends)
+
+        assert averages.dtype == values.dtype
+        assert averages.tolist() == [float(np.average(values[start:end])) for start, end in zip(starts, ends)]
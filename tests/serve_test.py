@@ -0,0 +1,113 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from delft.serve import MicroBatcher, InferenceServer
+
+
+class _Recorder:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        return [text.upper() for text in texts]
+
+
+def _submit_concurrently(batcher, queries):
+    results = [None] * len(queries)
+    barrier = threading.Barrier(len(queries))
+
+    def submit(i):
+        barrier.wait()
+        results[i] = batcher.submit(queries[i])
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(queries))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _post(server, path, content):
+    request = urllib.request.Request(server.address + path, data=json.dumps(content).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+class TestMicroBatcher:
+    def test_should_coalesce_concurrent_requests(self):
+        process = _Recorder()
+        batcher = MicroBatcher(process, max_wait=0.5)
+        queries = [['text %d' % i, 'other %d' % i] for i in range(8)]
+        try:
+            results = _submit_concurrently(batcher, queries)
+        finally:
+            batcher.close()
+
+        assert results == [[text.upper() for text in query] for query in queries]
+        assert len(process.batches) < len(queries)
+        stats = batcher.stats()
+        assert (stats['requests'], stats['texts'], stats['batches']) == (8, 16, len(process.batches))
+        assert 0 < stats['latency_p50_ms'] <= stats['latency_p99_ms']
+
+    def test_should_bound_batch_tokens(self):
+        process = _Recorder()
+        batcher = MicroBatcher(process, max_wait=0.5, max_batch_tokens=5)
+        try:
+            results = _submit_concurrently(batcher, [['a b'], ['c d'], ['e f'], ['g h i j k l']])
+        finally:
+            batcher.close()
+
+        assert results == [['A B'], ['C D'], ['E F'], ['G H I J K L']]
+        # a request larger than the bound is batched alone
+        assert sorted(len(' '.join(batch).split(' ')) for batch in process.batches) == [2, 4, 6]
+
+    def test_should_raise_error_of_the_batch(self):
+        def fail(texts):
+            raise RuntimeError('model failure')
+
+        batcher = MicroBatcher(fail, max_wait=0)
+        try:
+            with pytest.raises(RuntimeError, match='model failure'):
+                batcher.submit(['a'])
+        finally:
+            batcher.close()
+
+    def test_should_reject_non_positive_batch_tokens(self):
+        with pytest.raises(ValueError):
+            MicroBatcher(_Recorder(), max_batch_tokens=0)
+
+
+class TestInferenceServer:
+    def test_should_serve_models_with_an_in_process_client(self):
+        server = InferenceServer({'upper': MicroBatcher(_Recorder(), max_wait=0.05)}, port=0).start()
+        try:
+            responses = [None] * 4
+
+            def post(i):
+                responses[i] = _post(server, '/upper', {'texts': ['text %d' % i]})
+
+            threads = [threading.Thread(target=post, args=(i,)) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            assert [response['results'] for response in responses] == [['TEXT %d' % i] for i in range(4)]
+            assert _post(server, '/upper', {'text': 'single'})['results'] == ['SINGLE']
+            with urllib.request.urlopen(server.address + '/stats') as response:
+                assert json.loads(response.read().decode('utf-8'))['upper']['requests'] == 5
+            with pytest.raises(urllib.error.HTTPError) as error:
+                _post(server, '/unknown', {'texts': ['a']})
+            assert error.value.code == 404
+            with pytest.raises(urllib.error.HTTPError) as error:
+                _post(server, '/upper', {'texts': 'not a list'})
+            assert error.value.code == 400
+        finally:
+            server.close()
@@ -0,0 +1,34 @@
+import numpy as np
+
+from delft.textClassification.data_generator import DataGenerator
+
+EMBED_SIZE = 2
+
+
+class _HashEmbeddings:
+    def get_word_vectors(self, token_lists, maxlen):
+        batch = np.zeros((len(token_lists), maxlen, EMBED_SIZE), dtype=np.float32)
+        for i, tokens in enumerate(token_lists):
+            for j, token in enumerate(tokens[-maxlen:]):
+                batch[i, j] = [len(token), sum(map(ord, token)) % 97]
+        return batch
+
+
+class TestDataGenerator:
+    def test_should_generate_same_batches_from_featurized_texts(self, tmp_path):
+        x = np.asarray(['The cat sat on the mat.', 'Paris, 2019', 'é', 'a b c d e f g h', 'Yes!'], dtype=object)
+        y = np.eye(5, dtype=np.float32)
+
+        raw = DataGenerator(x, y, batch_size=2, maxlen=4, list_classes=list('abcde'), embeddings=_HashEmbeddings(),
+                            shuffle=False)
+        featurized = DataGenerator(x, y, batch_size=2, maxlen=4, list_classes=list('abcde'),
+                                   embeddings=_HashEmbeddings(), shuffle=True,
+                                   featurization_cache_dir=str(tmp_path))
+
+        for index in range(len(featurized)):
+            batch_x, batch_y = featurized[index]
+            for i in range(len(batch_y)):
+                # the labels identify the texts
+                text_index = int(np.argmax(batch_y[i]))
+                raw_x, _ = raw[text_index // 2]
+                assert np.array_equal(batch_x[i], raw_x[text_index % 2])
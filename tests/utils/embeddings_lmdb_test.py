@@ -0,0 +1,110 @@
+import io
+
+import lmdb
+import numpy as np
+
+from delft.utilities.embeddings_lmdb import parse_vector_lines, compile_embeddings_lmdb, read_lmdb_meta, \
+    read_lmdb_progress, LMDB_META_KEY
+
+EMBED_SIZE = 3
+
+
+def _vec_lines(nb_words, header=True):
+    lines = []
+    if header:
+        lines.append(b'%d %d\n' % (nb_words, EMBED_SIZE))
+    for i in range(nb_words):
+        lines.append(('w%d ' % i + ' '.join(str(i + 0.5 * j) for j in range(EMBED_SIZE)) + ' \n').encode('UTF-8'))
+    return lines
+
+
+def _read_all(env):
+    with env.begin() as txn:
+        return {key: np.frombuffer(value, dtype='<f4').tolist() for key, value in txn.cursor()
+                if not key.startswith(b'\x00')}
+
+
+class _InterruptedFile:
+    def __init__(self, lines, nb_lines):
+        self.lines = lines
+        self.nb_lines = nb_lines
+
+    def __iter__(self):
+        for i, line in enumerate(self.lines):
+            if i == self.nb_lines:
+                raise KeyboardInterrupt()
+            yield line
+
+
+class TestParseVectorLines:
+    def test_should_parse_chunk(self):
+        words, matrix = parse_vector_lines([b'the 0.1 0.2 0.3\n', b'cat 1 2 3 \n'], EMBED_SIZE)
+
+        assert words == [b'the', b'cat']
+        assert matrix.dtype == np.dtype('<f4')
+        assert np.allclose(matrix, [[0.1, 0.2, 0.3], [1, 2, 3]])
+
+    def test_should_parse_words_with_spaces_and_skip_malformed_lines(self):
+        words, matrix = parse_vector_lines(
+            [b'the 0.1 0.2 0.3\n', b'. . . 1 2 3\n', b'bad 1 2\n', 'é 4 5 6\n'.encode('UTF-8')], EMBED_SIZE)
+
+        assert words == [b'the', b'. . .', 'é'.encode('UTF-8')]
+        assert np.allclose(matrix, [[0.1, 0.2, 0.3], [1, 2, 3], [4, 5, 6]])
+
+    def test_should_not_shift_vectors_when_bad_lines_balance_out(self):
+        # a word with a numeric second part gives one value too many, a truncated line one value too few
+        words, matrix = parse_vector_lines(
+            [b'the 0.1 0.2 0.3\n', b'1 2 4 5 6\n', b'bad 7 8\n', b'cat 1 2 3\n'], EMBED_SIZE)
+
+        assert words == [b'the', b'1 2', b'cat']
+        assert np.allclose(matrix, [[0.1, 0.2, 0.3], [4, 5, 6], [1, 2, 3]])
+
+    def test_should_convert_to_float16(self):
+        _, matrix = parse_vector_lines([b'the 0.5 1 2\n'], EMBED_SIZE, dtype='float16')
+
+        assert matrix.dtype == np.dtype('<f2')
+        assert matrix.tolist() == [[0.5, 1, 2]]
+
+
+class TestCompileEmbeddingsLmdb:
+    def test_should_compile_with_workers(self, tmp_path):
+        env = lmdb.open(str(tmp_path / 'db'), map_size=10 * 1024 * 1024)
+
+        nb_words, embed_size = compile_embeddings_lmdb(env, io.BytesIO(b''.join(_vec_lines(25))),
+                                                       nb_workers=2, chunk_size=4)
+
+        assert (nb_words, embed_size) == (25, EMBED_SIZE)
+        vectors = _read_all(env)
+        assert len(vectors) == 25
+        assert vectors[b'w7'] == [7.0, 7.5, 8.0]
+        with env.begin() as txn:
+            assert read_lmdb_meta(txn)["vocab_size"] == 25
+            assert read_lmdb_progress(txn) is None
+        env.close()
+
+    def test_should_compile_without_header(self, tmp_path):
+        env = lmdb.open(str(tmp_path / 'db'), map_size=10 * 1024 * 1024)
+
+        nb_words, embed_size = compile_embeddings_lmdb(env, _vec_lines(5, header=False), nb_workers=1)
+
+        assert (nb_words, embed_size) == (5, EMBED_SIZE)
+        assert _read_all(env)[b'w0'] == [0.0, 0.5, 1.0]
+        env.close()
+
+    def test_should_resume_interrupted_compilation(self, tmp_path):
+        env = lmdb.open(str(tmp_path / 'db'), map_size=10 * 1024 * 1024)
+        lines = _vec_lines(10)
+
+        try:
+            compile_embeddings_lmdb(env, _InterruptedFile(lines, 8), nb_workers=1, chunk_size=3)
+        except KeyboardInterrupt:
+            pass
+        with env.begin() as txn:
+            assert txn.get(LMDB_META_KEY) is None
+            assert read_lmdb_progress(txn)["lines"] == 6
+
+        nb_words, _ = compile_embeddings_lmdb(env, lines, nb_workers=1, chunk_size=3)
+
+        assert nb_words == 10
+        assert sorted(_read_all(env).keys()) == sorted(b'w%d' % i for i in range(10))
+        env.close()
@@ -0,0 +1,57 @@
+import numpy as np
+
+from delft.utilities.Embeddings import read_word_vectors
+from delft.utilities.embeddings_matrix import EmbeddingsMatrix, build_embeddings_matrix
+
+
+def _write_vec_file(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+
+
+class TestEmbeddingsMatrix:
+    def test_should_read_word_vectors_with_header(self, tmp_path):
+        vec_path = str(tmp_path / 'test.vec')
+        _write_vec_file(vec_path, ['2 3', 'the 0.1 0.2 0.3 ', 'cat 1 2 3'])
+
+        word_vectors = list(read_word_vectors(vec_path))
+
+        assert [word for word, _ in word_vectors] == ['the', 'cat']
+        assert np.allclose(word_vectors[0][1], [0.1, 0.2, 0.3])
+
+    def test_should_read_words_with_spaces(self, tmp_path):
+        vec_path = str(tmp_path / 'test.vec')
+        _write_vec_file(vec_path, ['the 0.1 0.2 0.3', '. . . 1 2 3'])
+
+        word_vectors = list(read_word_vectors(vec_path))
+
+        assert [word for word, _ in word_vectors] == ['the', '. . .']
+
+    def test_should_build_and_lookup(self, tmp_path):
+        words = ['the', 'cat', 'é', '2019', 'Cat']
+        vectors = np.arange(len(words) * 4, dtype=np.float32).reshape(len(words), 4)
+        matrix_path = str(tmp_path / 'matrix')
+
+        nb_words, embed_size = build_embeddings_matrix(zip(words, vectors), matrix_path, name='test')
+        assert (nb_words, embed_size) == (5, 4)
+
+        matrix = EmbeddingsMatrix(matrix_path)
+        assert matrix.vocab_size == 5
+        assert matrix.embed_size == 4
+        for row, word in enumerate(words):
+            assert matrix.get_row(word) == row
+            assert matrix.get_word(row) == word
+            assert np.array_equal(matrix.get_word_vector(word), vectors[row])
+        assert matrix.get_row('dog') == -1
+        assert matrix.get_word_vector('dog') is None
+        matrix.close()
+
+    def test_should_keep_first_vector_of_duplicated_word(self, tmp_path):
+        matrix_path = str(tmp_path / 'matrix')
+        build_embeddings_matrix([('a', [1.0, 1.0]), ('a', [2.0, 2.0])], matrix_path)
+
+        matrix = EmbeddingsMatrix(matrix_path)
+
+        assert np.array_equal(matrix.get_word_vector('a'), [1.0, 1.0])
+        matrix.close()
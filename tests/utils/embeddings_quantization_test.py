@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from delft.utilities.embeddings_quantization import quantize, dequantize, encode_vectors, decode_vectors, \
+    decode_vector, store_name, check_storage_dtype
+
+
+class TestEmbeddingsQuantization:
+    def test_should_quantize_int8_with_scale_per_vector(self):
+        vectors = np.random.RandomState(0).uniform(-2, 2, (5, 10)).astype(np.float32)
+        vectors[3] = 0.0
+
+        values, scales = quantize(vectors, 'int8')
+
+        assert values.dtype == np.int8
+        assert scales.shape == (5,)
+        assert np.abs(values).max() == 127
+        assert not values[3].any()
+        restored = dequantize(values, scales)
+        assert np.all(np.abs(restored - vectors) <= scales[:, None] / 2 + 1e-6)
+
+    @pytest.mark.parametrize('dtype,tolerance', [('float32', 0.0), ('float16', 1e-3), ('int8', 1e-2)])
+    def test_should_encode_and_decode_vectors(self, dtype, tolerance):
+        vectors = np.random.RandomState(1).uniform(-1, 1, (4, 6)).astype(np.float32)
+
+        encoded = encode_vectors(vectors, dtype)
+        decoded = decode_vectors(b''.join(row.tobytes() for row in encoded), dtype, 6)
+
+        assert decoded.dtype == np.float32
+        assert np.allclose(decoded, vectors, atol=tolerance, rtol=0)
+        assert np.array_equal(decode_vector(encoded[2].tobytes(), dtype), decoded[2])
+
+    def test_should_name_stores_by_dtype(self):
+        assert store_name('glove-840B', 'float32') == 'glove-840B'
+        assert store_name('glove-840B', 'int8') == 'glove-840B.int8'
+
+    def test_should_reject_unknown_dtype(self):
+        with pytest.raises(ValueError):
+            check_storage_dtype('int4')
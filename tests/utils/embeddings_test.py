@@ -0,0 +1,294 @@
+import os
+import pickle
+import sys
+import threading
+from types import SimpleNamespace
+
+import lmdb
+import numpy as np
+import pytest
+
+from delft.utilities.Embeddings import Embeddings, BACKEND_LMDB, BACKEND_MEMMAP, BACKEND_MEMORY, \
+    convert_lmdb_embeddings, load_resource_registry
+from delft.utilities.embeddings_lmdb import LMDB_META_KEY, read_lmdb_meta
+from delft.utilities.embeddings_cache import WordVectorCache
+import delft.sequenceLabelling.wrapper
+from delft.sequenceLabelling.preprocess import Preprocessor, to_vector_single, to_vector_batch
+from delft.sequenceLabelling.wrapper import Sequence
+
+WORDS = ['the', 'cat', 'sat', 'on', 'mat', '0', 'Paris', 'é']
+EMBED_SIZE = 4
+
+
+def _create_registry(tmp_path, backend):
+    vec_path = tmp_path / 'toy.vec'
+    with open(vec_path, 'w', encoding='utf-8') as f:
+        f.write('%d %d\n' % (len(WORDS), EMBED_SIZE))
+        for i, word in enumerate(WORDS):
+            f.write(word + ' ' + ' '.join(str(i + 0.25 * j) for j in range(EMBED_SIZE)) + '\n')
+    return {
+        "embedding-backend": backend,
+        "embedding-lmdb-path": str(tmp_path / 'db'),
+        "embedding-memmap-path": str(tmp_path / 'matrix'),
+        "embedding-download-path": str(tmp_path / 'download'),
+        "embeddings": [{"name": "toy", "path": str(vec_path), "type": "glove", "format": "vec", "lang": "en"}],
+        "embeddings-contextualized": [],
+        "transformers": []
+    }
+
+
+@pytest.fixture(params=[BACKEND_LMDB, BACKEND_MEMMAP, BACKEND_MEMORY])
+def embeddings(request, tmp_path):
+    return Embeddings('toy', resource_registry=_create_registry(tmp_path, request.param))
+
+
+class TestEmbeddingsBatchLookup:
+    def test_should_get_batch_of_word_vectors(self, embeddings):
+        token_lists = [['the', 'cat', 'sat'], ['the', 'dog'], []]
+
+        batch = embeddings.get_word_vectors(token_lists, 4)
+
+        assert batch.shape == (3, 4, EMBED_SIZE)
+        assert batch.dtype == np.float32
+        for i, tokens in enumerate(token_lists):
+            for j in range(4):
+                if j < len(tokens):
+                    expected = embeddings.get_word_vector(tokens[j])
+                else:
+                    expected = np.zeros((EMBED_SIZE,))
+                assert np.array_equal(batch[i, j], expected)
+        # unknown word
+        assert not batch[1, 1].any()
+
+    def test_should_keep_last_tokens_of_long_sequences(self, embeddings):
+        batch = embeddings.get_word_vectors([['the', 'cat', 'sat']], 2)
+
+        assert np.array_equal(batch[0, 0], embeddings.get_word_vector('cat'))
+        assert np.array_equal(batch[0, 1], embeddings.get_word_vector('sat'))
+
+    def test_should_match_single_sequence_vectorization(self, embeddings):
+        token_lists = [['The', 'cat', 'sat', 'on', 'the', 'mat', 'in', '2019'], ['Paris', 'é', '7']]
+
+        batch = to_vector_batch(token_lists, embeddings, 8)
+
+        for i, tokens in enumerate(token_lists):
+            assert np.array_equal(batch[i], to_vector_single(tokens, embeddings, 8))
+
+
+class TestWordVectorCache:
+    def test_should_evict_least_recently_used(self):
+        cache = WordVectorCache(2, EMBED_SIZE)
+        cache.put('a', np.ones((EMBED_SIZE,), dtype=np.float32))
+        cache.put('b', np.ones((EMBED_SIZE,), dtype=np.float32))
+        assert cache.get('a') is not None
+        cache.put('c', None)
+
+        assert 'a' in cache
+        assert 'b' not in cache
+        assert cache.get('c') is cache.oov_vector
+        assert cache.stats()['hits'] == 2
+        assert cache.get('b') is None
+        assert cache.stats()['misses'] == 1
+
+    def test_should_cache_lmdb_lookups(self, tmp_path):
+        registry = _create_registry(tmp_path, BACKEND_LMDB)
+        registry['embedding-cache-size'] = 3
+        embeddings = Embeddings('toy', resource_registry=registry)
+
+        assert embeddings.warm_cache(['the', 'dog', 'cat', 'sat']) == 3
+        assert len(embeddings.cache) == 3
+
+        vector = embeddings.get_word_vector('cat')
+        assert not vector.flags.writeable
+        assert np.array_equal(vector, [1.0, 1.25, 1.5, 1.75])
+        assert embeddings.get_word_vector('dog') is embeddings.cache.oov_vector
+        assert embeddings.cache.hits == 2
+
+        batch = embeddings.get_word_vectors([['the', 'mat', 'dog']], 3)
+        assert np.array_equal(batch[0, 1], [4.0, 4.25, 4.5, 4.75])
+        assert not batch[0, 2].any()
+        assert 'mat' in embeddings.cache
+
+    def test_should_look_up_concurrently(self, tmp_path):
+        registry = _create_registry(tmp_path, BACKEND_LMDB)
+        registry['embedding-cache-size'] = 2
+        embeddings = Embeddings('toy', resource_registry=registry)
+        words = ['the', 'cat', 'mat', 'dog', 'sat']
+        expected = {word: embeddings.get_word_vector(word).copy() for word in words}
+        errors = []
+
+        def look_up(offset):
+            try:
+                for i in range(500):
+                    word = words[(i + offset) % len(words)]
+                    assert np.array_equal(embeddings.get_word_vector(word), expected[word])
+                    assert np.array_equal(embeddings.get_word_vectors([[word]], 1)[0, 0], expected[word])
+            except Exception as e:
+                errors.append(e)
+
+        # frequent thread switches, to interleave the lookups
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=look_up, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        assert errors == []
+        assert len(embeddings.cache) == 2
+
+    def test_should_not_cache_without_size(self, embeddings):
+        assert embeddings.cache is None
+        assert embeddings.warm_cache(['the']) == 0
+
+
+def _write_pickle_lmdb(env_path, word_vectors):
+    os.makedirs(env_path)
+    env = lmdb.open(env_path, map_size=10 * 1024 * 1024)
+    with env.begin(write=True) as txn:
+        for word, vector in word_vectors:
+            txn.put(word.encode(encoding='UTF-8'), pickle.dumps(vector))
+    env.close()
+
+
+def _read_lmdb(env):
+    with env.begin() as txn:
+        meta = read_lmdb_meta(txn)
+        values = {key: value for key, value in txn.cursor() if key != LMDB_META_KEY}
+    return meta, values
+
+
+class TestLmdbLayout:
+    def test_should_store_raw_float32_vectors(self, tmp_path):
+        embeddings = Embeddings('toy', resource_registry=_create_registry(tmp_path, BACKEND_LMDB))
+
+        meta, values = _read_lmdb(embeddings.env)
+
+        assert meta == {"format_version": 2, "dtype": "float32", "embed_size": EMBED_SIZE, "vocab_size": len(WORDS)}
+        assert values['cat'.encode('UTF-8')] == np.asarray([1.0, 1.25, 1.5, 1.75], dtype='<f4').tobytes()
+        assert np.array_equal(embeddings.get_word_vector('cat'), [1.0, 1.25, 1.5, 1.75])
+
+    def test_should_store_float16_vectors(self, tmp_path):
+        registry = _create_registry(tmp_path, BACKEND_LMDB)
+        registry['embedding-dtype'] = 'float16'
+        embeddings = Embeddings('toy', resource_registry=registry)
+
+        meta, values = _read_lmdb(embeddings.env)
+
+        assert meta["dtype"] == "float16"
+        assert len(values['cat'.encode('UTF-8')]) == 2 * EMBED_SIZE
+        vector = embeddings.get_word_vector('cat')
+        assert vector.dtype == np.float32
+        assert np.array_equal(vector, [1.0, 1.25, 1.5, 1.75])
+
+    def test_should_convert_pickle_database(self, tmp_path):
+        env_path = str(tmp_path / 'db' / 'toy')
+        vectors = np.random.RandomState(0).uniform(-1, 1, (len(WORDS), EMBED_SIZE)).astype(np.float32)
+        _write_pickle_lmdb(env_path, zip(WORDS, vectors))
+
+        assert convert_lmdb_embeddings(env_path, batch_size=3) == len(WORDS)
+
+        env = lmdb.open(env_path, readonly=True, lock=False)
+        meta, values = _read_lmdb(env)
+        env.close()
+        assert meta["dtype"] == "float32"
+        assert meta["vocab_size"] == len(WORDS)
+        for word, vector in zip(WORDS, vectors):
+            assert np.frombuffer(values[word.encode('UTF-8')], dtype='<f4').tolist() == vector.tolist()
+        assert not os.path.exists(env_path + '.converting')
+        assert not os.path.exists(env_path + '.previous')
+        assert convert_lmdb_embeddings(env_path) == 0
+
+    def test_should_read_legacy_pickle_database(self, tmp_path):
+        words = ['w%d' % i for i in range(120)]
+        vectors = np.random.RandomState(0).uniform(-1, 1, (len(words), 12)).astype(np.float32)
+        _write_pickle_lmdb(str(tmp_path / 'db' / 'toy'), zip(words, vectors))
+
+        embeddings = Embeddings('toy', resource_registry=_create_registry(tmp_path, BACKEND_LMDB))
+
+        assert embeddings.lmdb_value_dtype is None
+        assert embeddings.embed_size == 12
+        assert np.array_equal(embeddings.get_word_vector('w7'), vectors[7])
+
+
+class TestQuantizedEmbeddings:
+    @pytest.mark.parametrize('backend', [BACKEND_LMDB, BACKEND_MEMMAP])
+    @pytest.mark.parametrize('dtype,tolerance', [('float16', 1e-3), ('int8', 0.03)])
+    def test_should_dequantize_batched_lookups(self, tmp_path, backend, dtype, tolerance):
+        registry = _create_registry(tmp_path, backend)
+        registry['embedding-dtype'] = dtype
+        embeddings = Embeddings('toy', resource_registry=registry)
+
+        batch = embeddings.get_word_vectors([['cat', 'é', 'dog']], 3)
+
+        assert batch.dtype == np.float32
+        assert np.allclose(batch[0, 0], [1.0, 1.25, 1.5, 1.75], atol=tolerance, rtol=0)
+        assert np.allclose(batch[0, 1], [7.0, 7.25, 7.5, 7.75], atol=tolerance * 7, rtol=0)
+        assert not batch[0, 2].any()
+        assert np.array_equal(embeddings.get_word_vector('cat'), batch[0, 0])
+        store_root = registry['embedding-lmdb-path'] if backend == BACKEND_LMDB else registry['embedding-memmap-path']
+        assert os.path.isdir(os.path.join(store_root, 'toy.' + dtype))
+
+
+class TestEmbeddingsSnapshot:
+    def test_should_save_snapshot_of_vocabulary_and_top_words(self, embeddings, tmp_path):
+        snapshot_path = str(tmp_path / 'snapshot')
+
+        nb_words = embeddings.save_snapshot(snapshot_path, ['Paris', 'dog', 'cat'], top_n=2)
+
+        assert nb_words == 3
+        snapshot = Embeddings('toy', snapshot_path=snapshot_path)
+        assert snapshot.embed_size == EMBED_SIZE
+        assert snapshot.vocab_size == 3
+        token_lists = [['the', 'cat', 'sat', 'Paris', 'dog', 'mat']]
+        batch = snapshot.get_word_vectors(token_lists, 6)
+        expected = embeddings.get_word_vectors(token_lists, 6)
+        for j in (0, 1, 3, 4):
+            assert np.array_equal(batch[0, j], expected[0, j])
+        # words out of the snapshot are unknown
+        assert not batch[0, 2].any()
+        assert not batch[0, 5].any()
+
+    def test_should_save_snapshot_of_saved_model_vocabulary(self, tmp_path, monkeypatch):
+        registry = _create_registry(tmp_path, BACKEND_LMDB)
+        monkeypatch.setattr(delft.sequenceLabelling.wrapper, 'load_resource_registry', lambda path: registry)
+        dir_path = str(tmp_path / 'models')
+        trained = Sequence('toy-model', architecture='BidLSTM_CRF', embeddings_name='toy')
+        trained.p = Preprocessor()
+        trained.p.fit([['cat', 'Paris']], [['O', 'O']])
+        trained.model = SimpleNamespace(save=lambda path: None, transformer_config=None,
+                                        transformer_preprocessor=None)
+        trained.training_vocabulary = ['Paris', 'cat']
+
+        trained.save(dir_path)
+        # the snapshot is exported later, by a process without the training vocabulary in memory
+        Sequence('toy-model', architecture='BidLSTM_CRF', embeddings_name='toy').save_embeddings_snapshot(dir_path,
+                                                                                                      top_n=1)
+
+        snapshot = Embeddings('toy', snapshot_path=os.path.join(dir_path, 'toy-model', 'embeddings'))
+        assert snapshot.vocab_size == 3
+        assert np.array_equal(snapshot.get_word_vector('Paris'), trained.embeddings.get_word_vector('Paris'))
+
+    def test_should_get_top_words(self, embeddings):
+        assert embeddings.get_top_words(3) == ['the', 'cat', 'sat']
+        assert embeddings.get_top_words(0) == []
+
+
+class TestResourceRegistry:
+    def test_should_parse_registry_once_until_modified(self, tmp_path):
+        path = tmp_path / 'registry.json'
+        path.write_text('{"embedding-dtype": "float32", "embeddings": [{"name": "toy"}]}', encoding='utf-8')
+
+        first = load_resource_registry(str(path))
+        first["embedding-dtype"] = "int8"
+        second = load_resource_registry(str(path))
+        assert second["embedding-dtype"] == "float32"
+        assert second["embeddings"] is first["embeddings"]
+
+        path.write_text('{"embedding-dtype": "float16", "embeddings": []}', encoding='utf-8')
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+        assert load_resource_registry(str(path)) == {"embedding-dtype": "float16", "embeddings": []}
@@ -0,0 +1,39 @@
+import numpy as np
+
+from delft.utilities.featurization_cache import content_hash, range_indices, encode_token_sequences, \
+    decode_vocabulary, load_featurization, save_featurization
+
+
+class TestFeaturizationCache:
+    def test_should_hash_content(self):
+        x = [['the', 'cat'], ['sat']]
+
+        assert content_hash(x, 3) == content_hash([['the', 'cat'], ['sat']], 3)
+        assert content_hash(x, 3) != content_hash([['the', 'cat', 'sat']], 3)
+        assert content_hash(x, 3) != content_hash([['thecat'], ['sat']], 3)
+        assert content_hash(x, 3) != content_hash(x, 4)
+        assert content_hash({'a': 1}) != content_hash({'a': 2})
+        assert content_hash(np.asarray(x, dtype=object)) == content_hash(x)
+
+    def test_should_compute_range_indices(self):
+        assert range_indices([5, 0, 2], [2, 0, 3]).tolist() == [5, 6, 2, 3, 4]
+        assert range_indices([], []).tolist() == []
+
+    def test_should_encode_token_sequences(self):
+        arrays, vocabulary = encode_token_sequences([['the', 'é', 'the'], [], ['cat']])
+
+        assert vocabulary == ['the', 'é', 'cat']
+        assert decode_vocabulary(arrays) == vocabulary
+        assert arrays["token_ids"].dtype == np.uint8
+        assert arrays["token_ids"].tolist() == [0, 1, 0, 2]
+        assert arrays["offsets"].tolist() == [0, 3, 3, 4]
+
+    def test_should_save_and_load_featurization(self, tmp_path):
+        cache_dir = str(tmp_path / 'cache')
+
+        assert load_featurization(cache_dir, 'key') is None
+        save_featurization(cache_dir, 'key', {'a': np.arange(3, dtype=np.uint16)})
+
+        arrays = load_featurization(cache_dir, 'key')
+        assert arrays['a'].dtype == np.uint16
+        assert arrays['a'].tolist() == [0, 1, 2]
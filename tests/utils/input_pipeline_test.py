@@ -0,0 +1,87 @@
+import numpy as np
+import tensorflow as tf
+
+from delft.utilities.input_pipeline import sequence_to_dataset, TrainingDataset, CACHE_IN_MEMORY
+
+
+class _Batches(tf.keras.utils.Sequence):
+    """
+    Sequence of batches of variable widths, with a number of batches changing at each epoch
+    """
+
+    def __init__(self, nb_batches=3):
+        self.nb_batches = nb_batches
+        self.nb_epochs = 0
+
+    def __len__(self):
+        return self.nb_batches
+
+    def __getitem__(self, index):
+        width = index + 2
+        word_input = np.full((2, width, 3), index, dtype=np.float32)
+        length_input = np.full((2, 1), width, dtype=np.int32)
+        labels = np.full((2, width), index, dtype=np.int32)
+        return [word_input, length_input], labels
+
+    def on_epoch_end(self):
+        self.nb_epochs += 1
+        self.nb_batches += 1
+
+
+def _as_numpy(dataset):
+    return [([np.asarray(tensor) for tensor in inputs], np.asarray(labels)) for inputs, labels in dataset]
+
+
+class TestInputPipeline:
+    def test_should_produce_the_batches_of_the_sequence(self):
+        sequence = _Batches()
+        batches = _as_numpy(sequence_to_dataset(sequence))
+
+        assert len(batches) == len(sequence)
+        for index, (inputs, labels) in enumerate(batches):
+            expected_inputs, expected_labels = sequence[index]
+            assert len(inputs) == len(expected_inputs)
+            for tensor, expected in zip(inputs, expected_inputs):
+                assert tensor.dtype == expected.dtype
+                assert np.array_equal(tensor, expected)
+            assert np.array_equal(labels, expected_labels)
+
+    def test_should_follow_the_number_of_batches_of_each_epoch(self):
+        sequence = _Batches()
+        training_dataset = TrainingDataset(sequence, num_parallel_calls=1)
+        callback = training_dataset.callbacks[0]
+
+        assert len(_as_numpy(training_dataset.dataset)) == 3
+        callback.on_epoch_end(0)
+        assert len(_as_numpy(training_dataset.dataset)) == 4
+
+    def test_should_replay_cached_batches_in_shuffled_order(self, tmp_path):
+        for cache in [CACHE_IN_MEMORY, str(tmp_path)]:
+            sequence = _Batches(nb_batches=6)
+            training_dataset = TrainingDataset(sequence, cache=cache)
+            assert training_dataset.callbacks == []
+
+            first = sorted(int(labels[0, 0]) for _, labels in _as_numpy(training_dataset.dataset))
+            second = sorted(int(labels[0, 0]) for _, labels in _as_numpy(training_dataset.dataset))
+            assert first == second == list(range(6))
+
+            cache_dir = training_dataset.cache_dir
+            training_dataset.close()
+            if cache != CACHE_IN_MEMORY:
+                assert tmp_path.exists() and list(tmp_path.iterdir()) == []
+            else:
+                assert cache_dir is None
+
+    def test_should_fit_a_model(self):
+        word_input = tf.keras.Input(shape=(None, 3))
+        length_input = tf.keras.Input(shape=(1,), dtype='int32')
+        output = tf.keras.layers.Dense(1)(word_input)
+        model = tf.keras.Model(inputs=[word_input, length_input], outputs=output)
+        model.compile(optimizer='sgd', loss='mse')
+
+        sequence = _Batches()
+        training_dataset = TrainingDataset(sequence)
+        model.fit(training_dataset.dataset, epochs=2, verbose=0, callbacks=training_dataset.callbacks)
+        training_dataset.close()
+
+        assert sequence.nb_epochs == 2
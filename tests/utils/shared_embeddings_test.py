@@ -0,0 +1,60 @@
+import gc
+
+import pytest
+
+import delft.sequenceLabelling.wrapper
+from delft.sequenceLabelling.wrapper import Sequence
+from delft.utilities.Embeddings import BACKEND_LMDB, BACKEND_MEMMAP, BACKEND_MEMORY
+from delft.utilities.shared_embeddings import acquire_embeddings, release_embeddings, shared_embeddings_stats
+
+from .embeddings_test import _create_registry
+
+
+class TestSharedEmbeddings:
+    @pytest.mark.parametrize('backend', [BACKEND_LMDB, BACKEND_MEMMAP, BACKEND_MEMORY])
+    def test_should_share_embeddings_until_last_release(self, tmp_path, backend):
+        registry = _create_registry(tmp_path, backend)
+
+        first = acquire_embeddings('toy', resource_registry=registry)
+        second = acquire_embeddings('toy', resource_registry=dict(registry), use_cache=False)
+        assert second is first
+        assert shared_embeddings_stats()['toy'] == 2
+
+        release_embeddings(first)
+        assert first.get_word_vector('cat')[0] == 1.0
+        release_embeddings(second)
+        assert 'toy' not in shared_embeddings_stats()
+        assert first.env is None and first.matrix is None
+
+        third = acquire_embeddings('toy', resource_registry=registry)
+        assert third is not first
+        assert third.get_word_vector('cat')[0] == 1.0
+        release_embeddings(third)
+
+    def test_should_not_share_embeddings_of_other_options(self, tmp_path):
+        registry = _create_registry(tmp_path, BACKEND_LMDB)
+        float16_registry = dict(registry, **{"embedding-dtype": "float16"})
+
+        first = acquire_embeddings('toy', resource_registry=registry)
+        second = acquire_embeddings('toy', resource_registry=float16_registry)
+        try:
+            assert second is not first
+            assert shared_embeddings_stats()['toy'] == 2
+        finally:
+            release_embeddings(first)
+            release_embeddings(second)
+
+    def test_should_share_embeddings_between_models(self, tmp_path, monkeypatch):
+        registry = _create_registry(tmp_path, BACKEND_MEMMAP)
+        monkeypatch.setattr(delft.sequenceLabelling.wrapper, 'load_resource_registry', lambda path: registry)
+
+        first = Sequence('first', architecture='BidLSTM_CRF', embeddings_name='toy')
+        second = Sequence('second', architecture='BidLSTM_CRF', embeddings_name='toy')
+        assert second.embeddings is first.embeddings
+        assert shared_embeddings_stats()['toy'] == 2
+
+        del first
+        gc.collect()
+        assert shared_embeddings_stats()['toy'] == 1
+        second._set_embeddings(None)
+        assert 'toy' not in shared_embeddings_stats()
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from delft.utilities.shared_memory_batches import SharedMemoryBatches, shared_memory_supported
+
+pytestmark = pytest.mark.skipif(not shared_memory_supported(), reason="fork start method not available")
+
+
+class _Batches(tf.keras.utils.Sequence):
+    """
+    Batches of variable widths depending on the epoch, with the pid of the process making each batch
+    """
+
+    def __init__(self, nb_batches=5, failing_index=None):
+        self.nb_batches = nb_batches
+        self.epoch = 0
+        self.failing_index = failing_index
+
+    def __len__(self):
+        return self.nb_batches
+
+    def __getitem__(self, index):
+        if index == self.failing_index:
+            raise ValueError("bad batch")
+        width = index + 2 + self.epoch
+        word_input = np.full((2, width, 3), index, dtype=np.float32)
+        pid_input = np.full((1,), os.getpid(), dtype=np.int64)
+        labels = np.full((2, width), self.epoch, dtype=np.int32)
+        return [word_input, pid_input], labels
+
+    def on_epoch_end(self):
+        self.epoch += 1
+        self.nb_batches += 1
+
+
+def _check_batch(batch, index, epoch):
+    (word_input, pid_input), labels = batch
+    assert word_input.shape == (2, index + 2 + epoch, 3)
+    assert np.all(word_input == index)
+    assert np.all(labels == epoch)
+    return int(pid_input[0])
+
+
+class TestSharedMemoryBatches:
+    def test_should_give_the_batches_made_by_the_workers(self):
+        batches = SharedMemoryBatches(_Batches(), nb_workers=2)
+        try:
+            for epoch in range(2):
+                assert len(batches) == 5 + epoch
+                pids = [_check_batch(batches[index], index, epoch) for index in range(len(batches))]
+                assert os.getpid() not in pids
+                batches.on_epoch_end()
+        finally:
+            batches.close()
+
+    def test_should_not_reuse_a_slot_of_a_referenced_batch(self):
+        batches = SharedMemoryBatches(_Batches(nb_batches=8), nb_workers=1, nb_slots=2)
+        try:
+            kept = [batches[index] for index in range(4)]
+            # all the slots are held, the next batches are made in this process
+            assert _check_batch(batches[4], 4, 0) == os.getpid()
+            for index, batch in enumerate(kept):
+                _check_batch(batch, index, 0)
+            kept = None
+            assert _check_batch(batches[5], 5, 0) != os.getpid()
+        finally:
+            batches.close()
+
+    def test_should_support_requests_out_of_order(self):
+        batches = SharedMemoryBatches(_Batches(), nb_workers=2, shuffle=True)
+        try:
+            for index in [3, 0, 4, 1, 2, 0]:
+                (word_input, _), _ = batches[index]
+                assert word_input[0, 0, 0] == batches.batch_order[index]
+        finally:
+            batches.close()
+
+    def test_should_send_large_batches_and_enlarge_the_slots(self):
+        batches = SharedMemoryBatches(_Batches(), nb_workers=1, slot_size=128)
+        try:
+            for index in range(len(batches)):
+                _check_batch(batches[index], index, 0)
+            batches.on_epoch_end()
+            _check_batch(batches[0], 0, 1)
+            assert all(slot.size >= batches.required_slot_size > 128 for slot in batches.slots)
+        finally:
+            batches.close()
+
+    def test_should_raise_the_errors_of_the_workers(self):
+        batches = SharedMemoryBatches(_Batches(failing_index=1), nb_workers=1)
+        try:
+            with pytest.raises(RuntimeError, match="bad batch"):
+                for index in range(len(batches)):
+                    batches[index]
+        finally:
+            batches.close()
@@ -0,0 +1,25 @@
+import pytest
+
+from delft.utilities.startup_benchmark import measure_import
+
+
+class TestStartup:
+    @pytest.mark.parametrize('module', [
+        'delft.sequenceLabelling',
+        'delft.sequenceLabelling.reader',
+        'delft.sequenceLabelling.evaluation',
+        'delft.textClassification',
+        'delft.utilities.Embeddings',
+        'delft.utilities.Utilities'
+    ])
+    def test_should_import_without_heavy_libraries(self, module):
+        runtime, loaded = measure_import(module, repeat=1)
+
+        assert runtime > 0
+        assert not set(loaded) & {'tensorflow', 'transformers', 'nltk', 'pandas'}
+
+    def test_should_import_transformers_on_first_use(self):
+        _, loaded = measure_import('delft.sequenceLabelling.wrapper', repeat=1)
+
+        assert 'tensorflow' in loaded
+        assert 'transformers' not in loaded
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+from transformers import BertTokenizerFast
+
+from delft.textClassification.preprocess import create_batch_input_bert
+from delft.utilities.subtoken_cache import SubTokenCache, get_subtoken_cache, tokenizer_identity
+
+VOCAB = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]', 'the', 'cat', 'sat', 'on', 'mat', '##s', '.']
+
+
+def _tokenizer(path):
+    path.mkdir(exist_ok=True)
+    vocab_file = path / 'vocab.txt'
+    vocab_file.write_text('\n'.join(VOCAB) + '\n', encoding='utf-8')
+    return BertTokenizerFast(vocab_file=str(vocab_file))
+
+
+def _encode(calls):
+    def encode(items):
+        calls.append(list(items))
+        return [np.asarray([[len(item)] * 2, [0, 1]]) for item in items]
+    return encode
+
+
+class TestSubTokenCache:
+    def test_should_encode_missing_items_only(self):
+        cache = SubTokenCache('identity')
+        calls = []
+
+        first = cache.lookup('kind', ['a', 'bb'], 8, _encode(calls))
+        second = cache.lookup('kind', ['bb', 'ccc', 'a'], 8, _encode(calls))
+
+        assert calls == [['a', 'bb'], ['ccc']]
+        assert second[0] is first[1]
+        assert second[1].tolist() == [[3, 3], [0, 1]]
+        assert not second[1].flags.writeable
+        assert cache.stats()['hits'] == 2
+        assert cache.stats()['misses'] == 3
+
+    def test_should_key_by_kind_and_max_length(self):
+        cache = SubTokenCache('identity')
+        calls = []
+
+        cache.lookup('kind', [['a', 'b']], 8, _encode(calls))
+        cache.lookup('kind', [['a', 'b']], 4, _encode(calls))
+        cache.lookup('other', [['a', 'b']], 8, _encode(calls))
+
+        assert len(calls) == 3
+
+    def test_should_evict_least_recently_used(self):
+        cache = SubTokenCache('identity', max_size=2)
+        calls = []
+
+        cache.lookup('kind', ['a', 'b'], 8, _encode(calls))
+        cache.lookup('kind', ['a', 'c'], 8, _encode(calls))
+        cache.lookup('kind', ['a', 'b'], 8, _encode(calls))
+
+        assert calls == [['a', 'b'], ['c'], ['b']]
+        assert len(cache) == 2
+
+    def test_should_reject_non_positive_size(self):
+        with pytest.raises(ValueError):
+            SubTokenCache('identity', max_size=0)
+
+    def test_should_save_and_load_entries(self, tmp_path):
+        cache = SubTokenCache('identity')
+        cache.persist(str(tmp_path))
+        calls = []
+        cache.lookup('kind', ['a', 'bb'], 8, _encode(calls))
+        cache.save()
+        cache.save()
+
+        reloaded = SubTokenCache('identity')
+        reloaded.persist(str(tmp_path))
+        result = reloaded.lookup('kind', ['bb', 'a'], 8, _encode(calls))
+
+        assert calls == [['a', 'bb']]
+        assert [array.tolist() for array in result] == [[[2, 2], [0, 1]], [[1, 1], [0, 1]]]
+        assert len(list((tmp_path / 'identity').iterdir())) == 1
+
+    def test_should_share_cache_between_identical_tokenizers(self, tmp_path):
+        tokenizer = _tokenizer(tmp_path / 'a')
+
+        assert tokenizer_identity(tokenizer) == tokenizer_identity(_tokenizer(tmp_path / 'b'))
+        assert get_subtoken_cache(tokenizer) is get_subtoken_cache(_tokenizer(tmp_path / 'b'))
+
+        VOCAB.append('dog')
+        try:
+            assert tokenizer_identity(tokenizer) != tokenizer_identity(_tokenizer(tmp_path / 'c'))
+        finally:
+            VOCAB.pop()
+
+    def test_should_create_same_bert_input_as_tokenizer(self, tmp_path):
+        tokenizer = _tokenizer(tmp_path)
+        texts = ['the cat sat on the mats .', 'the dog', 'the cat sat on the mat . the cat sat on the mat .']
+        expected = tokenizer.batch_encode_plus(texts, add_special_tokens=True, truncation=True, max_length=10,
+                                               padding='max_length')
+
+        for _ in range(2):
+            ids, masks, segments = create_batch_input_bert(np.asarray(texts), maxlen=10,
+                                                           transformer_tokenizer=tokenizer)
+
+            assert ids == expected['input_ids']
+            assert masks == expected['token_type_ids']
+            assert segments == expected['attention_mask']
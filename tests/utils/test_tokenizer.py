@@ -1,4 +1,9 @@
-from delft.utilities.Tokenizer import tokenizeAndFilterSimple, tokenizeAndFilter
+import random
+
+from delft.utilities.Tokenizer import tokenizeAndFilterSimple, tokenizeAndFilter, tokenizeBatch, tokenizeBatchFlat, \
+    tokenizeBatchSimple, delimiters, blanks
+
+ALPHABET = sorted(set(delimiters)) + list('abcXYZ019') + ['é', '中', '🙂', '\u0301', '\r\n']
 
 
 class TestTokenizer:
@@ -41,3 +46,30 @@ class TestTokenizer:
         assert output[1] == [(1, 5), (6, 8), (9, 12), (13, 14), (15, 22), (22, 23), (24, 29), (29, 30), (30, 31),
                              (31, 32), (33, 37), (37, 38), (39, 40), (41, 42), (42, 48), (48, 49), (50, 54), (54, 55),
                              (55, 56)]
+
+    def test_tokenizer_batch(self):
+        texts = ['this is a test, but a stupid test!!', '', '\nyet \u2666 another']
+
+        documents = tokenizeBatch(texts)
+
+        assert len(documents) == 3
+        for text, document in zip(texts, documents):
+            assert document.text == text
+            assert (document.tokens, document.offsets) == tokenizeAndFilter(text)
+            assert document.features is None
+        assert len(documents[2]) == 3
+
+    def test_tokenizer_batch_as_single_texts(self):
+        assert set(blanks) <= set(delimiters)
+        generator = random.Random(42)
+        for _ in range(200):
+            texts = [''.join(generator.choice(ALPHABET) for _ in range(generator.randrange(0, 30)))
+                     for _ in range(generator.randrange(0, 8))]
+
+            batch = tokenizeBatchFlat(texts)
+
+            assert len(batch) == len(texts)
+            assert batch.lengths().tolist() == [len(tokenizeAndFilterSimple(text)) for text in texts]
+            assert list(zip(batch.token_lists(), batch.offset_lists())) == [tuple(tokenizeAndFilter(text))
+                                                                            for text in texts]
+            assert tokenizeBatchSimple(texts) == [tokenizeAndFilterSimple(text) for text in texts]